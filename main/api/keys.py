@@ -11,10 +11,10 @@ from flask_login import current_user  # fix(later): remove
 
 
 # internal imports
-from main.app import db
+from main.app import db, key_cache
 from main.users.models import Key, User
-from main.users.permissions import access_level, ACCESS_LEVEL_WRITE
-from main.users.auth import create_key, find_key
+from main.users.permissions import access_level, request_principal, ACCESS_LEVEL_WRITE
+from main.users.auth import create_key
 from main.resources.models import Resource
 
 
@@ -54,6 +54,7 @@ class KeyRecord(ApiResource):
             key.revocation_user_id = current_user.id
             key.revocation_timestamp = datetime.datetime.utcnow()
         db.session.commit()
+        key_cache.invalidate(key_id)
 
     # update a key
     def put(self, key_id):
@@ -100,8 +101,8 @@ class KeyList(ApiResource):
             organization_id = r.root().id
             if current_user.is_anonymous:
                 # handle special case of creating a key using a user-associated key (controllers aren't allowed to create keys)
-                key = find_key(request.authorization.password)
-                if key.access_as_user_id:
+                key = request_principal().key
+                if key and key.access_as_user_id:
                     creation_user_id = key.access_as_user_id
                 else:
                     creation_user_id = None
@@ -10,8 +10,7 @@ from flask_restful import Resource as ApiResource
 # internal imports
 from main.app import message_queue
 from main.resources.resource_util import find_resource
-from main.users.permissions import access_level, ACCESS_LEVEL_WRITE
-from main.users.auth import find_key
+from main.users.permissions import access_level, request_principal, ACCESS_LEVEL_WRITE
 
 
 class MessageList(ApiResource):
@@ -34,7 +33,7 @@ class MessageList(ApiResource):
             abort(403)
         if not request.authorization:
             abort(403)
-        key = find_key(request.authorization.password)
+        key = request_principal().key  # already looked up by access_level
         if not key:
             abort(403)
         message_type = request.values['type']
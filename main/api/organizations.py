@@ -12,7 +12,7 @@ from flask_login import current_user, login_required
 
 
 # internal imports
-from main.app import db
+from main.app import db, organization_name_cache
 from main.users.auth import make_code
 from main.resources.models import Resource
 from main.users.models import OrganizationUser, AccountRequest
@@ -76,6 +76,7 @@ class OrganizationUserRecord(ApiResource):
                 org_users = OrganizationUser.query.filter(OrganizationUser.organization_id == org_id, OrganizationUser.user_id == user_id)
                 org_users.delete()
                 db.session.commit()
+                organization_name_cache.remove(user_id)  # bulk delete doesn't trigger model events
             except NoResultFound:
                 abort(404)
         else:
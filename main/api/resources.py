@@ -1,29 +1,33 @@
+import sys
 import json
 import base64
 import hashlib  # fix(clean): remove?
 import zipfile
 import datetime
 from io import BytesIO
+from array import array
 
 
 # external imports
-from flask import request, abort, make_response
-from sqlalchemy import not_
+from flask import request, abort, make_response, Response, stream_with_context
+from sqlalchemy import not_, null
 from sqlalchemy.orm.exc import NoResultFound
 from flask_restful import Resource as ApiResource
 from flask_login import current_user
 
 
 # internal imports
-from main.app import db
+from main.app import db, latest_value_cache
 from main.users.models import User
-from main.users.permissions import access_level, ACCESS_LEVEL_READ, ACCESS_LEVEL_WRITE
-from main.util import parse_json_datetime
-from main.resources.models import Resource, ResourceRevision, ResourceView, ControllerStatus, Thumbnail
+from main.users.permissions import access_level, request_principal, ACCESS_LEVEL_READ, ACCESS_LEVEL_WRITE
+from main.util import parse_json_datetime, find_time_zone
+from main.resources.models import Resource, ResourceRevision, ResourceView, ControllerStatus, Thumbnail, SequenceRollup, SequenceChunk
 from main.resources.resource_util import find_resource, read_resource, add_resource_revision, _create_file, update_sequence_value, \
-    resource_type_number, _create_folders, create_sequence
+    update_sequence_values, resource_type_number, _create_folders, create_sequence, cached_sequence_value
+from main.resources.sequence_util import downsample, downsample_query, epoch_seconds, sequence_rollups, merge_buckets, bucket_summaries, \
+    timestamp_seconds, COMPRESSION_TYPES, bucket_values, numeric_values, retention_settings, retention_cutoffs, tiered_rollups, RETENTION_TIERS
+from main.resources.sequence_chunks import may_have_chunks, sequence_values, latest_sequence_values
 from main.resources.file_conversion import convert_csv_to_xls, convert_xls_to_csv, convert_new_lines, compute_thumbnail
-from main.users.auth import find_key  # fix(clean): remove?
 
 
 class ResourceRecord(ApiResource):
@@ -36,10 +40,7 @@ class ResourceRecord(ApiResource):
 
         # handle case of controller requesting about self
         if resource_path == '/self':
-            if request.authorization:
-                key = find_key(request.authorization.password)
-            else:
-                key = None
+            key = request_principal().key
             if key and key.access_as_controller_id:
                 try:
                     r = Resource.query.filter(Resource.id == key.access_as_controller_id).one()
@@ -83,7 +84,7 @@ class ResourceRecord(ApiResource):
                         type_number = None
                     name_filter = request.values.get('filter', None)
                     extended = request.values.get('extended', False)
-                    result = resource_list(r.id, recursive, type_number, name_filter, extended)
+                    result = resource_list(r, recursive, type_number, name_filter, extended)
 
             # if sequence, return value(s)
             # fix(later): merge with file case?
@@ -93,6 +94,18 @@ class ResourceRecord(ApiResource):
                 text = request.values.get('text', '')
                 download = request.values.get('download', False)
                 count = int(request.values.get('count', 1))
+                max_points = request.values.get('max_points', '')
+                resolution = request.values.get('resolution', '')
+                try:
+                    max_points = int(max_points) if max_points else None
+                    resolution = float(resolution) if resolution else None
+                except ValueError:
+                    abort(400, 'Invalid max_points or resolution.')
+                if (max_points is not None and max_points < 1) or (resolution is not None and resolution <= 0):
+                    abort(400, 'Invalid max_points or resolution.')
+                rollup = request.values.get('rollup', '')  # minute, hour, or day
+                if rollup and rollup not in SequenceRollup.RESOLUTIONS:
+                    abort(400, 'Invalid rollup.')
                 start_timestamp = request.values.get('start_timestamp', '')
                 end_timestamp = request.values.get('end_timestamp', '')
                 if start_timestamp:
@@ -107,12 +120,35 @@ class ResourceRecord(ApiResource):
                         abort(400, 'Invalid date/time.')
 
                 # if filters specified, assume we want a sequence of values
-                if text or start_timestamp or end_timestamp or count > 1:
+                if text or start_timestamp or end_timestamp or count > 1 or max_points or resolution or rollup:
 
                     # get summary of values
                     if int(request.values.get('summary', False)):
                         return sequence_value_summary(r.id)
 
+                    # use the stored rollups (rather than the raw values) if requested or if the buckets are whole minutes/hours/days
+                    rollup_resolution = SequenceRollup.RESOLUTIONS.get(rollup)
+                    if not rollup_resolution and resolution and not text and 'count' not in request.values:
+                        rollup_resolution = SequenceRollup.resolution_for(resolution)
+                    if rollup_resolution:
+                        return rolled_up_sequence_values(r, resource_path, rollup_resolution, resolution, start_timestamp, end_timestamp)
+
+                    # for sequences with tiered retention, summaries of time ranges older than the raw values are read from rollups
+                    system_attributes = json.loads(r.system_attributes)
+                    limit = count if 'count' in request.values else None  # if no count given, use all values in the time range
+                    retention = retention_settings(system_attributes)
+                    if retention and (max_points or resolution) and not text and not limit:
+                        raw_cutoff = retention_cutoffs(retention)['raw']
+                        if raw_cutoff and (not start_timestamp or start_timestamp < raw_cutoff):
+                            return tiered_sequence_values(r, resource_path, retention, start_timestamp, end_timestamp, max_points, resolution)
+
+                    # values of sequences with chunked storage are read from both chunks and revision records
+                    binary_type = request.accept_mimetypes.best_match(['application/json', 'application/octet-stream']) == 'application/octet-stream'
+                    binary = not download and (request.values.get('format') == 'binary' or binary_type)
+                    if may_have_chunks(system_attributes):
+                        return chunked_sequence_values(
+                            r, resource_path, text, start_timestamp, end_timestamp, count, limit, max_points, resolution, binary, download)
+
                     # get preliminary set of values
                     resource_revisions = ResourceRevision.query.filter(ResourceRevision.resource_id == r.id)
 
@@ -123,39 +159,48 @@ class ResourceRecord(ApiResource):
                         resource_revisions = resource_revisions.filter(ResourceRevision.timestamp >= start_timestamp)
                     if end_timestamp:
                         resource_revisions = resource_revisions.filter(ResourceRevision.timestamp <= end_timestamp)
-                    resource_revisions = resource_revisions.order_by('timestamp')
-                    if resource_revisions.count() > count:
-                        resource_revisions = resource_revisions[-count:]  # fix(later): is there a better/faster way to do this?
 
-                    # return data
+                    # if requested, reduce the values to a chart-sized set of buckets
+                    if max_points or resolution:
+                        return downsampled_sequence_values(r, resource_path, resource_revisions, limit, max_points, resolution)
+
+                    # if requested, return numeric values in binary form
+                    if binary:
+                        return binary_sequence_values(r, resource_revisions, count)
+
+                    # if requested, stream the values as a CSV file
                     if download:
-                        # timezone = r.root().system_attributes['timezone']  # fix(soon): use this instead of UTC
-                        lines = ['utc_timestamp,value\n']
-                        for rr in resource_revisions:
-                            lines.append('%s,%s\n' % (rr.timestamp.strftime('%Y-%m-%d %H:%M:%S.%f'), rr.data))
-                        result = make_response(''.join(lines))
-                        result.headers['Content-Type'] = 'application/octet-stream'
-                        result.headers['Content-Disposition'] = 'attachment; filename=' + r.name + '.csv'
-                        return result
-                    else:
-                        epoch = datetime.datetime.utcfromtimestamp(0)  # fix(clean): merge with similar code for sequence viewer
-                        # fix(clean): use some sort of unzip function
-                        timestamps = [(rr.timestamp.replace(tzinfo=None) - epoch).total_seconds() for rr in resource_revisions]
-                        values = [rr.data.decode() for rr in resource_revisions]
-                        units = json.loads(r.system_attributes).get('units', None)
-                        return {'name': r.name, 'path': resource_path, 'units': units, 'timestamps': timestamps, 'values': values}
+                        return sequence_csv_download(r, resource_revisions, limit, int(request.values.get('local_time', 0)))
+
+                    # get the last count values (newest first, using the resource ID/timestamp index) and then put them in ascending order
+                    resource_revisions = resource_revisions.order_by(ResourceRevision.timestamp.desc(), ResourceRevision.id.desc()).limit(count).all()
+                    resource_revisions.reverse()
+
+                    # return data
+                    epoch = datetime.datetime.utcfromtimestamp(0)  # fix(clean): merge with similar code for sequence viewer
+                    # fix(clean): use some sort of unzip function
+                    timestamps = [(rr.timestamp.replace(tzinfo=None) - epoch).total_seconds() for rr in resource_revisions]
+                    values = [rr.data.decode() for rr in resource_revisions]
+                    units = json.loads(r.system_attributes).get('units', None)
+                    return {'name': r.name, 'path': resource_path, 'units': units, 'timestamps': timestamps, 'values': values}
 
                 # if no filter assume just want current value
                 # fix(later): should instead provide all values and have a separate way to get more recent value?
                 else:
                     rev = request.values.get('rev')
+                    data_type = json.loads(r.system_attributes)['data_type']
+                    value = None
                     if rev:
                         rev = int(rev)  # fix(soon): safe int conversion
-                    value = read_resource(r, revision_id=rev)
+                    elif data_type != Resource.IMAGE_SEQUENCE:
+                        value = cached_sequence_value(r)  # the most recent value received, if this process has it
+                    if value is None:
+                        value = read_resource(r, revision_id=rev)
+                        if value is not None and not rev and data_type != Resource.IMAGE_SEQUENCE:
+                            latest_value_cache.set(r.id, r.modification_timestamp, value.decode())
                     if value is None:
                         value = ''  # if the sequence doesn't yet have any values, return an empty value (rather than a 400 or 404)
                     result = make_response(value)
-                    data_type = json.loads(r.system_attributes)['data_type']
                     if data_type == Resource.IMAGE_SEQUENCE:
                         result.headers['Content-Type'] = 'image/jpeg'
                     else:
@@ -185,6 +230,10 @@ class ResourceRecord(ApiResource):
             abort(403)
         if request.values.get('data_only', False):
             ResourceRevision.query.filter(ResourceRevision.resource_id == r.id).delete()
+            SequenceRollup.query.filter(SequenceRollup.resource_id == r.id).delete()
+            SequenceChunk.query.filter(SequenceChunk.resource_id == r.id).delete()
+            r.value_count = 0
+            latest_value_cache.remove(r.id)
             # fix(later): support delete_min_timestamp and delete_max_timestamp to delete subsets
         else:
             r.deleted = True
@@ -272,7 +321,8 @@ class ResourceRecord(ApiResource):
         if 'user_attributes' in args:
             r.user_attributes = args['user_attributes']
         if r.type == Resource.SEQUENCE:  # fix(soon): should use args['system_attributes'] instead of just args
-            if 'data_type' in args or 'decimal_places' in args or 'max_history' in args or 'min_storage_interval' in args or 'units' in args:
+            if 'data_type' in args or 'decimal_places' in args or 'max_history' in args or 'min_storage_interval' in args or 'units' in args \
+                    or 'compression' in args or 'storage' in args or 'retention' in args:
                 system_attributes = json.loads(r.system_attributes)
                 if 'data_type' in args:
                     system_attributes['data_type'] = args['data_type']
@@ -284,6 +334,12 @@ class ResourceRecord(ApiResource):
                     system_attributes['units'] = args['units']
                 if args.get('min_storage_interval', '') != '':
                     system_attributes['min_storage_interval'] = int(args['min_storage_interval'])  # fix(later): safe convert
+                if 'compression' in args:
+                    update_compression_settings(system_attributes, args)
+                if 'storage' in args:
+                    update_storage_setting(system_attributes, args['storage'])
+                if 'retention' in args:
+                    update_retention_settings(system_attributes, args['retention'])
                 r.system_attributes = json.dumps(system_attributes)
         elif r.type == Resource.REMOTE_FOLDER:
             # fix(soon): should use args['system_attributes'] instead of just args
@@ -368,8 +424,7 @@ class ResourceList(ApiResource):
                     abort(403)
             except NoResultFound:
                 abort(403)
-            _create_folders(path)
-            parent_resource = find_resource(path)
+            parent_resource = _create_folders(path)
             if not parent_resource:
                 abort(400)
 
@@ -469,6 +524,12 @@ class ResourceList(ApiResource):
                     min_storage_interval = 50  # default to 50 seconds for numeric and image sequences
             system_attributes['max_history'] = max_history
             system_attributes['min_storage_interval'] = min_storage_interval
+            if args.get('compression'):
+                update_compression_settings(system_attributes, args)
+            if args.get('storage'):
+                update_storage_setting(system_attributes, args['storage'])
+            if args.get('retention'):
+                update_retention_settings(system_attributes, args['retention'])
             r.system_attributes = json.dumps(system_attributes)
         elif resource_type == Resource.REMOTE_FOLDER:
             r.system_attributes = json.dumps({
@@ -552,8 +613,7 @@ class ResourceList(ApiResource):
 
                 # get current controller correction
                 # fix(later): support user updates as well?
-                auth = request.authorization
-                key = find_key(auth.password)  # key is provided as HTTP basic auth password
+                key = request_principal().key  # key is provided as HTTP basic auth password
                 if key and key.access_as_controller_id:
                     controller_id = key.access_as_controller_id
                     controller_status = ControllerStatus.query.filter(ControllerStatus.id == controller_id).one()
@@ -574,30 +634,29 @@ class ResourceList(ApiResource):
         else:
             timestamp = datetime.datetime.utcnow()
 
-        # for now, assume all sequences in same folder
-        items = list(values.items())
-        if items:
-            items = sorted(items)  # sort by keys so we can re-use folder lookup and permission check between items in same folder
-            folder_resource = None
-            folder_name = None
-            for (full_name, value) in items:
-                item_folder_name = full_name.rsplit('/', 1)[0]
-                if item_folder_name != folder_name:  # if this folder doesn't match the folder resource record we have
-                    folder_name = item_folder_name
-                    folder_resource = find_resource(folder_name)
-                    if folder_resource and access_level(folder_resource.query_permissions()) < ACCESS_LEVEL_WRITE:
-                        folder_resource = None  # don't have write access
-                if folder_resource:
-                    seq_name = full_name.rsplit('/', 1)[1]
-                    try:
-                        resource = (
-                            Resource.query
-                            .filter(Resource.parent_id == folder_resource.id, Resource.name == seq_name, not_(Resource.deleted))
-                            .one()
-                        )
-                        update_sequence_value(resource, full_name, timestamp, str(value), emit_message=True)  # fix(later): revisit emit_message
-                    except NoResultFound:
-                        pass
+        # find the folders (checking write access) and then find all of the sequences with a single query
+        folders = {}  # folder path -> folder resource
+        for full_name in values:
+            folder_name = full_name.rsplit('/', 1)[0]
+            if folder_name not in folders:
+                folder_resource = find_resource(folder_name) if folder_name.startswith('/') else None
+                if folder_resource and access_level(folder_resource.query_permissions()) < ACCESS_LEVEL_WRITE:
+                    folder_resource = None  # don't have write access
+                folders[folder_name] = folder_resource
+        folder_ids = [folder.id for folder in folders.values() if folder]
+        if folder_ids:
+            names = list({full_name.rsplit('/', 1)[-1] for full_name in values})
+            sequences = Resource.query.filter(
+                Resource.parent_id.in_(folder_ids), Resource.name.in_(names), Resource.type == Resource.SEQUENCE, not_(Resource.deleted))
+            sequences = {(sequence.parent_id, sequence.name): sequence for sequence in sequences}
+            updates = []
+            for (full_name, value) in sorted(values.items()):
+                (folder_name, name) = full_name.rsplit('/', 1)
+                folder_resource = folders[folder_name]
+                resource = sequences.get((folder_resource.id, name)) if folder_resource else None
+                if resource:
+                    updates.append((resource, full_name, str(value)))
+            update_sequence_values(updates, timestamp, emit_message=True)  # fix(later): revisit emit_message
             db.session.commit()
 
 
@@ -610,35 +669,312 @@ def update_system_attributes(resource, new_system_attribs, allowed_attribs):
     resource.system_attributes = json.dumps(system_attributes)
 
 
-def resource_list(parent_id, recursive, resource_type, name_filter, extended):
-    """Get a list of all resources contained with a folder (specified by parent_id)
-
-    name_filter may contain "*" wildcards.
+# update the compression settings (see compress_value) in the system attributes of a numeric sequence using request arguments:
+# compression (deadband, swinging_door, or none), compression_deviation, and compression_percent (1 if the deviation is a percentage)
+def update_compression_settings(system_attributes, args):
+    compression = args.get('compression', '')
+    if compression in ('', 'none'):
+        for name in ('compression', 'compression_deviation', 'compression_percent'):
+            system_attributes.pop(name, None)
+        return
+    if compression not in COMPRESSION_TYPES or str(system_attributes.get('data_type')) != str(Resource.NUMERIC_SEQUENCE):
+        abort(400, 'Invalid compression.')
+    try:
+        deviation = float(args.get('compression_deviation', 0))
+    except ValueError:
+        abort(400, 'Invalid compression deviation.')
+    if not deviation >= 0:
+        abort(400, 'Invalid compression deviation.')
+    system_attributes['compression'] = compression
+    system_attributes['compression_deviation'] = deviation
+    system_attributes['compression_percent'] = str(args.get('compression_percent', '')).lower() in ('1', 'true')
+
+
+# update the storage mode in the system attributes of a numeric sequence: chunked (values in closed time windows are packed into
+# sequence chunks by the sequence compactor worker) or rows (one revision record per value); values already in chunks stay there
+# (and are still read) if a sequence is switched back to rows
+def update_storage_setting(system_attributes, storage):
+    if storage not in ('chunked', 'rows') or (storage == 'chunked' and str(system_attributes.get('data_type')) != str(Resource.NUMERIC_SEQUENCE)):
+        abort(400, 'Invalid storage.')
+    system_attributes['storage'] = storage
+
+
+# update the retention tiers in the system attributes of a numeric sequence (see retention_settings); retention is a JSON object
+# mapping tier names (raw, minute, hour, day) to a number of days; tiers that aren't listed (or are null) are kept indefinitely;
+# an empty value (or none) keeps all of the sequence's history
+def update_retention_settings(system_attributes, retention):
+    if retention in ('', 'none'):
+        system_attributes.pop('retention', None)
+        return
+    try:
+        retention = json.loads(retention)
+    except ValueError:
+        abort(400, 'Invalid retention.')
+    if not isinstance(retention, dict) or str(system_attributes.get('data_type')) != str(Resource.NUMERIC_SEQUENCE):
+        abort(400, 'Invalid retention.')
+    if any(tier not in RETENTION_TIERS for tier in retention):
+        abort(400, 'Invalid retention tier.')
+    days = [retention[tier] for tier in RETENTION_TIERS if retention.get(tier) is not None]
+    if any(isinstance(value, bool) or not isinstance(value, (int, float)) or not value > 0 for value in days):
+        abort(400, 'Invalid retention days.')
+    if days != sorted(days):  # coarser tiers must be kept at least as long as finer ones so that there are no gaps in the history
+        abort(400, 'Invalid retention days.')
+    system_attributes['retention'] = {tier: retention[tier] for tier in RETENTION_TIERS if retention.get(tier) is not None}
+
+
+def resource_list(parent, recursive, resource_type, name_filter, extended):
+    """Get a list of all resources contained with a folder
+
+    name_filter may contain "*" wildcards. If recursive, the contents of sub-folders are included (depth-first, with a
+    path for each resource); this uses a fixed number of queries regardless of the size of the folder tree.
     """
-    children = Resource.query.filter(Resource.parent_id == parent_id, not_(Resource.deleted)).order_by('name')
+    if not recursive:
+        return [_resource_list_item(child, controller_status, extended)
+                for (child, controller_status) in _resource_list_query(Resource.parent_id == parent.id, resource_type, name_filter, extended)]
+
+    # get all folders in the sub-tree; compute their paths and the order in which we'll list their contents
+    # (skipping any folders inside deleted folders)
+    folders = (
+        Resource.query
+        .with_entities(Resource.id, Resource.parent_id, Resource.name)
+        .filter(parent.descendent_condition(), Resource.type >= 10, Resource.type < 20, not_(Resource.deleted))
+        .order_by('name')
+    )
+    child_folders = {}
+    for (folder_id, folder_parent_id, folder_name) in folders:
+        child_folders.setdefault(folder_parent_id, []).append((folder_id, folder_name))
+    folder_paths = {parent.id: parent.path()}
+    folder_ids = []
+    pending = [parent.id]
+    while pending:
+        folder_id = pending.pop()
+        folder_ids.append(folder_id)
+        for (child_id, child_name) in child_folders.get(folder_id, []):
+            folder_paths[child_id] = folder_paths[folder_id] + '/' + child_name
+        pending += reversed([child_id for (child_id, _) in child_folders.get(folder_id, [])])
+
+    # get the matching resources in the sub-tree and list them by folder
+    children_by_folder = {}
+    for (child, controller_status) in _resource_list_query(parent.descendent_condition(), resource_type, name_filter, extended):
+        children_by_folder.setdefault(child.parent_id, []).append((child, controller_status))
+    file_infos = []
+    for folder_id in folder_ids:
+        for (child, controller_status) in children_by_folder.get(folder_id, []):
+            file_info = _resource_list_item(child, controller_status, extended)
+            file_info['path'] = folder_paths[folder_id] + '/' + child.name
+            file_info['fullPath'] = file_info['path']  # fix(soon): remove this
+            file_infos.append(file_info)
+    return file_infos
+
+
+# get (resource, controller status) pairs for resources matching the given condition and resource_list filters;
+# controller status is only fetched if extended (otherwise it is None)
+def _resource_list_query(condition, resource_type, name_filter, extended):
+    if extended:
+        query = (
+            db.session.query(Resource, ControllerStatus)
+            .outerjoin(ControllerStatus, (ControllerStatus.id == Resource.id) & (Resource.type == Resource.CONTROLLER_FOLDER))
+        )
+    else:
+        query = db.session.query(Resource, null())
+    query = query.filter(condition, not_(Resource.deleted)).order_by(Resource.name)
     if resource_type:
-        children = children.filter(Resource.type == resource_type)
+        query = query.filter(Resource.type == resource_type)
     if name_filter:
         name_filter = name_filter.replace('*', '%')
-        children = children.filter(Resource.name.like(name_filter))
-    file_infos = []
-    for child in children:
-        file_info = child.as_dict(extended=extended)
-        if extended and child.type == Resource.CONTROLLER_FOLDER:
-            try:
-                controller_status = ControllerStatus.query.filter(ControllerStatus.id == child.id).one()
-                file_info.update(controller_status.as_dict(extended=True))
-            except NoResultFound:
-                pass
-        if recursive:
-            file_info['path'] = child.path()
-            file_info['fullPath'] = child.path()  # fix(soon): remove this
-        file_infos.append(file_info)
-    if recursive:
-        child_folders = Resource.query.filter(Resource.parent_id == parent_id, Resource.type >= 10, Resource.type < 20, not_(Resource.deleted))
-        for child_folder in child_folders:
-            file_infos += resource_list(child_folder.id, recursive, resource_type, name_filter, extended)
-    return file_infos
+        query = query.filter(Resource.name.like(name_filter))
+    return query
+
+
+# get a resource_list entry for a resource
+def _resource_list_item(resource, controller_status, extended):
+    file_info = resource.as_dict(extended=extended)
+    if controller_status:
+        file_info.update(controller_status.as_dict(extended=True))
+    return file_info
+
+
+# get the last count values of a numeric sequence as a binary response: an array of timestamps (seconds since the epoch)
+# followed by an array of values (of the same length), both as little-endian float64; revisions is a query of the sequence's
+# revisions (with any filters applied); values that aren't numbers are omitted
+def binary_sequence_values(resource, revisions, count):
+    check_numeric_sequence(resource)
+    revisions = (
+        revisions
+        .with_entities(epoch_seconds(ResourceRevision.timestamp), ResourceRevision.value)
+        .filter(ResourceRevision.value.isnot(None))
+        .order_by(ResourceRevision.timestamp.desc(), ResourceRevision.id.desc())
+        .limit(count)
+        .all()
+    )
+    revisions.reverse()
+    return binary_values_response([revision[0] for revision in revisions], [revision[1] for revision in revisions])
+
+
+# create a binary response (see binary_sequence_values) from lists of timestamps (seconds since the epoch) and numeric values
+def binary_values_response(timestamps, values):
+    timestamps = array('d', timestamps)
+    values = array('d', values)
+    if sys.byteorder == 'big':
+        timestamps.byteswap()
+        values.byteswap()
+    result = make_response(timestamps.tobytes() + values.tobytes())
+    result.headers['Content-Type'] = 'application/octet-stream'
+    return result
+
+
+CSV_DOWNLOAD_BATCH_SIZE = 1000  # number of rows to fetch from the database (and send to the client) at a time
+
+
+# stream the values of a sequence as a CSV file; revisions is a query of the sequence's revisions (with any filters applied);
+# if limit is given, only the last limit revisions are included; rows are read in batches from a server-side cursor (where
+# supported) so that large exports use bounded memory and start sending data right away; if local_time is set, timestamps
+# are written in the organization's time zone rather than UTC
+def sequence_csv_download(resource, revisions, limit, local_time):
+    if limit:
+        last_ids = revisions.with_entities(ResourceRevision.id).order_by(ResourceRevision.timestamp.desc(), ResourceRevision.id.desc()).limit(limit)
+        revisions = ResourceRevision.query.filter(ResourceRevision.id.in_(last_ids))
+    revisions = (
+        revisions
+        .with_entities(ResourceRevision.timestamp, ResourceRevision.data)
+        .order_by(ResourceRevision.timestamp, ResourceRevision.id)
+        .yield_per(CSV_DOWNLOAD_BATCH_SIZE)
+    )
+    rows = ((timestamp, data.decode() if data is not None else '') for (timestamp, data) in revisions)
+    return csv_download_response(resource, rows, local_time)
+
+
+# create a streaming CSV file response from an iterable of (timestamp, text) rows (see sequence_csv_download)
+def csv_download_response(resource, rows, local_time):
+    time_zone = None
+    if local_time:
+        system_attributes = json.loads(resource.root().system_attributes or '{}')
+        time_zone = find_time_zone(system_attributes.get('timezone', ''))
+        if not time_zone:
+            abort(400, 'Organization time zone not available.')
+
+    def generate():
+        yield 'local_timestamp,value\n' if time_zone else 'utc_timestamp,value\n'
+        lines = []
+        for (timestamp, text) in rows:
+            if time_zone:
+                timestamp = timestamp.replace(tzinfo=datetime.timezone.utc).astimezone(time_zone)
+            lines.append('%s,%s\n' % (timestamp.strftime('%Y-%m-%d %H:%M:%S.%f'), text))
+            if len(lines) >= CSV_DOWNLOAD_BATCH_SIZE:
+                yield ''.join(lines)
+                lines = []
+        if lines:
+            yield ''.join(lines)
+
+    result = Response(stream_with_context(generate()), mimetype='application/octet-stream')
+    result.headers['Content-Disposition'] = 'attachment; filename=' + resource.name + '.csv'
+    return result
+
+
+# get the values of a sequence with chunked storage (see sequence_values) in the same forms as the corresponding cases of
+# ResourceRecord.get; values are filtered by text (if given) and time range; count and limit are as in ResourceRecord.get
+def chunked_sequence_values(
+        resource, resource_path, text, start_timestamp, end_timestamp, count, limit, max_points, resolution, binary, download):
+    numeric_only = bool(max_points or resolution or binary)
+    if numeric_only:
+        check_numeric_sequence(resource)
+    if limit or not (max_points or resolution or download):
+        values = latest_sequence_values(resource.id, limit or count, start_timestamp, end_timestamp, numeric_only=numeric_only, text=text)
+    else:
+        values = (
+            item for item in sequence_values(resource.id, start_timestamp, end_timestamp)
+            if (item[1] is not None or not numeric_only) and (not text or text in item[2])
+        )
+    if download:
+        rows = ((timestamp, value_text) for (timestamp, _, value_text) in values)
+        return csv_download_response(resource, rows, int(request.values.get('local_time', 0)))
+    values = list(values)
+    timestamps = [timestamp_seconds(timestamp) for (timestamp, _, _) in values]
+    if max_points or resolution:
+        summaries = downsample(timestamps, [value for (_, value, _) in values], max_points=max_points, resolution=resolution)
+        return sequence_buckets_response(resource, resource_path, summaries)
+    if binary:
+        return binary_values_response(timestamps, [value for (_, value, _) in values])
+    units = json.loads(resource.system_attributes).get('units', None)
+    values = [value_text for (_, _, value_text) in values]
+    return {'name': resource.name, 'path': resource_path, 'units': units, 'timestamps': timestamps, 'values': values}
+
+
+# abort the request if the given resource isn't a numeric sequence
+def check_numeric_sequence(resource):
+    if json.loads(resource.system_attributes).get('data_type') != Resource.NUMERIC_SEQUENCE:
+        abort(400, 'Only supported for numeric sequences.')
+
+
+# get the values of a numeric sequence reduced to buckets (see downsample);
+# revisions is a query of the sequence's revisions (with any filters applied); if limit is given, only the last limit revisions are used
+def downsampled_sequence_values(resource, resource_path, revisions, limit, max_points, resolution):
+    check_numeric_sequence(resource)
+    revisions = revisions.with_entities(ResourceRevision.timestamp, ResourceRevision.value).filter(ResourceRevision.value.isnot(None))
+    if limit:
+        revisions = revisions.order_by(ResourceRevision.timestamp.desc(), ResourceRevision.id.desc()).limit(limit)
+    return sequence_buckets_response(resource, resource_path, downsample_query(revisions, max_points=max_points, resolution=resolution))
+
+
+# get the values of a numeric sequence summarized from its rollups with the given rollup resolution (in seconds);
+# if resolution is given, the rollups are combined into buckets of that length
+def rolled_up_sequence_values(resource, resource_path, rollup_resolution, resolution, start_timestamp, end_timestamp):
+    check_numeric_sequence(resource)
+    retention = retention_settings(json.loads(resource.system_attributes))
+    if retention:  # older parts of the range may only be available in coarser rollups
+        buckets = tiered_rollups(resource.id, retention, rollup_resolution, start_timestamp, end_timestamp)
+        buckets = merge_buckets(buckets, resolution or rollup_resolution)
+    else:
+        buckets = sequence_rollups(resource.id, rollup_resolution, start_timestamp, end_timestamp)
+        if resolution and resolution != rollup_resolution:
+            buckets = merge_buckets(buckets, resolution)
+    return sequence_buckets_response(resource, resource_path, bucket_summaries(buckets))
+
+
+# get the values of a numeric sequence with tiered retention reduced to buckets (see downsample); values before the sequence's raw
+# values have been removed are read from the finest retained rollups; if max_points is given, the bucket length is chosen so that
+# the time range is covered by about that many buckets
+def tiered_sequence_values(resource, resource_path, retention, start_timestamp, end_timestamp, max_points, resolution):
+    check_numeric_sequence(resource)
+    raw_cutoff = retention_cutoffs(retention)['raw']
+    rollup_end = raw_cutoff - datetime.timedelta(microseconds=1)
+    if end_timestamp and end_timestamp < rollup_end:
+        rollup_end = end_timestamp
+    buckets = tiered_rollups(resource.id, retention, SequenceRollup.RESOLUTIONS['minute'], start_timestamp, rollup_end)
+    (timestamps, values) = ([], [])
+    if not end_timestamp or end_timestamp >= raw_cutoff:
+        if may_have_chunks(json.loads(resource.system_attributes)):
+            revisions = ((timestamp, value) for (timestamp, value, _) in sequence_values(resource.id, raw_cutoff, end_timestamp) if value is not None)
+        else:
+            revisions = (
+                ResourceRevision.query
+                .with_entities(ResourceRevision.timestamp, ResourceRevision.value)
+                .filter(ResourceRevision.resource_id == resource.id, ResourceRevision.timestamp >= raw_cutoff, ResourceRevision.value.isnot(None))
+                .order_by(ResourceRevision.timestamp, ResourceRevision.id)
+            )
+            if end_timestamp:
+                revisions = revisions.filter(ResourceRevision.timestamp <= end_timestamp)
+        (timestamps, values) = numeric_values(revisions)
+    if not resolution:
+        first = timestamp_seconds(start_timestamp) if start_timestamp else (buckets[0][0] if buckets else timestamps[0] if timestamps else 0)
+        last = timestamp_seconds(end_timestamp) if end_timestamp else (timestamps[-1] if timestamps else buckets[-1][6] if buckets else 0)
+        resolution = (last - first) / max_points if last > first else 1.0
+    buckets = merge_buckets(buckets + bucket_values(timestamps, values, resolution), resolution)
+    return sequence_buckets_response(resource, resource_path, bucket_summaries(buckets))
+
+
+# create a response from a list of (start, count, min, max, mean) bucket summaries of a numeric sequence
+def sequence_buckets_response(resource, resource_path, summaries):
+    return {
+        'name': resource.name,
+        'path': resource_path,
+        'units': json.loads(resource.system_attributes).get('units', None),
+        'timestamps': [summary[0] for summary in summaries],
+        'values': [summary[4] for summary in summaries],  # mean of each bucket
+        'min_values': [summary[2] for summary in summaries],
+        'max_values': [summary[3] for summary in summaries],
+        'counts': [summary[1] for summary in summaries],
+    }
 
 
 # compute a summary of the previous values of a sequence
@@ -0,0 +1,92 @@
+# standard python imports
+import json
+import datetime
+
+
+# external imports
+from flask import request, abort
+from flask_restful import Resource as ApiResource
+
+
+# internal imports
+from main.util import parse_json_datetime
+from main.users.permissions import access_level, ACCESS_LEVEL_READ
+from main.resources.models import Resource
+from main.resources.resource_util import find_resource
+from main.resources.sequence_util import aligned_sequence_values, timestamp_seconds, ALIGN_METHODS
+from main.resources.sequence_chunks import may_have_chunks, aligned_chunked_values
+
+
+MAX_ALIGNED_POINTS = 10000  # maximum number of grid times per request
+MAX_ALIGNED_SEQUENCES = 100  # maximum number of sequences per request
+
+
+class AlignedSequenceList(ApiResource):
+
+    # get the values of a set of numeric sequences aligned on a common time grid; parameters:
+    #   paths: comma-separated list of sequence paths
+    #   start_timestamp, end_timestamp: time range (end defaults to now)
+    #   resolution (seconds) or max_points: spacing of the grid (defaults to 100 points)
+    #   method: last, mean, nearest, or interpolate (see aligned_sequence_values)
+    def get(self):
+        paths = [path.strip() for path in request.values.get('paths', '').split(',') if path.strip()]
+        if not paths or len(paths) > MAX_ALIGNED_SEQUENCES:
+            abort(400, 'Invalid paths.')
+        method = request.values.get('method', 'last')
+        if method not in ALIGN_METHODS:
+            abort(400, 'Invalid method.')
+        try:
+            start_timestamp = parse_json_datetime(request.values['start_timestamp'])
+            end_timestamp = request.values.get('end_timestamp', '')
+            end_timestamp = parse_json_datetime(end_timestamp) if end_timestamp else datetime.datetime.utcnow()
+        except (KeyError, ValueError, AssertionError):
+            abort(400, 'Invalid date/time.')
+        if end_timestamp < start_timestamp:
+            abort(400, 'Invalid date/time.')
+        try:
+            resolution = float(request.values.get('resolution', 0))
+            max_points = int(request.values.get('max_points', 100))
+        except ValueError:
+            abort(400, 'Invalid max_points or resolution.')
+        if resolution < 0 or max_points < 1:
+            abort(400, 'Invalid max_points or resolution.')
+
+        # build the time grid
+        start = timestamp_seconds(start_timestamp)
+        span = timestamp_seconds(end_timestamp) - start
+        if not resolution:
+            resolution = span / (max_points - 1) if max_points > 1 and span else 1.0
+        point_count = int(span // resolution) + 1
+        if point_count > MAX_ALIGNED_POINTS:
+            abort(400, 'Too many points requested.')
+        grid = [start + index * resolution for index in range(point_count)]
+
+        # look up the sequences and check permissions
+        sequences = []
+        for path in paths:
+            if not path.startswith('/'):
+                path = '/' + path
+            resource = find_resource(path)
+            if not resource or resource.type != Resource.SEQUENCE:
+                abort(404)
+            if access_level(resource.query_permissions()) < ACCESS_LEVEL_READ:
+                abort(403)
+            system_attributes = json.loads(resource.system_attributes)
+            if system_attributes.get('data_type') != Resource.NUMERIC_SEQUENCE:
+                abort(400, 'Only supported for numeric sequences.')
+            sequences.append((path, resource, system_attributes))
+
+        # read and align the values of all the sequences (sequences with chunked storage are read one at a time)
+        chunked_ids = {resource.id for (_, resource, system_attributes) in sequences if may_have_chunks(system_attributes)}
+        values = aligned_sequence_values(list({resource.id for (_, resource, _) in sequences} - chunked_ids), grid, resolution, method)
+        for resource_id in chunked_ids:
+            values[resource_id] = aligned_chunked_values(resource_id, grid, resolution, method)
+        return {
+            'timestamps': grid,
+            'resolution': resolution,
+            'method': method,
+            'sequences': [
+                {'path': path, 'name': resource.name, 'units': system_attributes.get('units', None), 'values': values[resource.id]}
+                for (path, resource, system_attributes) in sequences
+            ],
+        }
@@ -9,7 +9,7 @@ from flask_login import current_user, login_required
 
 
 # internal imports
-from main.app import db
+from main.app import db, path_cache, permission_cache
 from main.users.models import User
 from main.messages.models import Message
 from main.resources.models import Resource, ResourceRevision, Thumbnail
@@ -29,4 +29,6 @@ class SystemStats(ApiResource):
             'thumbnail_count': s.query(func.count(Thumbnail.id)).scalar(),
             'resource_revision_count': s.query(func.count(ResourceRevision.id)).scalar(),
             'message_count': s.query(func.count(Message.id)).scalar(),
+            'path_cache': path_cache.stats(),
+            'permission_cache': permission_cache.stats(),
         }
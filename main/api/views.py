@@ -20,6 +20,7 @@ from .keys import KeyRecord, KeyList
 from .organizations import OrganizationList, OrganizationUserRecord, OrganizationUserList
 from .messages import MessageList
 from .resources import ResourceRecord, ResourceList
+from .sequences import AlignedSequenceList
 from .pins import PinRecord, PinList
 from .system import SystemStats
 
@@ -34,6 +35,7 @@ api_.add_resource(OrganizationUserList, '/api/v1/organizations/<int:org_id>/user
 api_.add_resource(OrganizationUserRecord, '/api/v1/organizations/<int:org_id>/users/<int:user_id>')
 api_.add_resource(ResourceList, '/api/v1/resources')
 api_.add_resource(ResourceRecord, '/api/v1/resources/<path:resource_path>')
+api_.add_resource(AlignedSequenceList, '/api/v1/sequences/aligned')
 api_.add_resource(PinList, '/api/v1/pins')
 api_.add_resource(PinRecord, '/api/v1/pins/<int:pin>')
 api_.add_resource(SystemStats, '/api/v1/system/stats')
@@ -8,6 +8,9 @@ from .config import init_flask_config
 from .messages.socket_sender import SocketSender
 from .messages.message_queue_basic import MessageQueueBasic
 from .messages.message_sender import MessageSender
+from .resources.resource_cache import ResourceCache
+from .resources.latest_value_cache import LatestValueCache
+from .resources.latest_value_cache_memory import LatestValueCacheMemory
 from .util import prep_logging
 
 # Create and configure the application. Default config values may be overridden by a config file,
@@ -45,6 +48,40 @@ static_manager = {}
 # create a message queue that will be used to handle messages to/from clients
 message_queue = MessageQueueBasic()
 
+# create a cache of the most recent value of each sequence, filled in as values are received (used to read current values);
+# the memory backend only holds values received by this process (readers fall back to the database for newer values)
+latest_value_cache_name = app.config.get('LATEST_VALUE_CACHE')
+if latest_value_cache_name == 'memory':
+    latest_value_cache = LatestValueCacheMemory(app.config['LATEST_VALUE_CACHE_SIZE'])
+elif latest_value_cache_name:
+    (module_name, class_name) = latest_value_cache_name.rsplit('.', 1)
+    print('using latest value cache: %s' % latest_value_cache_name)
+    latest_value_cache = getattr(importlib.import_module(module_name), class_name)(app.config)
+else:
+    latest_value_cache = LatestValueCache()  # doesn't store anything
+
+# create a cache of resource IDs for recently used resource paths (used by find_resource)
+path_cache = ResourceCache(app.config['PATH_CACHE_SIZE'], app.config['PATH_CACHE_MAX_AGE'])
+
+# create a cache of the effective permissions of resources (used by Resource.query_permissions)
+permission_cache = ResourceCache(app.config['PERMISSION_CACHE_SIZE'], app.config['PERMISSION_CACHE_MAX_AGE'])
+
+# create a cache of the IDs of recently verified API keys (used by find_key); entries are indexed by key ID
+# (rather than resource ID) so that revoking a key can evict it
+key_cache = ResourceCache(app.config['KEY_CACHE_SIZE'], app.config['KEY_CACHE_MAX_AGE'])
+
+# create a cache of the organization names shown in each user's navigation menu (used by before_request in main/users/views.py);
+# entries are keyed by user ID and depend on the user's organization resources
+organization_name_cache = ResourceCache(app.config['ORGANIZATION_NAME_CACHE_SIZE'], app.config['ORGANIZATION_NAME_CACHE_MAX_AGE'])
+
+# create a cache of the compression state of recently updated numeric sequences (used by compress_sequence_value); entries are
+# keyed by resource ID and are only used if the sequence's last revision is the one recorded in the entry
+compression_cache = ResourceCache(app.config['COMPRESSION_CACHE_SIZE'])
+
+# create a cache of the compiled ingest settings of recently updated sequences (used by ingest_descriptor); entries are keyed by
+# resource ID and depend on the sequence and (for image sequences) its thumbnail sequence
+ingest_descriptor_cache = ResourceCache(app.config['INGEST_DESCRIPTOR_CACHE_SIZE'], app.config['INGEST_DESCRIPTOR_CACHE_MAX_AGE'])
+
 # prepare MQTT message sender
 if app.config['MQTT_HOST']:
     message_sender = MessageSender(app.config)
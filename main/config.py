@@ -12,6 +12,10 @@ def defaults():
     """
     return {
         'AUTOLOAD_EXTENSIONS': False,
+
+        # number of compressed numeric sequences whose current segment state is kept in memory
+        'COMPRESSION_CACHE_SIZE': 10000,
+
         'CSRF_ENABLED': True,
         'CSRF_SESSION_KEY': '[Random String Here]',
         'DATABASE_CONNECT_OPTIONS': {},
@@ -21,24 +25,67 @@ def defaults():
         'EXTENSIONS': [],
         'EXTRA_NAV_ITEMS': '',
         'FILE_SYSTEM_STORAGE_PATH': '',
+
+        # compiled ingest settings cache used by update_sequence_value; max age in seconds
+        'INGEST_DESCRIPTOR_CACHE_MAX_AGE': 300,
+        'INGEST_DESCRIPTOR_CACHE_SIZE': 10000,
+
+        # verified API key cache used by find_key; max age (in seconds) is how long a key is trusted before it is checked again
+        'KEY_CACHE_MAX_AGE': 600,
+        'KEY_CACHE_SIZE': 10000,
+
         'KEY_PREFIX': 'RHIZO',
+
+        # latest value cache backend: 'memory' (only sees values received by this process), '' (none), or a module.ClassName
+        'LATEST_VALUE_CACHE': 'memory',
+        'LATEST_VALUE_CACHE_SIZE': 10000,
+
         'MESSAGE_TOKEN_SALT': '[Random String Here]',
         'MESSAGING_LOG_PATH': '',
         'MQTT_HOST': '',
         'MQTT_PORT': 443,
         'MQTT_TLS': True,
+
+        # per-user organization name cache used by the navigation menu; max age in seconds
+        'ORGANIZATION_NAME_CACHE_MAX_AGE': 60,
+        'ORGANIZATION_NAME_CACHE_SIZE': 1000,
+
         'OUTGOING_EMAIL_ADDRESS': '',
         'OUTGOING_EMAIL_PASSWORD': '',
         'OUTGOING_EMAIL_PORT': 587,
         'OUTGOING_EMAIL_SERVER': '',
         'OUTGOING_EMAIL_USER_NAME': '',
+
+        # path -> resource ID cache used by find_resource; max age (in seconds) bounds how long other processes see stale paths
+        'PATH_CACHE_MAX_AGE': 300,
+        'PATH_CACHE_SIZE': 10000,
+
+        # effective permissions cache used by Resource.query_permissions; max age in seconds
+        'PERMISSION_CACHE_MAX_AGE': 60,
+        'PERMISSION_CACHE_SIZE': 10000,
+
         'PRODUCTION': False,
+
+        # On PostgreSQL, the resource_revisions table can be partitioned by timestamp (set REVISION_PARTITION_INTERVAL
+        # to 'day', 'week', or 'month' and run migrate_db). The revision partitioner worker keeps REVISION_PARTITIONS_AHEAD
+        # future partitions available and, if REVISION_RETENTION_DAYS is set, drops partitions older than that. Dropping only
+        # removes sequence revisions beyond each sequence's max_history and raw retention period (other revisions are kept).
+        # SQLite databases always use a single table.
+        'REVISION_PARTITION_INTERVAL': None,
+        'REVISION_PARTITIONS_AHEAD': 2,
+        'REVISION_RETENTION_DAYS': None,
+
         'RHIZO_SECRET_KEY': None,
         'S3_ACCESS_KEY': '',
         'S3_SECRET_KEY': '',
         'S3_STORAGE_BUCKET': '',
         'SALT': '[Random String Here]',
         'SECRET_KEY': '[Random String Here]',
+
+        # Numeric sequences with chunked storage have their values packed into one chunk per time window
+        # of this length (in seconds) by the sequence compactor worker once the window has closed.
+        'SEQUENCE_CHUNK_LENGTH': 3600,
+
         'SQLALCHEMY_DATABASE_URI': 'sqlite:///rhizo.db',
         'SQLALCHEMY_TRACK_MODIFICATIONS': False,
         'SSL': False,
@@ -40,10 +40,10 @@ class MessageSubscription(object):
             if VERBOSE:  # check verbosity level
                 print('subscribe folder IDs: %s' % self.folder_ids)
 
-    # returns true if a given message record matches this subscription
-    def matches(self, message):
+    # returns true if a given message record matches this subscription (using message_type in place of the record's type if given)
+    def matches(self, message, message_type=None):
         folder_matches = message.folder_id in self.folder_ids
-        type_matches = (self.message_type is None or self.message_type == message.type)
+        type_matches = (self.message_type is None or self.message_type == (message_type or message.type))
         if VERBOSE:  # check verbosity level
             print('        folderMatches: %d, typeMatches: %d' % (folder_matches, type_matches))
         return folder_matches and type_matches
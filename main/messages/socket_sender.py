@@ -62,20 +62,27 @@ class SocketSender(Thread):
                 if message.type == 'requestProcessStatus':
                     self.send_process_status()
 
-                # all other messages are passed to clients managed by this process
+                # all other messages are passed to clients managed by this process;
+                # a combined sequence update message (from a bulk update) is sent to clients as individual sequence update messages
                 else:
+                    parameters = json.loads(message.parameters)
+                    if message.type == 'sequence_updates':
+                        outgoing = [('sequence_update', update_parameters) for update_parameters in parameters.get('updates', [])]
+                    else:
+                        outgoing = [(message.type, parameters)]
                     for ws_conn in self.connections:
-                        if client_is_subscribed(message, ws_conn, False):
-                            message_struct = {
-                                'type': message.type,
-                                'timestamp': message.timestamp.isoformat() + 'Z',
-                                'parameters': json.loads(message.parameters)
-                            }
-                            Thread(target=self.send, daemon=True, args=[ws_conn, json.dumps(message_struct)]).start()
-                            if ws_conn.controller_id:
-                                logger.debug('sending message to controller; type: %s', message.type)
-                            else:
-                                logger.debug('sending message to browser; type: %s', message.type)
+                        for (message_type, message_parameters) in outgoing:
+                            if client_is_subscribed(message, ws_conn, False, message_type):
+                                message_struct = {
+                                    'type': message_type,
+                                    'timestamp': message.timestamp.isoformat() + 'Z',
+                                    'parameters': message_parameters
+                                }
+                                Thread(target=self.send, daemon=True, args=[ws_conn, json.dumps(message_struct)]).start()
+                                if ws_conn.controller_id:
+                                    logger.debug('sending message to controller; type: %s', message_type)
+                                else:
+                                    logger.debug('sending message to browser; type: %s', message_type)
 
     # send information about the current process as a message to the system folder
     # (in a multi-process environment, each process has an instance of this class)
@@ -105,16 +112,17 @@ class SocketSender(Thread):
         message_queue.add(system_folder_id, '/system', 'processStatus', parameters)
 
 
-# returns True if the given message should be sent to the given client (based on its current subscriptions)
+# returns True if the given message should be sent to the given client (based on its current subscriptions);
+# if message_type is given, it is used in place of the message record's type
 # fix(clean): move into wsConn?
-def client_is_subscribed(message, ws_conn, debug_mode):
+def client_is_subscribed(message, ws_conn, debug_mode, message_type=None):
     if message.sender_controller_id:
         if ws_conn.controller_id and message.sender_controller_id == ws_conn.controller_id:
             return False  # don't bounce messages back to controller sender
         if ws_conn.user_id and message.sender_user_id == ws_conn.user_id:
             return False  # don't bounce messages back to user sender (note this prevents sending message from one browser tab to another)
     for subscription in ws_conn.subscriptions:
-        if subscription.matches(message):
+        if subscription.matches(message, message_type):
             if debug_mode:
                 print('    client subscription matches; folders: %s, type: %s' % (subscription.folder_ids, subscription.message_type))
             return True
@@ -30,8 +30,9 @@ class FileSystemStorageManager():
         assert not data_path.startswith('/')
         return os.path.exists(self.storage_path + '/' + data_path)
 
-    # delete a file in bulk storage
+    # delete a file in bulk storage (if it exists)
     def delete(self, data_path):
         assert not data_path.startswith('/')
         path = self.storage_path + '/' + data_path
-        os.unlink(path)
+        if os.path.exists(path):
+            os.unlink(path)
@@ -0,0 +1,20 @@
+# The LatestValueCache class provides an interface to be implemented by classes that store the most recent value of each sequence,
+# so that current values can be read without going to the database; values are strings (image sequences aren't cached);
+# the backend is chosen by the LATEST_VALUE_CACHE setting; this base class doesn't store anything (used when the cache is disabled).
+class LatestValueCache(object):
+
+    # store the most recent value (and its timestamp) of a sequence
+    def set(self, resource_id, timestamp, value):
+        pass
+
+    # get the most recent (timestamp, value) of a sequence; returns None if not cached
+    def get(self, resource_id):
+        pass
+
+    # remove the value of a sequence (e.g. when its history is deleted)
+    def remove(self, resource_id):
+        pass
+
+    # remove all values
+    def clear(self):
+        pass
@@ -0,0 +1,31 @@
+from .resource_cache import ResourceCache
+from .latest_value_cache import LatestValueCache
+
+
+# A latest value cache held in the memory of this process; it only covers values received by this process (e.g. MQTT values
+# received by the worker aren't seen by the web server processes), so readers check a cached value against the sequence's
+# modification timestamp and fall back to the database (see cached_sequence_value).
+class LatestValueCacheMemory(LatestValueCache):
+
+    def __init__(self, max_size=10000):
+        self._cache = ResourceCache(max_size)
+
+    # store the most recent value (and its timestamp) of a sequence
+    def set(self, resource_id, timestamp, value):
+        self._cache.set(resource_id, (timestamp, value), [resource_id])
+
+    # get the most recent (timestamp, value) of a sequence; returns None if not cached
+    def get(self, resource_id):
+        return self._cache.get(resource_id)
+
+    # remove the value of a sequence
+    def remove(self, resource_id):
+        self._cache.remove(resource_id)
+
+    # remove all values
+    def clear(self):
+        self._cache.clear()
+
+    # get hit/miss counts and other information about the cache in a json-ready dictionary
+    def stats(self):
+        return self._cache.stats()
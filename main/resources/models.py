@@ -1,6 +1,7 @@
 import json
-from sqlalchemy import not_
-from main.app import db
+from sqlalchemy import not_, event, inspect, func, literal
+from sqlalchemy.orm.attributes import set_committed_value
+from main.app import db, path_cache, permission_cache, organization_name_cache, compression_cache, ingest_descriptor_cache
 
 
 # The Version table stores current database version information
@@ -31,11 +32,20 @@ class Resource(db.Model):
         db.String, nullable=False, default='{}', comment='JSON dictionary; additional attributes of the resource (system-defined)')
     user_attributes = db.Column(db.String, comment='JSON dictionary; additional attributes of the resource (user-defined)')
     deleted = db.Column(db.Boolean, nullable=False, default=False)
+    ancestry = db.Column(
+        db.String, comment='IDs from the root to this resource (e.g. /1/23/456/); maintained automatically; NULL -> not yet migrated')
+    value_count = db.Column(
+        db.Integer, comment='number of stored values of a sequence (in revisions and chunks); maintained automatically; NULL -> unknown')
 
     # fix(soon): remove after migrate
     hash = db.Column(db.String(50))
     size = db.Column(db.BigInteger)
 
+    # the ancestry index is used for prefix (LIKE 'x%') queries, which require text_pattern_ops in postgres
+    __table_args__ = (
+        db.Index('ix_resources_ancestry', 'ancestry', postgresql_ops={'ancestry': 'text_pattern_ops'}),
+    )
+
     # resource types
     BASIC_FOLDER = 10
     ORGANIZATION_FOLDER = 11
@@ -84,14 +94,30 @@ class Resource(db.Model):
     # get the path of the resource (including it's own name)
     # includes leading slash
     def path(self):
-        if self.parent:
-            path = self.parent.path() + '/' + self.name
-        else:
-            path = '/' + self.name
-        return path
+        return ''.join('/' + r.name for r in self.ancestors() + [self])
+
+    # get the IDs of the resources above this one (starting with the root) from the materialized ancestry;
+    # returns None if the ancestry hasn't been computed (see migrate_db)
+    def ancestor_ids(self):
+        if not self.ancestry:
+            return None
+        return [int(resource_id) for resource_id in self.ancestry.strip('/').split('/')[:-1]]
+
+    # get a list of the resources above this one (starting with the root); uses a single query if ancestry is available
+    def ancestors(self):
+        ancestor_ids = self.ancestor_ids()
+        if ancestor_ids is None:
+            return self.parent.ancestors() + [self.parent] if self.parent else []
+        if not ancestor_ids:
+            return []
+        resources = {r.id: r for r in Resource.query.filter(Resource.id.in_(ancestor_ids))}
+        return [resources[resource_id] for resource_id in ancestor_ids if resource_id in resources]
 
     # returns True if this resource is a child/grandchild/etc. of the specified resource
     def is_descendent_of(self, resource_id):
+        ancestor_ids = self.ancestor_ids()
+        if ancestor_ids is not None:
+            return resource_id in ancestor_ids
         if not self.parent_id:
             return False
         elif self.parent_id == resource_id:
@@ -102,38 +128,72 @@ class Resource(db.Model):
     # get a list of folders contained within this folder (recursively)
     # fix(clean): maybe this is too specialized; move elsewhere?
     def descendent_folder_ids(self):
+        if not self.ancestry:
+            ids = []
+            children = Resource.query.filter(Resource.parent_id == self.id, not_(Resource.deleted))
+            for child in children:
+                if child.type >= 10 and child.type < 20:
+                    ids.append(child.id)
+                    ids += child.descendent_folder_ids()
+            return ids
+
+        # get all folders in the subtree with a single query, then keep the ones that aren't inside a deleted folder
+        folders = (
+            Resource.query
+            .with_entities(Resource.id, Resource.parent_id)
+            .filter(Resource.ancestry.like(self.ancestry + '%'), Resource.type >= 10, Resource.type < 20, not_(Resource.deleted))
+        )
+        child_ids = {}
+        for (folder_id, parent_id) in folders:
+            child_ids.setdefault(parent_id, []).append(folder_id)
         ids = []
-        children = Resource.query.filter(Resource.parent_id == self.id, not_(Resource.deleted))
-        for child in children:
-            if child.type >= 10 and child.type < 20:
-                ids.append(child.id)
-                ids += child.descendent_folder_ids()
+        pending = list(child_ids.get(self.id, []))
+        while pending:
+            folder_id = pending.pop()
+            ids.append(folder_id)
+            pending += child_ids.get(folder_id, [])
         return ids
 
+    # get a query condition that selects the resources contained within this folder (recursively);
+    # uses the materialized ancestry if available
+    def descendent_condition(self):
+        if self.ancestry:
+            return Resource.ancestry.like(self.ancestry + '_%')
+        return Resource.parent_id.in_([self.id] + self.descendent_folder_ids())
+
     # the root of a hierachy of resources; this will generally be an organization (or system folder such as 'doc' or 'system')
     def root(self):
-        if self.parent:
-            return self.parent.root()
-        else:
-            return self
+        ancestor_ids = self.ancestor_ids()
+        if ancestor_ids is None:
+            return self.parent.root() if self.parent else self
+        return Resource.query.get(ancestor_ids[0]) if ancestor_ids else self
 
-    # get a list of permission applied to this resource (including inherited from parents)
+    # get a list of permission applied to this resource (including inherited from parents);
+    # results are cached until this resource or one of its ancestors has its permissions changed or is moved
     def query_permissions(self):
-        permissions = json.loads(self.permissions) if self.permissions else None
-        if self.parent:
-            parent_permissions = self.parent.query_permissions()
-
-            # if we have permissions at this level, we need to merge in the parent permissions
-            if self.permissions:
-                permission_dict = {(permission_type, principal_id): level for (permission_type, principal_id, level) in self.permissions}
-                for permission_record in parent_permissions:
-                    (permission_type, principal_id, level) = permission_record
-                    if not (permission_type, principal_id) in permission_dict:
-                        permissions.append((permission_type, principal_id, level))
-
+        permissions = permission_cache.get(self.id)
+        if permissions is None:
+            ancestors = self.ancestors()
+            permissions = self._merge_permissions(ancestors + [self])
+            permission_cache.set(self.id, permissions, [r.id for r in ancestors] + [self.id])
+        return list(permissions) if permissions is not None else None
+
+    # compute the effective permissions of the last of the given resources (which should start with the root)
+    @staticmethod
+    def _merge_permissions(resources):
+        permissions = None
+        for resource in resources:
+
+            # if we have permissions at this level, we need to merge in the parent permissions;
             # otherwise, just use the parent permissions (the common case)
-            else:
-                permissions = parent_permissions
+            if resource.permissions:
+                resource_permissions = json.loads(resource.permissions)
+                if permissions:
+                    permission_keys = {(permission_type, principal_id) for (permission_type, principal_id, level) in resource_permissions}
+                    for (permission_type, principal_id, level) in permissions:
+                        if not (permission_type, principal_id) in permission_keys:
+                            resource_permissions.append((permission_type, principal_id, level))
+                permissions = resource_permissions
         return permissions
 
     # get the path of the resource in the bulk storage system
@@ -141,8 +201,75 @@ class Resource(db.Model):
         org_id = self.organization_id
         if not org_id:  # fix(clean): remove this
             org_id = self.root().id
-        id_str = '%09d' % int(self.id)
-        return '%d/%s/%s/%s/%d_%d' % (org_id, id_str[-9:-6], id_str[-6:-3], id_str[-3:], int(self.id), revision_id)
+        return revision_storage_path(org_id, self.id, revision_id)
+
+
+# get the bulk storage path of a resource revision (see Resource.storage_path)
+def revision_storage_path(org_id, resource_id, revision_id):
+    id_str = '%09d' % int(resource_id)
+    return '%d/%s/%s/%s/%d_%d' % (org_id, id_str[-9:-6], id_str[-6:-3], id_str[-3:], int(resource_id), revision_id)
+
+
+# add to the stored value count of a sequence (see Resource.value_count) without loading its record (a NULL count stays NULL);
+# this doesn't commit the session
+def adjust_value_count(resource_id, change):
+    if change:
+        Resource.query.filter(Resource.id == resource_id).update({'value_count': Resource.value_count + change}, synchronize_session=False)
+
+
+# get the materialized ancestry of a resource from the database (within a flush)
+def _stored_ancestry(connection, resource_id):
+    resources = Resource.__table__
+    row = connection.execute(resources.select().where(resources.c.id == resource_id)).first()
+    return row.ancestry if row else None
+
+
+# compute the ancestry of a newly created resource
+@event.listens_for(Resource, 'after_insert')
+def resource_inserted(mapper, connection, resource):  # pylint: disable=unused-argument
+    if resource.parent_id:
+        parent_ancestry = _stored_ancestry(connection, resource.parent_id)
+        ancestry = parent_ancestry + '%d/' % resource.id if parent_ancestry else None
+    else:
+        ancestry = '/%d/' % resource.id
+    if ancestry:
+        resources = Resource.__table__
+        connection.execute(resources.update().where(resources.c.id == resource.id).values(ancestry=ancestry))
+    set_committed_value(resource, 'ancestry', ancestry)
+
+
+# update the ancestry of a resource (and everything below it) when it is moved;
+# invalidate cached resource paths and permissions affected by the change
+@event.listens_for(Resource, 'after_update')
+def resource_updated(mapper, connection, resource):  # pylint: disable=unused-argument
+    state = inspect(resource)
+    if state.attrs.parent_id.history.has_changes() or state.attrs.parent.history.has_changes():
+        old_ancestry = _stored_ancestry(connection, resource.id)
+        if old_ancestry:
+            parent_ancestry = _stored_ancestry(connection, resource.parent_id) if resource.parent_id else '/'
+            new_ancestry = parent_ancestry + '%d/' % resource.id if parent_ancestry else None
+            resources = Resource.__table__
+            if new_ancestry:
+                new_value = literal(new_ancestry) + func.substr(resources.c.ancestry, len(old_ancestry) + 1)
+            else:
+                new_value = None  # new parent hasn't been migrated, so neither is this subtree
+            connection.execute(resources.update().where(resources.c.ancestry.like(old_ancestry + '%')).values(ancestry=new_value))
+
+            # update any affected resources that are already loaded
+            for obj in list(state.session.identity_map.values()):
+                if isinstance(obj, Resource) and (obj.__dict__.get('ancestry') or '').startswith(old_ancestry):
+                    obj_ancestry = new_ancestry + obj.ancestry[len(old_ancestry):] if new_ancestry else None
+                    set_committed_value(obj, 'ancestry', obj_ancestry)
+    if any(state.attrs[name].history.has_changes() for name in ('name', 'parent_id', 'parent', 'deleted')):
+        path_cache.invalidate(resource.id)
+    if any(state.attrs[name].history.has_changes() for name in ('permissions', 'parent_id', 'parent')):
+        permission_cache.invalidate(resource.id)
+    if any(state.attrs[name].history.has_changes() for name in ('name', 'system_attributes')):
+        organization_name_cache.invalidate(resource.id)
+    if state.attrs.system_attributes.history.has_changes():
+        compression_cache.invalidate(resource.id)  # the compression settings may have changed
+    if any(state.attrs[name].history.has_changes() for name in ('system_attributes', 'deleted')):
+        ingest_descriptor_cache.invalidate(resource.id)  # also invalidates the descriptor of an image sequence if its thumbnail is deleted
 
 
 # The ResourceRevision model holds a revision history or time series history of a resource.
@@ -152,6 +279,56 @@ class ResourceRevision(db.Model):
     resource_id = db.Column(db.ForeignKey('resources.id'), nullable=False, index=True)
     timestamp = db.Column(db.DateTime, nullable=False, index=True)
     data = db.Column(db.LargeBinary, nullable=True)
+    value = db.Column(db.Float, nullable=True, comment='numeric value (for numeric sequences); used for aggregation')
+
+    # used to get the most recent values of a sequence or values within a time range
+    __table_args__ = (db.Index('ix_resource_revisions_resource_id_timestamp', 'resource_id', 'timestamp'),)
+
+
+# The SequenceRollup model holds summaries of the stored values of a numeric sequence over fixed time buckets
+# (e.g. one record per hour); these are updated as values are stored and used for long-range queries; values
+# replaced by compression aren't included, so the rollups match those rebuilt from the stored values.
+class SequenceRollup(db.Model):
+    __tablename__ = 'sequence_rollups'
+    id = db.Column(db.Integer, primary_key=True)
+    resource_id = db.Column(db.ForeignKey('resources.id'), nullable=False)
+    resolution = db.Column(db.Integer, nullable=False, comment='bucket length in seconds')
+    timestamp = db.Column(db.DateTime, nullable=False, comment='start of bucket')
+    count = db.Column(db.Integer, nullable=False)
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    sum_value = db.Column(db.Float, nullable=False)
+    last_value = db.Column(db.Float, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (db.Index('ix_sequence_rollups_resource_id_resolution_timestamp', 'resource_id', 'resolution', 'timestamp', unique=True),)
+
+    # rollup resolutions by name
+    RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+    # get the longest rollup resolution that evenly divides the given bucket length (in seconds); returns None if none does
+    @staticmethod
+    def resolution_for(bucket_length):
+        for resolution in sorted(SequenceRollup.RESOLUTIONS.values(), reverse=True):
+            if bucket_length >= resolution and bucket_length % resolution == 0:
+                return resolution
+        return None
+
+
+# The SequenceChunk model holds the values of a numeric sequence for a closed time window, packed into a compressed block
+# (see main/resources/sequence_chunks.py); used for sequences with chunked storage in place of individual revision records.
+class SequenceChunk(db.Model):
+    __tablename__ = 'sequence_chunks'
+    id = db.Column(db.Integer, primary_key=True)
+    resource_id = db.Column(db.ForeignKey('resources.id'), nullable=False)
+    start_timestamp = db.Column(db.DateTime, nullable=False, comment='start of time window')
+    end_timestamp = db.Column(db.DateTime, nullable=False, comment='end of time window (exclusive)')
+    first_timestamp = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False, comment='delta-of-delta encoded timestamps and XOR encoded values')
+
+    __table_args__ = (db.Index('ix_sequence_chunks_resource_id_start_timestamp', 'resource_id', 'start_timestamp', unique=True),)
 
 
 # The ResourceView model holds per-used preferences for viewing a resource (e.g. folder sorting).
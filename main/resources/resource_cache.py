@@ -0,0 +1,85 @@
+# standard python imports
+import time
+import threading
+from collections import OrderedDict
+
+
+# The ResourceCache class is a bounded, thread-safe LRU cache for values derived from resource records.
+# Each entry records the IDs of the resources it depends on (e.g. the folders along a path), so that
+# a change to any of those resources can invalidate all of the entries derived from it.
+class ResourceCache(object):
+
+    # create a cache holding at most max_size entries; if max_age (in seconds) is given, entries expire after that long
+    # (this bounds how long another process can see stale data, since invalidation is only done within this process)
+    def __init__(self, max_size=10000, max_age=None):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hit_count = 0
+        self.miss_count = 0
+        self._entries = OrderedDict()  # key -> (value, resource IDs, time stored); ordered from least to most recently used
+        self._keys_by_resource_id = {}  # reverse index: resource ID -> set of keys of entries that depend on that resource
+        self._lock = threading.Lock()
+
+    # get a value from the cache; returns None if not found (or expired)
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and self.max_age and time.time() - entry[2] > self.max_age:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.miss_count += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hit_count += 1
+            return entry[0]
+
+    # add a value to the cache; resource_ids should list the resources from which the value was derived
+    def set(self, key, value, resource_ids):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, tuple(resource_ids), time.time())
+            for resource_id in resource_ids:
+                self._keys_by_resource_id.setdefault(resource_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    # remove a single entry from the cache (if present)
+    def remove(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    # remove all entries that depend on the given resource
+    def invalidate(self, resource_id):
+        with self._lock:
+            for key in list(self._keys_by_resource_id.get(resource_id, ())):
+                self._remove(key)
+
+    # remove all entries
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_resource_id.clear()
+
+    # get hit/miss counts and other information about the cache in a json-ready dictionary
+    def stats(self):
+        lookup_count = self.hit_count + self.miss_count
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hit_count': self.hit_count,
+            'miss_count': self.miss_count,
+            'hit_rate': float(self.hit_count) / lookup_count if lookup_count else 0.0,
+        }
+
+    # remove an entry and its reverse index records; caller must hold the lock
+    def _remove(self, key):
+        (_, resource_ids, _) = self._entries.pop(key)
+        for resource_id in resource_ids:
+            keys = self._keys_by_resource_id.get(resource_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_resource_id[resource_id]
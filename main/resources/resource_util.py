@@ -8,14 +8,17 @@ import logging
 
 
 # external imports
-from sqlalchemy import not_
-from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
+from sqlalchemy import not_, literal
+from sqlalchemy.orm.exc import NoResultFound
 
 
 # internal imports
-from main.app import db, message_queue, storage_manager
-from main.resources.models import Resource, ResourceRevision, Thumbnail
+from main.app import db, message_queue, storage_manager, path_cache, compression_cache, ingest_descriptor_cache, latest_value_cache
+from main.resources.models import Resource, ResourceRevision, Thumbnail, revision_storage_path, adjust_value_count
 from main.resources.file_conversion import compute_thumbnail
+from main.resources.sequence_util import numeric_value, timestamp_seconds, update_sequence_rollups, update_sequence_rollups_bulk, \
+    compression_settings, compress_value, seconds_timestamp
+from main.resources.sequence_chunks import may_have_chunks, update_replaced_rollups
 from main.users.permissions import ACCESS_LEVEL_WRITE, ACCESS_TYPE_ORG_USERS, ACCESS_TYPE_ORG_CONTROLLERS
 
 
@@ -40,25 +43,21 @@ def resource_type_number(type_name):
 # fix(soon): remove this
 def _create_folders(path):
     parts = path.strip('/').split('/')
-    parent = None
-    for part in parts:
-        try:
-            if parent:
-                resource = Resource.query.filter(Resource.parent_id == parent.id, Resource.name == part, not_(Resource.deleted)).one()
-            else:
-                resource = Resource.query.filter(Resource.parent_id.is_(None), Resource.name == part, not_(Resource.deleted)).one()
-        except NoResultFound:
-            resource = Resource()
-            resource.parent_id = parent.id
-            resource.organization_id = parent.organization_id
-            resource.name = part
-            resource.type = Resource.BASIC_FOLDER
-            resource.creation_timestamp = datetime.datetime.utcnow()
-            resource.modification_timestamp = resource.creation_timestamp
-            db.session.add(resource)
-            db.session.commit()
-        except MultipleResultsFound:
-            print('create_folders: duplicate folder at %s in %s' % (part, path))
+    chain = find_resource_chain(path)
+    if chain is None:
+        print('create_folders: duplicate folder in %s' % path)
+        return None
+    parent = chain[-1] if chain else None
+    for part in parts[len(chain):]:
+        resource = Resource()
+        resource.parent_id = parent.id
+        resource.organization_id = parent.organization_id
+        resource.name = part
+        resource.type = Resource.BASIC_FOLDER
+        resource.creation_timestamp = datetime.datetime.utcnow()
+        resource.modification_timestamp = resource.creation_timestamp
+        db.session.add(resource)
+        db.session.commit()
         parent = resource
     return parent
 
@@ -129,22 +128,60 @@ def find_resource(file_name):
     if not file_name.startswith('/'):
         logging.warning('find_resource called with %s; should be called with a path starting with a slash', file_name)
         assert False
-    file_name = file_name.strip('/')  # at some point can just strip off first character (since we'll assume there's exactly one leading slash)
-    parts = file_name.split('/')
-    parent = None
-    for part in parts:
-        try:
-            if parent:
-                resource = Resource.query.filter(Resource.parent_id == parent.id, Resource.name == part, not_(Resource.deleted)).one()
-            else:
-                resource = Resource.query.filter(Resource.parent_id.is_(None), Resource.name == part, not_(Resource.deleted)).one()
-        except NoResultFound:
+    parts = file_name.strip('/').split('/')
+    path = '/' + '/'.join(parts)
+
+    # check the path cache; make sure the resource hasn't been renamed or deleted (e.g. by another process)
+    resource_id = path_cache.get(path)
+    if resource_id:
+        resource = Resource.query.get(resource_id)
+        if resource and resource.name == parts[-1] and not resource.deleted:
+            return resource
+        path_cache.remove(path)
+
+    # look up the path in the database
+    chain = find_resource_chain(path)
+    if chain is None:
+        print('find_resource/MultipleResultsFound: %s' % file_name)
+        return None
+    if len(chain) < len(parts):
+        return None
+    path_cache.set(path, chain[-1].id, [r.id for r in chain])
+    return chain[-1]
+
+
+# find the (non-deleted) resources along a path using a single recursive query;
+# returns a list containing the resource for each leading part of the path that exists (starting with the root),
+# so the list is shorter than the path if some part of the path doesn't exist;
+# returns None if any part of the path matches more than one resource
+def find_resource_chain(path):
+    parts = path.strip('/').split('/')  # at some point can just strip off first character (since we'll assume there's exactly one leading slash)
+
+    # a table of (depth, name) pairs for the parts of the path
+    part_queries = [db.session.query(literal(depth).label('depth'), literal(part).label('name')) for (depth, part) in enumerate(parts)]
+    path_parts = part_queries[0].union_all(*part_queries[1:]).cte('path_parts')
+
+    # start with the root resource and repeatedly join the child matching the next part of the path
+    chain = (
+        db.session.query(Resource.id.label('id'), literal(0).label('depth'))
+        .filter(Resource.parent_id.is_(None), Resource.name == parts[0], not_(Resource.deleted))
+        .cte('resource_chain', recursive=True)
+    )
+    chain = chain.union_all(
+        db.session.query(Resource.id, path_parts.c.depth)
+        .filter(
+            Resource.parent_id == chain.c.id, path_parts.c.depth == chain.c.depth + 1,
+            Resource.name == path_parts.c.name, not_(Resource.deleted))
+    )
+    rows = db.session.query(Resource, chain.c.depth).join(chain, chain.c.id == Resource.id).order_by(chain.c.depth).all()
+
+    # make sure we have exactly one resource per depth
+    resources = []
+    for (resource, depth) in rows:
+        if depth < len(resources):
             return None
-        except MultipleResultsFound:
-            print('find_resource/MultipleResultsFound: %s' % file_name)
-            return None
-        parent = resource
-    return parent
+        resources.append(resource)
+    return resources
 
 
 # split a camel case string into a space-separated string
@@ -172,25 +209,59 @@ def mime_type_from_ext(file_name):
     return mime_type
 
 
+THUMBNAIL_WIDTH = 240  # maximum width of the thumbnails stored for image sequences
+THUMBNAIL_SEQUENCE_NAME = 'thumbnail-%d-x' % THUMBNAIL_WIDTH
+
+
+# The IngestDescriptor class holds the settings needed to store the values of a sequence, compiled from its system attributes
+# (so that storing a value doesn't require parsing them); see ingest_descriptor.
+class IngestDescriptor(object):
+
+    # compile the settings of a sequence; thumbnail_id is the ID of the thumbnail sequence of an image sequence (if it exists yet)
+    def __init__(self, system_attributes, thumbnail_id=None):
+        self.data_type = system_attributes.get('data_type')
+        min_storage_interval = system_attributes.get('min_storage_interval')
+        if min_storage_interval is None:
+            min_storage_interval = 0 if self.data_type == Resource.TEXT_SEQUENCE else 50
+        self.min_storage_interval = datetime.timedelta(seconds=min_storage_interval)
+        self.units = system_attributes.get('units')
+        self.compression = compression_settings(system_attributes) if self.data_type == Resource.NUMERIC_SEQUENCE else None
+        self.may_have_chunks = may_have_chunks(system_attributes)
+        self.thumbnail_id = thumbnail_id
+
+
+# get the ingest descriptor of a sequence; the cached descriptor is only used if the sequence's system attributes are the same as
+# when it was compiled (this is a string comparison, so changes made by other processes are picked up without parsing the attributes)
+def ingest_descriptor(resource):
+    cached = ingest_descriptor_cache.get(resource.id)
+    if cached and cached[0] == resource.system_attributes:
+        return cached[1]
+    system_attributes = json.loads(resource.system_attributes) if resource.system_attributes else {}
+    thumbnail_id = None
+    if system_attributes.get('data_type') == Resource.IMAGE_SEQUENCE:
+        thumbnail = (
+            Resource.query
+            .with_entities(Resource.id)
+            .filter(Resource.parent_id == resource.id, Resource.name == THUMBNAIL_SEQUENCE_NAME, not_(Resource.deleted))
+            .first()
+        )
+        thumbnail_id = thumbnail[0] if thumbnail else None
+    descriptor = IngestDescriptor(system_attributes, thumbnail_id)
+    resource_ids = [resource.id, thumbnail_id] if thumbnail_id else [resource.id]
+    ingest_descriptor_cache.set(resource.id, (resource.system_attributes, descriptor), resource_ids)
+    return descriptor
+
+
 # this is a high-level function for setting the value of a sequence;
 # it (1) creates a sequence value record and (2) sends out a sequence_update message;
 # note that we don't commit resource here; outside code must commit
 # value should be a plain string (not unicode string), possibly containing binary data or encoded unicode data
 def update_sequence_value(resource, resource_path, timestamp, value, emit_message=True):
-    system_attr = json.loads(resource.system_attributes)
-    if 'data_type' not in system_attr:
+    descriptor = ingest_descriptor(resource)
+    data_type = descriptor.data_type
+    if data_type is None:
         logging.warning('attempt to update sequence (%s) without data_type', resource_path)
         return
-    data_type = system_attr['data_type']
-
-    # determine min interval between updates
-    system_attributes = json.loads(resource.system_attributes) if resource.system_attributes else {}
-    min_storage_interval = system_attributes.get('min_storage_interval')
-    if min_storage_interval is None:
-        if data_type == Resource.TEXT_SEQUENCE:
-            min_storage_interval = 0
-        else:
-            min_storage_interval = 50
 
     # prep sequence update message data
     if emit_message:
@@ -203,20 +274,26 @@ def update_sequence_value(resource, resource_path, timestamp, value, emit_messag
             message_params['value'] = value  # fix(soon): json.dumps crashes if this included binary data
 
     # if too soon since last update, don't store a new value (but do still send out an update message)
-    if min_storage_interval == 0 or timestamp >= resource.modification_timestamp + datetime.timedelta(seconds=min_storage_interval):
-        resource_revision = add_resource_revision(resource, timestamp, value.encode())
-        resource.modification_timestamp = timestamp
+    ingested = _ingest_sequence_value(resource, descriptor, timestamp, value)
+    if ingested:
+        (numeric, replaced, compression_state) = ingested
+        if not replaced:  # if not written over the previous revision by compression
+            resource_revision = _new_revision(resource, timestamp, value.encode(), numeric)
+            db.session.add(resource_revision)
+            db.session.commit()
+            _finish_revisions([(resource, value.encode(), resource_revision, compression_state)])
+
+        # update minute/hour/day summaries of numeric sequences (these summarize the stored values, so if compression replaced a
+        # stored value, the affected rollup buckets are recomputed)
+        if replaced:
+            update_replaced_rollups(resource.id, descriptor.may_have_chunks, seconds_timestamp(replaced[0]), timestamp)
+        elif numeric is not None:
+            update_sequence_rollups(resource.id, timestamp, numeric)
 
         # create thumbnails for image sequences
         if data_type == Resource.IMAGE_SEQUENCE:
-            max_width = 240
-            name = 'thumbnail-%d-x' % max_width
-            thumbnail_contents = compute_thumbnail(value, max_width)[0]
-            try:
-                thumbnail_resource = Resource.query.filter(Resource.parent_id == resource.id, Resource.name == name, not_(Resource.deleted)).one()
-            except NoResultFound:
-                thumbnail_resource = create_sequence(resource, name, Resource.IMAGE_SEQUENCE)
-            thumbnail_revision = add_resource_revision(thumbnail_resource, timestamp, thumbnail_contents)
+            thumbnail_contents = compute_thumbnail(value, THUMBNAIL_WIDTH)[0]
+            thumbnail_revision = add_thumbnail_revision(resource, descriptor, timestamp, thumbnail_contents)
             if emit_message:
                 message_params['revision_id'] = resource_revision.id
                 message_params['thumbnail_revision_id'] = thumbnail_revision.id
@@ -232,26 +309,170 @@ def update_sequence_value(resource, resource_path, timestamp, value, emit_messag
             message_sender.send_message(folder_path, message)
 
 
-# creates a resource revision record; places the data in the record (if it is small) or bulk storage (if it is large);
-# note that we don't commit resource here (just resource revision); outside code must commit resource
-# data should be binary data (strings should be encoded first)
-def add_resource_revision(resource, timestamp, data):
-    resource_revision = ResourceRevision()
-    resource_revision.resource_id = resource.id
-    resource_revision.timestamp = timestamp
+# update the values of a set of sequences with a bulk insert; updates is a list of (resource, resource_path, value) tuples (values are
+# strings); this uses a single flush for all of the new revisions and a single rollup update statement and sends one combined update
+# message per folder (rather than one per value); image sequences are handled individually by update_sequence_value; this doesn't
+# commit the session
+def update_sequence_values(updates, timestamp, emit_message=True):
+    revisions = []
+    rollup_values = []
+    folder_updates = {}  # folder path -> (folder ID, list of message parameters)
+    display_messages = []  # (folder path, message) pairs
+    for (resource, resource_path, value) in updates:
+        descriptor = ingest_descriptor(resource)
+        data_type = descriptor.data_type
+        if data_type is None:
+            logging.warning('attempt to update sequence (%s) without data_type', resource_path)
+            continue
+        if data_type == Resource.IMAGE_SEQUENCE:
+            update_sequence_value(resource, resource_path, timestamp, value, emit_message=emit_message)
+            continue
+        ingested = _ingest_sequence_value(resource, descriptor, timestamp, value)
+        if ingested:
+            (numeric, replaced, compression_state) = ingested
+            if replaced:  # if written over the previous revision by compression
+                update_replaced_rollups(resource.id, descriptor.may_have_chunks, seconds_timestamp(replaced[0]), timestamp)
+            else:
+                revisions.append((resource, value.encode(), _new_revision(resource, timestamp, value.encode(), numeric), compression_state))
+                if numeric is not None:
+                    rollup_values.append((resource.id, timestamp, numeric))
+        if emit_message:
+            folder_path = resource_path.rsplit('/', 1)[0]
+            message_params = {'id': resource.id, 'name': resource_path, 'timestamp': timestamp.isoformat() + 'Z', 'value': value}
+            folder_updates.setdefault(folder_path, (resource.parent_id, []))[1].append(message_params)
+            display_messages.append((folder_path, 'd,%s,%s Z,%s' % (resource.name, timestamp.isoformat(), value)))
+
+    # insert the revisions (large values are then written to bulk storage)
+    db.session.add_all([resource_revision for (_, _, resource_revision, _) in revisions])
+    db.session.flush()  # assigns the revision IDs
+    _finish_revisions(revisions)
+    update_sequence_rollups_bulk(rollup_values)
+
+    # create a short lived update message for subscribers to each folder
+    if emit_message:
+        for (folder_path, (folder_id, message_params)) in folder_updates.items():
+            message_queue.add(
+                folder_id=folder_id, folder_path=folder_path, message_type='sequence_updates', parameters={'updates': message_params},
+                timestamp=timestamp)
+        from main.app import message_sender
+        if message_sender:
+            for (folder_path, message) in display_messages:
+                message_sender.send_message(folder_path, message)  # emit a display message, not a store-and-display message
+
+
+# record a new value of a (non-image) sequence in the latest value cache and, unless it is too soon since the last stored value
+# (see min_storage_interval), apply the sequence's compression settings and update its modification timestamp; returns None if the
+# value shouldn't be stored; otherwise returns a (numeric, replaced, compression_state) tuple, where numeric is the parsed value of a
+# numeric sequence and replaced/compression_state are as described for compress_sequence_value; used by both update_sequence_value
+# and update_sequence_values
+def _ingest_sequence_value(resource, descriptor, timestamp, value):
+
+    # keep the latest value in memory (even if not stored) so that current values can be read without going to the database
+    if descriptor.data_type != Resource.IMAGE_SEQUENCE:
+        latest_value_cache.set(resource.id, timestamp, value)
+    if descriptor.min_storage_interval and timestamp < resource.modification_timestamp + descriptor.min_storage_interval:
+        return None
+    numeric = numeric_value(value) if descriptor.data_type == Resource.NUMERIC_SEQUENCE else None
+    settings = descriptor.compression if numeric is not None else None
+    (replaced, compression_state) = compress_sequence_value(resource, settings, timestamp, value.encode(), numeric)
+    resource.modification_timestamp = timestamp
+    return (numeric, replaced, compression_state)
+
+
+# create a revision record for a new value; small values are stored in the record; larger values are written to bulk storage by
+# _finish_revisions (once the record has an ID); the caller must add the record to the session
+def _new_revision(resource, timestamp, data, value=None):
+    resource_revision = ResourceRevision(resource_id=resource.id, timestamp=timestamp, value=value)
     if len(data) < 1000 or not storage_manager:
         resource_revision.data = data
-        bulk_storage = False
-    else:
-        bulk_storage = True
+    return resource_revision
+
+
+# complete the storage of new revision records once they have IDs: write large values to bulk storage, update each resource's
+# last revision ID and value count, and keep the compression state of each new revision (if any); revisions is a list of
+# (resource, data, revision, compression state) tuples
+def _finish_revisions(revisions):
+    for (resource, data, resource_revision, compression_state) in revisions:
+        if resource_revision.data is None:
+            storage_manager.write(resource.storage_path(resource_revision.id), data)
+        resource.last_revision_id = resource_revision.id  # note that we don't commit here; outside code must commit
+        resource.value_count = Resource.value_count + 1  # updated in the database (a NULL count stays NULL)
+        if compression_state:
+            compression_cache.set(resource.id, (resource_revision.id, compression_state), [resource.id])
+
+
+# apply the compression settings (see compress_value) of a numeric sequence to a new value; if the value fits in the sequence's
+# current segment, it is written over the sequence's most recent revision; returns a (replaced, state) tuple, where replaced is
+# the [seconds, value] point that was written over (or None); if not replaced, the caller should add a new revision and then store
+# the state in the compression cache along with the new revision's ID; if settings is None (the sequence isn't compressed),
+# returns (None, None)
+def compress_sequence_value(resource, settings, timestamp, data, numeric):
+    if not settings:
+        return (None, None)
+    cached = compression_cache.get(resource.id)
+    state = cached[1] if cached and resource.last_revision_id and cached[0] == resource.last_revision_id else None
+    (replace, new_state) = compress_value(settings, state, timestamp_seconds(timestamp), numeric)
+    if not replace:
+        return (None, new_state)
+    ResourceRevision.query.filter(ResourceRevision.id == resource.last_revision_id).update(
+        {'timestamp': timestamp, 'data': data, 'value': numeric}, synchronize_session=False)
+    compression_cache.set(resource.id, (resource.last_revision_id, new_state), [resource.id])
+    return (state['end'], new_state)  # the previous state's provisional end point is the value in the replaced revision
+
+
+# creates a resource revision record; places the data in the record (if it is small) or bulk storage (if it is large);
+# note that we don't commit resource here (just resource revision); outside code must commit resource
+# data should be binary data (strings should be encoded first); value is the numeric value of the data (for numeric sequences)
+def add_resource_revision(resource, timestamp, data, value=None):
+    resource_revision = _new_revision(resource, timestamp, data, value)
     db.session.add(resource_revision)
     db.session.commit()
-    if bulk_storage:
-        storage_manager.write(resource.storage_path(resource_revision.id), data)
-    resource.last_revision_id = resource_revision.id  # note that we don't commit here; outside code must commit
+    _finish_revisions([(resource, data, resource_revision, None)])
     return resource_revision
 
 
+# add a revision to the thumbnail sequence of an image sequence, creating the thumbnail sequence if needed; the thumbnail sequence's
+# ID comes from the image sequence's ingest descriptor, so its resource record isn't loaded; this doesn't commit the session
+def add_thumbnail_revision(resource, descriptor, timestamp, data):
+    thumbnail_id = descriptor.thumbnail_id
+    if not thumbnail_id:
+        thumbnail_id = create_sequence(resource, THUMBNAIL_SEQUENCE_NAME, Resource.IMAGE_SEQUENCE).id
+        ingest_descriptor_cache.remove(resource.id)  # the descriptor will be compiled again with the new thumbnail sequence
+    thumbnail_revision = ResourceRevision(resource_id=thumbnail_id, timestamp=timestamp)
+    bulk_storage = len(data) >= 1000 and storage_manager
+    if not bulk_storage:
+        thumbnail_revision.data = data
+    db.session.add(thumbnail_revision)
+    db.session.flush()  # assigns the revision ID
+    if bulk_storage:
+        org_id = resource.organization_id or resource.root().id  # the thumbnail sequence is in the same organization as the image sequence
+        storage_manager.write(revision_storage_path(org_id, thumbnail_id, thumbnail_revision.id), data)
+    Resource.query.filter(Resource.id == thumbnail_id).update(
+        {'last_revision_id': thumbnail_revision.id, 'value_count': Resource.value_count + 1}, synchronize_session=False)
+    return thumbnail_revision
+
+
+# delete the revisions of a resource before the given time (except keep_revision_id, if given) in batches, committing after each
+# batch so that we don't hold locks for long (the resource's value count is updated along with each batch); returns the number of
+# revisions deleted
+def delete_revisions(resource_id, boundary_timestamp, keep_revision_id=None, batch_size=1000):
+    old_revisions = db.session.query(ResourceRevision.id).filter(
+        ResourceRevision.resource_id == resource_id, ResourceRevision.timestamp < boundary_timestamp)
+    if keep_revision_id:
+        old_revisions = old_revisions.filter(ResourceRevision.id != keep_revision_id)
+    old_revisions = old_revisions.limit(batch_size)
+    delete_count = 0
+    while True:
+        revision_ids = [revision_id for (revision_id,) in old_revisions]
+        if revision_ids:
+            ResourceRevision.query.filter(ResourceRevision.id.in_(revision_ids)).delete(synchronize_session=False)
+            adjust_value_count(resource_id, -len(revision_ids))
+        db.session.commit()
+        delete_count += len(revision_ids)
+        if len(revision_ids) < batch_size:
+            return delete_count
+
+
 # reads the most recent revision/value of a resource;
 # if check_timing is True, will display some timing diagnostics
 def read_resource(resource, revision_id=None, check_timing=False):
@@ -278,6 +499,16 @@ def read_resource(resource, revision_id=None, check_timing=False):
     return data
 
 
+# get the current value of a (non-image) sequence from the latest value cache; returns None if the value isn't cached or if a newer
+# value has been stored since it was cached (e.g. by another process); values that weren't stored (because of min_storage_interval)
+# are newer than the sequence's modification timestamp, so they are used
+def cached_sequence_value(resource):
+    cached = latest_value_cache.get(resource.id)
+    if cached and (resource.modification_timestamp is None or cached[0] >= resource.modification_timestamp):
+        return cached[1]
+    return None
+
+
 # create a new sequence resource; commits it to database and returns resource record
 def create_sequence(parent_resource, name, data_type, max_history=10000, units=None):
     r = Resource()
@@ -287,6 +518,7 @@ def create_sequence(parent_resource, name, data_type, max_history=10000, units=N
     r.type = Resource.SEQUENCE
     r.creation_timestamp = datetime.datetime.utcnow()
     r.modification_timestamp = r.creation_timestamp
+    r.value_count = 0
     system_attributes = {
         'data_type': data_type,
         'max_history': max_history
@@ -0,0 +1,227 @@
+# standard python imports
+import re
+import json
+import datetime
+
+
+# external imports
+from sqlalchemy import and_, column, not_, or_, select, table, text
+
+
+# internal imports
+from main.app import app, db, storage_manager
+from main.resources.models import Resource, ResourceRevision
+from main.resources.sequence_util import retention_settings, retention_cutoffs
+
+
+# ======== time-partitioned revision storage ========
+# on PostgreSQL, the resource_revisions table can be range-partitioned by timestamp (one partition per day, week, or month);
+# old revisions can then be removed by dropping whole partitions rather than deleting rows (which bloats the table and leaves
+# a lot of work for vacuum); a default partition holds any revisions outside the ranges of the other partitions (e.g. values
+# with bad timestamps or the revisions that were kept when their partitions were dropped)
+
+
+PARTITION_INTERVALS = ('day', 'week', 'month')
+TABLE_NAME = ResourceRevision.__tablename__
+LEGACY_TABLE_NAME = TABLE_NAME + '_legacy'  # the original (unpartitioned) table becomes the partition for all older revisions
+DEFAULT_PARTITION_NAME = TABLE_NAME + '_default'
+
+
+# returns True if revisions should be stored in time partitions (only supported on PostgreSQL)
+def partitioning_enabled():
+    return bool(app.config['REVISION_PARTITION_INTERVAL']) and db.engine.dialect.name == 'postgresql'
+
+
+# get the start of the partition containing the given (naive, UTC) timestamp; weeks start on Monday
+def partition_start(timestamp, interval):
+    start = datetime.datetime(timestamp.year, timestamp.month, timestamp.day)
+    if interval == 'week':
+        start -= datetime.timedelta(days=start.weekday())
+    elif interval == 'month':
+        start = start.replace(day=1)
+    return start
+
+
+# get the start of the partition following the one that starts at the given time
+def next_partition_start(start, interval):
+    if interval == 'day':
+        return start + datetime.timedelta(days=1)
+    if interval == 'week':
+        return start + datetime.timedelta(days=7)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+# the name of the partition starting at the given time
+def partition_name(start):
+    return '%s_p%s' % (TABLE_NAME, start.strftime('%Y%m%d'))
+
+
+# returns True if the resource_revisions table is already partitioned
+def is_partitioned(connection):
+    return connection.execute(text(
+        "SELECT count(*) FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = partrelid WHERE relname = :table_name"
+    ), {'table_name': TABLE_NAME}).scalar() > 0
+
+
+# get the partitions of the resource_revisions table as a list of (name, upper bound) tuples sorted by upper bound;
+# the default partition isn't included
+def revision_partitions(connection):
+    rows = connection.execute(text(
+        "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits "
+        "JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent "
+        "WHERE parent.relname = :table_name"
+    ), {'table_name': TABLE_NAME})
+    partitions = []
+    for (name, bound) in rows:
+        match = re.search(r"TO \('([^']+)'\)", bound)
+        if match:
+            partitions.append((name, datetime.datetime.strptime(match.group(1)[:19], '%Y-%m-%d %H:%M:%S')))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+# convert an existing (unpartitioned) resource_revisions table into a partitioned table; the existing table is attached as the
+# partition for all revisions before the start of the partition following its latest revision (or the current time, if later);
+# this locks the table while it runs (attaching the existing table requires building a unique index on it); safe to run more than once
+def partition_revisions():
+    interval = app.config['REVISION_PARTITION_INTERVAL']
+    assert interval in PARTITION_INTERVALS
+    with db.engine.begin() as connection:
+        if is_partitioned(connection):
+            return False
+        connection.execute(text('LOCK TABLE %s IN ACCESS EXCLUSIVE MODE' % TABLE_NAME))
+        last_timestamp = connection.execute(text('SELECT max(timestamp) FROM %s' % TABLE_NAME)).scalar()
+        now = datetime.datetime.utcnow()
+        boundary = next_partition_start(partition_start(max(last_timestamp or now, now), interval), interval)
+
+        # rename the existing table and its indexes so that the new table can use the names in the model
+        connection.execute(text('ALTER TABLE %s RENAME TO %s' % (TABLE_NAME, LEGACY_TABLE_NAME)))
+        connection.execute(text('ALTER INDEX %s_pkey RENAME TO %s_pkey' % (TABLE_NAME, LEGACY_TABLE_NAME)))
+        for index in ResourceRevision.__table__.indexes:
+            connection.execute(text('ALTER INDEX IF EXISTS %s RENAME TO %s' % (index.name, index.name.replace(TABLE_NAME, LEGACY_TABLE_NAME))))
+
+        # create the partitioned table; the primary key must include the partition column; the ID sequence is moved to the new
+        # table so that it isn't dropped along with the old partition
+        connection.execute(text(
+            'CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING COMMENTS) PARTITION BY RANGE (timestamp)' % (TABLE_NAME, LEGACY_TABLE_NAME)))
+        connection.execute(text('ALTER TABLE %s ADD PRIMARY KEY (id, timestamp)' % TABLE_NAME))
+        connection.execute(text('ALTER SEQUENCE %s_id_seq OWNED BY %s.id' % (TABLE_NAME, TABLE_NAME)))
+        for index in ResourceRevision.__table__.indexes:
+            index.create(bind=connection)
+        connection.execute(text("ALTER TABLE %s ATTACH PARTITION %s FOR VALUES FROM (MINVALUE) TO ('%s')" % (
+            TABLE_NAME, LEGACY_TABLE_NAME, boundary.isoformat(' '))))
+        connection.execute(text('CREATE TABLE %s PARTITION OF %s DEFAULT' % (DEFAULT_PARTITION_NAME, TABLE_NAME)))
+    create_revision_partitions()
+    return True
+
+
+# create the partitions needed to hold revisions through the given number of intervals past the current time; any revisions in
+# the default partition that belong in a new partition are moved into it; returns the names of the new partitions
+def create_revision_partitions(now=None, partitions_ahead=None):
+    interval = app.config['REVISION_PARTITION_INTERVAL']
+    now = now or datetime.datetime.utcnow()
+    if partitions_ahead is None:
+        partitions_ahead = app.config['REVISION_PARTITIONS_AHEAD']
+    end = partition_start(now, interval)
+    for _ in range(partitions_ahead + 1):
+        end = next_partition_start(end, interval)
+    names = []
+    with db.engine.begin() as connection:
+        partitions = revision_partitions(connection)
+        start = partitions[-1][1] if partitions else partition_start(now, interval)
+        while start < end:
+            next_start = next_partition_start(start, interval)
+            (name, bounds) = (partition_name(start), {'start': start, 'end': next_start})
+            connection.execute(text('CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS)' % (name, TABLE_NAME)))
+            connection.execute(text(
+                'WITH moved AS (DELETE FROM %s WHERE timestamp >= :start AND timestamp < :end RETURNING *) INSERT INTO %s SELECT * FROM moved' % (
+                    DEFAULT_PARTITION_NAME, name)), bounds)
+            connection.execute(text("ALTER TABLE %s ATTACH PARTITION %s FOR VALUES FROM ('%s') TO ('%s')" % (
+                TABLE_NAME, name, start.isoformat(' '), next_start.isoformat(' '))))
+            names.append(name)
+            start = next_start
+    return names
+
+
+# get the times from which the revisions of sequences with values in a time range (start inclusive, end exclusive; start may be None)
+# must be kept when that range is dropped: a sequence keeps its newest max_history revisions (as the sequence truncator does) and,
+# if it has retention settings, the raw values within its raw retention period (see retention_cutoffs; all of them if the raw tier
+# isn't limited); returns a dictionary mapping sequence IDs to times (sequences with nothing to keep in the range aren't included)
+def kept_revision_starts(start, end, now=None):
+    revisions = db.session.query(ResourceRevision.resource_id).filter(ResourceRevision.timestamp < end)
+    if start:
+        revisions = revisions.filter(ResourceRevision.timestamp >= start)
+    sequences = (
+        Resource.query
+        .with_entities(Resource.id, Resource.system_attributes)
+        .filter(Resource.type == Resource.SEQUENCE, not_(Resource.deleted), Resource.id.in_(revisions))
+    )
+    keep_from = {}
+    for (resource_id, system_attributes) in sequences:
+        system_attributes = json.loads(system_attributes) if system_attributes else {}
+        max_history = max(system_attributes.get('max_history', 1), 1)
+        boundary = (
+            db.session.query(ResourceRevision.timestamp)
+            .filter(ResourceRevision.resource_id == resource_id)
+            .order_by(ResourceRevision.timestamp.desc())
+            .offset(max_history - 1)
+            .first()
+        )
+        times = [boundary.timestamp if boundary else datetime.datetime.min]  # keep everything if fewer than max_history revisions
+        retention = retention_settings(system_attributes)
+        if retention:
+            times.append(retention_cutoffs(retention, now)['raw'] or datetime.datetime.min)
+        if min(times) < end:
+            keep_from[resource_id] = min(times)
+    return keep_from
+
+
+# get a condition selecting the revisions in a revisions table (the resource_revisions table or one of its partitions) that must be
+# kept when the table is dropped: the revisions of resources other than sequences (e.g. file histories), the last revision of each
+# resource, and the revisions of sequences from the times given by keep_from (see kept_revision_starts)
+def kept_revisions_condition(revisions, keep_from):
+    return or_(
+        revisions.c.resource_id.in_(select(Resource.id).where(Resource.type != Resource.SEQUENCE)),
+        revisions.c.id.in_(select(Resource.last_revision_id).where(Resource.last_revision_id.isnot(None))),
+        *[and_(revisions.c.resource_id == resource_id, revisions.c.timestamp >= timestamp) for (resource_id, timestamp) in keep_from.items()]
+    )
+
+
+# drop the partitions that only hold revisions older than the given number of days; the revisions that must be kept (see
+# kept_revisions_condition; e.g. file histories and sequence values within a longer raw retention period) are moved to the default
+# partition first (from which the sequence truncator and retention workers remove them later); the value counts of the sequences are
+# updated and the bulk storage objects of the dropped revisions are deleted (after the partition is dropped); returns the names of
+# the dropped partitions
+def drop_revision_partitions(retention_days, now=None):
+    now = now or datetime.datetime.utcnow()
+    cutoff = now - datetime.timedelta(days=retention_days)
+    names = []
+    with db.engine.connect() as connection:
+        partitions = revision_partitions(connection)
+    start = None
+    for (name, upper_bound) in partitions:
+        if upper_bound > cutoff:
+            break
+        keep_from = kept_revision_starts(start, upper_bound, now)
+        db.session.commit()  # end the read transaction
+        partition = table(name, *[column(revision_column.name, revision_column.type) for revision_column in ResourceRevision.__table__.c])
+        kept = kept_revisions_condition(partition, keep_from)
+        with db.engine.begin() as connection:  # one transaction per partition
+            connection.execute(text('ALTER TABLE %s DETACH PARTITION %s' % (TABLE_NAME, name)))
+            connection.execute(ResourceRevision.__table__.insert().from_select(list(partition.c.keys()), select(partition).where(kept)))
+            connection.execute(partition.delete().where(kept))
+            bulk_revisions = connection.execute(text('SELECT resource_id, id FROM %s WHERE data IS NULL' % name)).all()
+            connection.execute(text(
+                'UPDATE resources SET value_count = resources.value_count - dropped.count '
+                'FROM (SELECT resource_id, count(*) AS count FROM %s GROUP BY resource_id) AS dropped WHERE resources.id = dropped.resource_id' % (
+                    name)))
+            connection.execute(text('DROP TABLE %s' % name))
+        if storage_manager and bulk_revisions:
+            resources = {resource.id: resource for resource in Resource.query.filter(Resource.id.in_({row[0] for row in bulk_revisions}))}
+            for (resource_id, revision_id) in bulk_revisions:
+                storage_manager.delete(resources[resource_id].storage_path(revision_id))
+            db.session.commit()  # end the read transaction
+        names.append(name)
+        start = upper_bound
+    return names
@@ -49,6 +49,11 @@ class S3StorageManager():
                 return True
         return False
 
-    # fix(soon): implement and use this
+    # delete an object in bulk storage
     def delete(self, data_path):
-        pass
+        if not self.write_allowed:
+            print('delete from production bucket not allowed')
+            return
+        if self.verbose:
+            print('deleting from bucket: %s, key: %s' % (self.bucket_name, data_path))
+        self.bucket.Object(data_path).delete()
@@ -0,0 +1,350 @@
+# standard python imports
+import heapq
+import struct
+import datetime
+
+
+# external imports
+from sqlalchemy import and_, or_, func
+
+
+# internal imports
+from main.app import db
+from main.resources.models import ResourceRevision, SequenceChunk, adjust_value_count
+from main.resources.sequence_util import EPOCH, align_samples, seconds_timestamp, timestamp_seconds, bucket_values, replace_rollup_buckets
+
+
+# ======== chunk encoding ========
+# timestamps (integer microseconds since the epoch) are stored as delta-of-deltas and values (float64) are stored as the XOR of
+# each value with the previous value, using variable-length bit fields (as in Facebook's Gorilla time series database)
+
+
+# (prefix, number of bits) pairs for delta-of-delta timestamp fields; a delta-of-delta of zero is stored as a single 0 bit
+TIMESTAMP_FIELDS = (('10', 7), ('110', 9), ('1110', 12), ('11110', 20), ('111110', 32), ('111111', 64))
+
+
+# pack a list of timestamps (integer microseconds since the epoch, ascending) and values (floats) into a block of bytes
+def encode_chunk(timestamps, values):
+    bits = []
+    previous_timestamp = timestamps[0]
+    previous_delta = 0
+    previous_bits = _float_bits(values[0])
+    (previous_leading, previous_trailing) = (None, None)
+    bits.append(format(previous_timestamp, '064b'))
+    bits.append(format(previous_bits, '064b'))
+    for (timestamp, value) in zip(timestamps[1:], values[1:]):
+
+        # timestamp
+        delta = timestamp - previous_timestamp
+        delta_of_delta = delta - previous_delta
+        if delta_of_delta == 0:
+            bits.append('0')
+        else:
+            for (prefix, size) in TIMESTAMP_FIELDS:
+                bias = (1 << (size - 1)) - 1
+                if -bias <= delta_of_delta <= bias + 1 or size == 64:
+                    bits.append(prefix + format((delta_of_delta + bias) & ((1 << size) - 1), '0%db' % size))
+                    break
+        (previous_timestamp, previous_delta) = (timestamp, delta)
+
+        # value
+        value_bits = _float_bits(value)
+        xor = value_bits ^ previous_bits
+        previous_bits = value_bits
+        if xor == 0:
+            bits.append('0')
+            continue
+        leading = min(64 - xor.bit_length(), 31)
+        trailing = (xor & -xor).bit_length() - 1
+        if previous_leading is not None and leading >= previous_leading and trailing >= previous_trailing:
+            size = 64 - previous_leading - previous_trailing
+            bits.append('10' + format(xor >> previous_trailing, '0%db' % size))
+        else:
+            size = 64 - leading - trailing
+            bits.append('11' + format(leading, '05b') + format(size - 1, '06b') + format(xor >> trailing, '0%db' % size))
+            (previous_leading, previous_trailing) = (leading, trailing)
+    bits = ''.join(bits)
+    bits += '0' * (-len(bits) % 8)
+    return int(bits, 2).to_bytes(len(bits) // 8, 'big')
+
+
+# unpack a block of bytes created by encode_chunk; returns lists of timestamps and values
+def decode_chunk(data, count):
+    bits = format(int.from_bytes(data, 'big'), '0%db' % (len(data) * 8))
+    timestamp = int(bits[0:64], 2)
+    value_bits = int(bits[64:128], 2)
+    position = 128
+    delta = 0
+    (leading, trailing) = (0, 0)
+    timestamps = [timestamp]
+    values = [_bits_float(value_bits)]
+    for _ in range(count - 1):
+
+        # timestamp
+        if bits[position] == '0':
+            position += 1
+        else:
+            for (prefix, size) in TIMESTAMP_FIELDS:
+                if bits.startswith(prefix, position):
+                    position += len(prefix)
+                    bias = (1 << (size - 1)) - 1
+                    delta_of_delta = int(bits[position:position + size], 2) - bias
+                    if size == 64 and delta_of_delta > (1 << 63):
+                        delta_of_delta -= 1 << 64
+                    delta += delta_of_delta
+                    position += size
+                    break
+        timestamp += delta
+        timestamps.append(timestamp)
+
+        # value
+        if bits[position] == '0':
+            position += 1
+        else:
+            if bits[position + 1] == '1':
+                leading = int(bits[position + 2:position + 7], 2)
+                size = int(bits[position + 7:position + 13], 2) + 1
+                trailing = 64 - leading - size
+                position += 13
+            else:
+                size = 64 - leading - trailing
+                position += 2
+            value_bits ^= int(bits[position:position + size], 2) << trailing
+            position += size
+        values.append(_bits_float(value_bits))
+    return (timestamps, values)
+
+
+# get the 64-bit representation of a float
+def _float_bits(value):
+    return struct.unpack('>Q', struct.pack('>d', value))[0]
+
+
+# get the float for a 64-bit representation
+def _bits_float(bits):
+    return struct.unpack('>d', struct.pack('>Q', bits))[0]
+
+
+# convert a (naive, UTC) datetime to integer microseconds since the epoch
+def timestamp_microseconds(timestamp):
+    delta = timestamp.replace(tzinfo=None) - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+# convert integer microseconds since the epoch to a (naive, UTC) datetime
+def microseconds_timestamp(microseconds):
+    return EPOCH + datetime.timedelta(microseconds=microseconds)
+
+
+# format a numeric value as sequence data (as close as possible to how it would have been written, e.g. 2 rather than 2.0)
+def format_value(value):
+    text = repr(value)
+    return text[:-2] if text.endswith('.0') else text
+
+
+# ======== chunked storage ========
+
+
+# returns True if a sequence (given its system attributes) uses chunked storage
+def is_chunked(system_attributes):
+    return system_attributes.get('storage') == 'chunked'
+
+
+# returns True if a sequence (given its system attributes) may have values in chunks (i.e. it uses or has used chunked storage)
+def may_have_chunks(system_attributes):
+    return 'storage' in system_attributes
+
+
+# move the numeric values of a sequence in closed time windows (those that end before the window containing the given time)
+# from revision records into chunks (one per window), merging them into any existing chunk for the window; the sequence's
+# last revision is never moved (it is used to read the current value); returns the number of values moved; commits the session
+def compact_sequence(resource, chunk_length, now=None, batch_size=10000):
+    now = now or datetime.datetime.utcnow()
+    chunk_micro = int(chunk_length * 1000000)
+    cutoff = microseconds_timestamp(timestamp_microseconds(now) // chunk_micro * chunk_micro)
+    revisions = (
+        ResourceRevision.query
+        .with_entities(ResourceRevision.id, ResourceRevision.timestamp, ResourceRevision.value)
+        .filter(ResourceRevision.resource_id == resource.id, ResourceRevision.timestamp < cutoff, ResourceRevision.value.isnot(None))
+        .order_by(ResourceRevision.timestamp, ResourceRevision.id)
+    )
+    if resource.last_revision_id:
+        revisions = revisions.filter(ResourceRevision.id != resource.last_revision_id)
+    moved_count = 0
+    window_start = None
+    window = []  # (revision ID, microseconds, value) for the current window
+    last = None  # (timestamp, ID) of the last revision read; revisions are read in batches since they're deleted as we go
+    while True:
+        batch = revisions
+        if last:
+            (timestamp, revision_id) = last
+            batch = batch.filter(or_(
+                ResourceRevision.timestamp > timestamp, and_(ResourceRevision.timestamp == timestamp, ResourceRevision.id > revision_id)))
+        batch = batch.limit(batch_size).all()
+        for (revision_id, timestamp, value) in batch:
+            microseconds = timestamp_microseconds(timestamp)
+            start = microseconds // chunk_micro * chunk_micro
+            if start != window_start:
+                moved_count += _store_window(resource.id, window_start, chunk_micro, window)
+                (window_start, window) = (start, [])
+            window.append((revision_id, microseconds, value))
+        if len(batch) < batch_size:
+            break
+        last = (batch[-1][1], batch[-1][0])
+    moved_count += _store_window(resource.id, window_start, chunk_micro, window)
+    db.session.commit()
+    return moved_count
+
+
+# store the values of a window in a chunk and delete their revision records
+def _store_window(resource_id, window_start, chunk_micro, window):
+    if not window:
+        return 0
+    start_timestamp = microseconds_timestamp(window_start)
+    items = [(microseconds, value) for (_, microseconds, value) in window]
+    chunk = SequenceChunk.query.filter(SequenceChunk.resource_id == resource_id, SequenceChunk.start_timestamp == start_timestamp).first()
+    if chunk:
+        items = list(heapq.merge(zip(*decode_chunk(chunk.data, chunk.count)), items, key=lambda item: item[0]))
+    else:
+        end_timestamp = microseconds_timestamp(window_start + chunk_micro)
+        chunk = SequenceChunk(resource_id=resource_id, start_timestamp=start_timestamp, end_timestamp=end_timestamp)
+        db.session.add(chunk)
+    chunk.count = len(items)
+    chunk.first_timestamp = microseconds_timestamp(items[0][0])
+    chunk.last_timestamp = microseconds_timestamp(items[-1][0])
+    chunk.data = encode_chunk([item[0] for item in items], [item[1] for item in items])
+    revision_ids = [revision_id for (revision_id, _, _) in window]
+    for index in range(0, len(revision_ids), 1000):
+        ResourceRevision.query.filter(ResourceRevision.id.in_(revision_ids[index:index + 1000])).delete(synchronize_session=False)
+    return len(window)
+
+
+# get the values stored in the chunks of a sequence in a time range (inclusive; either end may be None) as (timestamp, value, text)
+# tuples in ascending order (or descending order if newest_first is True); chunks are read and decoded one at a time as needed
+def chunk_values(resource_id, start_timestamp=None, end_timestamp=None, newest_first=False):
+    chunks = SequenceChunk.query.filter(SequenceChunk.resource_id == resource_id)
+    if start_timestamp:
+        chunks = chunks.filter(SequenceChunk.last_timestamp >= start_timestamp)
+    if end_timestamp:
+        chunks = chunks.filter(SequenceChunk.first_timestamp <= end_timestamp)
+    chunks = chunks.order_by(SequenceChunk.start_timestamp.desc() if newest_first else SequenceChunk.start_timestamp)
+    for chunk in chunks.yield_per(10):
+        items = zip(*decode_chunk(chunk.data, chunk.count))
+        if newest_first:
+            items = reversed(list(items))
+        for (microseconds, value) in items:
+            timestamp = microseconds_timestamp(microseconds)
+            if (not start_timestamp or timestamp >= start_timestamp) and (not end_timestamp or timestamp <= end_timestamp):
+                yield (timestamp, value, format_value(value))
+
+
+# get the values of a sequence (from both chunks and revision records) in a time range (inclusive; either end may be None) as
+# (timestamp, value, text) tuples in ascending order (or descending order if newest_first is True); value is None for revisions
+# that aren't numbers
+def sequence_values(resource_id, start_timestamp=None, end_timestamp=None, newest_first=False):
+    revisions = (
+        ResourceRevision.query
+        .with_entities(ResourceRevision.timestamp, ResourceRevision.value, ResourceRevision.data)
+        .filter(ResourceRevision.resource_id == resource_id)
+    )
+    if start_timestamp:
+        revisions = revisions.filter(ResourceRevision.timestamp >= start_timestamp)
+    if end_timestamp:
+        revisions = revisions.filter(ResourceRevision.timestamp <= end_timestamp)
+    if newest_first:
+        revisions = revisions.order_by(ResourceRevision.timestamp.desc(), ResourceRevision.id.desc())
+    else:
+        revisions = revisions.order_by(ResourceRevision.timestamp, ResourceRevision.id)
+    revisions = ((timestamp, value, data.decode() if data is not None else '') for (timestamp, value, data) in revisions.yield_per(1000))
+    return heapq.merge(
+        chunk_values(resource_id, start_timestamp, end_timestamp, newest_first), revisions, key=lambda item: item[0], reverse=newest_first)
+
+
+# get the stored numeric values of a sequence (from chunks, if it may have them, and revision records) in a time range (start inclusive,
+# end exclusive; either end may be None) as (timestamp, value) tuples in ascending order; these are the values summarized by the
+# sequence's rollups (values replaced by compression aren't included)
+def stored_numeric_values(resource_id, chunked, start_timestamp=None, end_timestamp=None):
+    if chunked:
+        values = ((timestamp, value) for (timestamp, value, _) in sequence_values(resource_id, start_timestamp, end_timestamp) if value is not None)
+    else:
+        values = (
+            ResourceRevision.query
+            .with_entities(ResourceRevision.timestamp, ResourceRevision.value)
+            .filter(ResourceRevision.resource_id == resource_id, ResourceRevision.value.isnot(None))
+        )
+        if start_timestamp:
+            values = values.filter(ResourceRevision.timestamp >= start_timestamp)
+        if end_timestamp:
+            values = values.filter(ResourceRevision.timestamp <= end_timestamp)
+        values = values.order_by(ResourceRevision.timestamp, ResourceRevision.id).yield_per(10000)
+    return ((timestamp, value) for (timestamp, value) in values if not end_timestamp or timestamp < end_timestamp)
+
+
+# update the rollups of a sequence after compression replaced a stored value (at replaced_timestamp) with a new value (at timestamp),
+# so that the rollups keep summarizing the stored values (as they would if rebuilt by backfill_rollups); only the minute buckets
+# containing the two times are recomputed from the stored values, along with the hour and day buckets containing them (see
+# replace_rollup_buckets); returns the number of rollup records written; this doesn't commit the session
+def update_replaced_rollups(resource_id, chunked, replaced_timestamp, timestamp):
+    minute_buckets = {}
+    for start in {timestamp_seconds(replaced_timestamp) // 60 * 60, timestamp_seconds(timestamp) // 60 * 60}:
+        (timestamps, values) = ([], [])
+        for (value_timestamp, value) in stored_numeric_values(resource_id, chunked, seconds_timestamp(start), seconds_timestamp(start + 60)):
+            timestamps.append(timestamp_seconds(value_timestamp))
+            values.append(value)
+        buckets = bucket_values(timestamps, values, 60, origin=start, bucket_count=1)
+        minute_buckets[start] = buckets[0] if buckets else None
+    return replace_rollup_buckets(resource_id, minute_buckets)
+
+
+# get the last count values of a sequence (from both chunks and revision records) in a time range as (timestamp, value, text) tuples
+# in ascending order; if numeric_only is True, values that aren't numbers are skipped; if text is given, only values containing
+# the text are included
+def latest_sequence_values(resource_id, count, start_timestamp=None, end_timestamp=None, numeric_only=False, text=None):
+    values = []
+    for item in sequence_values(resource_id, start_timestamp, end_timestamp, newest_first=True):
+        if (numeric_only and item[1] is None) or (text and text not in item[2]):
+            continue
+        values.append(item)
+        if len(values) >= count:
+            break
+    values.reverse()
+    return values
+
+
+# get the number of values stored in the chunks of a sequence
+def chunk_value_count(resource_id):
+    return db.session.query(func.coalesce(func.sum(SequenceChunk.count), 0)).filter(SequenceChunk.resource_id == resource_id).scalar()
+
+
+# delete the chunks of a sequence that end before the given time in batches, committing after each batch so that we don't hold locks
+# for long (the sequence's value count is updated along with each batch); returns the number of values deleted
+def delete_chunks(resource_id, boundary_timestamp, batch_size=1000):
+    old_chunks = (
+        db.session.query(SequenceChunk.id, SequenceChunk.count)
+        .filter(SequenceChunk.resource_id == resource_id, SequenceChunk.last_timestamp < boundary_timestamp)
+        .limit(batch_size)
+    )
+    delete_count = 0
+    while True:
+        chunks = old_chunks.all()
+        if chunks:
+            SequenceChunk.query.filter(SequenceChunk.id.in_([chunk_id for (chunk_id, _) in chunks])).delete(synchronize_session=False)
+            adjust_value_count(resource_id, -sum(count for (_, count) in chunks))
+        db.session.commit()
+        delete_count += sum(count for (_, count) in chunks)
+        if len(chunks) < batch_size:
+            return delete_count
+
+
+# get the values of a sequence (from both chunks and revision records) aligned on a time grid (see aligned_sequence_values)
+def aligned_chunked_values(resource_id, grid, resolution, method):
+    start = seconds_timestamp(grid[0])
+    end = grid[-1] + (resolution if method == 'mean' else 0)
+    samples = latest_sequence_values(resource_id, 1, end_timestamp=start - datetime.timedelta(microseconds=1), numeric_only=True)
+    samples = [(timestamp_seconds(timestamp), value) for (timestamp, value, _) in samples]
+    for (timestamp, value, _) in sequence_values(resource_id, start_timestamp=start):
+        if value is not None:
+            samples.append((timestamp_seconds(timestamp), value))
+            if samples[-1][0] >= end:
+                break
+    return align_samples(grid, resolution, method, samples)
@@ -0,0 +1,584 @@
+# standard python imports
+import json
+import math
+import datetime
+
+
+# external imports
+from sqlalchemy import and_, case, cast, func, BigInteger, Float
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+# internal imports
+from main.app import db
+from main.resources.models import Resource, ResourceRevision, SequenceRollup
+
+
+EPOCH = datetime.datetime.utcfromtimestamp(0)
+
+
+# convert a (naive, UTC) datetime to seconds since the epoch
+def timestamp_seconds(timestamp):
+    return (timestamp.replace(tzinfo=None) - EPOCH).total_seconds()
+
+
+# convert seconds since the epoch to a (naive, UTC) datetime
+def seconds_timestamp(seconds):
+    return EPOCH + datetime.timedelta(seconds=seconds)
+
+
+# reduce a numeric time series to a smaller number of buckets, computing the count, min, max, and mean of each bucket;
+# timestamps are seconds since the epoch (in ascending order) and values are numbers;
+# if resolution (in seconds) is given, the buckets are aligned to multiples of the resolution;
+# otherwise the time range of the data is split into max_points equal buckets;
+# returns a list of (bucket start timestamp, count, min, max, mean) tuples for the non-empty buckets
+def downsample(timestamps, values, max_points=None, resolution=None):
+    if not timestamps:
+        return []
+    if resolution:
+        buckets = bucket_values(timestamps, values, resolution)
+    else:
+        span = timestamps[-1] - timestamps[0]
+        buckets = bucket_values(timestamps, values, span / max_points if span else 1.0, origin=timestamps[0], bucket_count=max_points)
+    return bucket_summaries(buckets)
+
+
+# reduce the values selected by a query of (timestamp, value) pairs to buckets as described for downsample;
+# on postgres and sqlite the buckets are computed by the database
+def downsample_query(revisions, max_points=None, resolution=None):
+    dialect_name = db.engine.dialect.name
+    if dialect_name not in ('postgresql', 'sqlite'):
+        (timestamps, values) = numeric_values(sorted(revisions))
+        return downsample(timestamps, values, max_points=max_points, resolution=resolution)
+    subquery = revisions.subquery()
+    seconds = epoch_seconds(subquery.c.timestamp)
+    value = subquery.c.value
+    if resolution:
+        origin = 0
+        bucket_count = None
+    else:
+        (first, last) = db.session.query(func.min(seconds), func.max(seconds)).one()
+        if first is None:
+            return []
+        origin = first
+        resolution = (last - first) / max_points if last > first else 1.0
+        bucket_count = max_points
+    index = _floor(dialect_name, (seconds - origin) / resolution).label('bucket_index')
+    rows = (
+        db.session.query(index, func.count(value), func.min(value), func.max(value), func.sum(value))
+        .group_by(index)
+        .order_by(index)
+    )
+    buckets = []
+    for (index, count, min_value, max_value, sum_value) in rows:
+        if bucket_count and index >= bucket_count:
+            index = bucket_count - 1  # the last timestamp falls on the end of the last bucket
+        start = origin + index * resolution
+        if buckets and buckets[-1][0] == start:
+            buckets[-1] = [start, buckets[-1][1] + count, min(buckets[-1][2], min_value), max(buckets[-1][3], max_value), buckets[-1][4] + sum_value]
+        else:
+            buckets.append([start, count, min_value, max_value, sum_value])
+    return [(start, count, min_value, max_value, sum_value / count) for (start, count, min_value, max_value, sum_value) in buckets]
+
+
+# an SQL expression for the number of seconds since the epoch of a (naive, UTC) timestamp column
+def epoch_seconds(column):
+    if db.engine.dialect.name == 'postgresql':
+        return cast(func.extract('epoch', column), Float)
+    return (func.julianday(column) - 2440587.5) * 86400.0  # sqlite stores timestamps as text
+
+
+# an SQL expression for the floor of a non-negative number
+def _floor(dialect_name, expression):
+    if dialect_name == 'postgresql':
+        return func.floor(expression)
+    return cast(expression, BigInteger)  # sqlite truncates when casting to an integer (and may not have a floor function)
+
+
+# group a numeric time series into buckets of the given length (in seconds); buckets start at origin (or are aligned to multiples
+# of the resolution if no origin is given); if bucket_count is given, later values are placed in the last bucket;
+# returns a list of [start, count, min, max, sum, last value, last timestamp] lists for the non-empty buckets
+def bucket_values(timestamps, values, resolution, origin=None, bucket_count=None):
+    if not timestamps:
+        return []
+    if origin is None:
+        origin = math.floor(timestamps[0] / resolution) * resolution
+    buckets = []
+    bucket_index = None
+    for (timestamp, value) in zip(timestamps, values):
+        index = int((timestamp - origin) // resolution)
+        if bucket_count and index >= bucket_count:
+            index = bucket_count - 1  # the last timestamp falls on the end of the last bucket
+        if index != bucket_index:
+            buckets.append([origin + index * resolution, 0, value, value, 0.0, value, timestamp])
+            bucket_index = index
+        bucket = buckets[-1]
+        bucket[1] += 1
+        if value < bucket[2]:
+            bucket[2] = value
+        if value > bucket[3]:
+            bucket[3] = value
+        bucket[4] += value
+        bucket[5] = value
+        bucket[6] = timestamp
+    return buckets
+
+
+# combine buckets (as returned by bucket_values, in ascending order) into longer buckets aligned to multiples of the resolution
+def merge_buckets(buckets, resolution):
+    merged = []
+    for (start, count, min_value, max_value, sum_value, last_value, last_timestamp) in buckets:
+        start = math.floor(start / resolution) * resolution
+        if merged and merged[-1][0] == start:
+            bucket = merged[-1]
+            bucket[1] += count
+            bucket[2] = min(bucket[2], min_value)
+            bucket[3] = max(bucket[3], max_value)
+            bucket[4] += sum_value
+            if last_timestamp >= bucket[6]:
+                bucket[5] = last_value
+                bucket[6] = last_timestamp
+        else:
+            merged.append([start, count, min_value, max_value, sum_value, last_value, last_timestamp])
+    return merged
+
+
+# convert buckets (as returned by bucket_values) into (start, count, min, max, mean) tuples
+def bucket_summaries(buckets):
+    return [(start, count, min_value, max_value, sum_value / count) for (start, count, min_value, max_value, sum_value, _, _) in buckets]
+
+
+# parse the values of a numeric sequence (stored as strings); returns lists of timestamps (in seconds since the epoch) and values,
+# skipping any values that aren't numbers
+def numeric_values(revisions):
+    timestamps = []
+    values = []
+    for (timestamp, data) in revisions:
+        value = numeric_value(data)
+        if value is not None:
+            timestamps.append(timestamp_seconds(timestamp))
+            values.append(value)
+    return (timestamps, values)
+
+
+# parse a numeric sequence value; returns None if the value isn't a (finite) number
+def numeric_value(data):
+    try:
+        value = float(data)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(value) or math.isinf(value):
+        return None
+    return value
+
+
+# get the IDs of all numeric sequences
+def numeric_sequence_ids():
+    sequences = Resource.query.with_entities(Resource.id, Resource.system_attributes).filter(Resource.type == Resource.SEQUENCE)
+    return [
+        resource_id for (resource_id, system_attributes) in sequences
+        if system_attributes and json.loads(system_attributes).get('data_type') == Resource.NUMERIC_SEQUENCE
+    ]
+
+
+# ======== aligned sequences ========
+
+
+ALIGN_METHODS = ('last', 'mean', 'nearest', 'interpolate')
+
+
+# get the values of a set of numeric sequences resampled onto a common time grid; grid is a list of times (seconds since the epoch,
+# ascending, evenly spaced by resolution); method is one of:
+#   last: the most recent value at or before each grid time
+#   mean: the mean of the values from each grid time up to (but not including) the next grid time
+#   nearest: the value closest in time to each grid time (within one resolution step)
+#   interpolate: the value linearly interpolated between the values before and after each grid time (or the last value if there are
+#       no later values); this reconstructs sequences stored with swinging door compression (use last for deadband compression)
+# the values of all the sequences are read using a few queries (regardless of the number of sequences); returns a dictionary
+# mapping resource ID to a list of values (one per grid time; None where there is no value)
+def aligned_sequence_values(resource_ids, grid, resolution, method):
+    values = {resource_id: [None] * len(grid) for resource_id in resource_ids}
+    if not resource_ids or not grid:
+        return values
+    start_timestamp = seconds_timestamp(grid[0])
+    end_timestamp = seconds_timestamp(grid[-1] + (resolution if method == 'mean' else 0))
+    in_range = (
+        ResourceRevision.resource_id.in_(resource_ids),
+        ResourceRevision.value.isnot(None),
+        ResourceRevision.timestamp >= start_timestamp,
+        ResourceRevision.timestamp < end_timestamp if method == 'mean' else ResourceRevision.timestamp <= end_timestamp,
+    )
+    if method == 'mean':
+        _aligned_means(values, in_range, grid[0], resolution)
+        return values
+
+    # for the other methods we also need the last value before the grid starts (and, for interpolation, the first value after it ends)
+    previous = _boundary_values(resource_ids, ResourceRevision.timestamp < start_timestamp, func.max)
+    following = _boundary_values(resource_ids, ResourceRevision.timestamp > end_timestamp, func.min) if method == 'interpolate' else {}
+
+    # read the values in the time range for all the sequences at once
+    revisions = (
+        db.session.query(ResourceRevision.resource_id, ResourceRevision.timestamp, ResourceRevision.value)
+        .filter(*in_range)
+        .order_by(ResourceRevision.timestamp, ResourceRevision.id)
+        .yield_per(1000)
+    )
+    samples = {resource_id: [] for resource_id in resource_ids}
+    for (resource_id, timestamp, value) in revisions:
+        samples[resource_id].append((timestamp_seconds(timestamp), value))
+    for resource_id in resource_ids:
+        if resource_id in following:
+            samples[resource_id].append(following[resource_id])
+        _align_samples(values[resource_id], grid, resolution, method, previous.get(resource_id), samples[resource_id])
+    return values
+
+
+# get the (timestamp, value) of the latest (aggregate = func.max) or earliest (aggregate = func.min) numeric value of each of the
+# given sequences that matches a timestamp condition; returns a dictionary mapping resource ID to a (seconds, value) tuple
+def _boundary_values(resource_ids, condition, aggregate):
+    boundary = (
+        db.session.query(ResourceRevision.resource_id, aggregate(ResourceRevision.timestamp).label('timestamp'))
+        .filter(ResourceRevision.resource_id.in_(resource_ids), ResourceRevision.value.isnot(None), condition)
+        .group_by(ResourceRevision.resource_id)
+        .subquery()
+    )
+    boundary_values = (
+        db.session.query(ResourceRevision.resource_id, ResourceRevision.timestamp, ResourceRevision.value)
+        .join(boundary, and_(ResourceRevision.resource_id == boundary.c.resource_id, ResourceRevision.timestamp == boundary.c.timestamp))
+    )
+    return {resource_id: (timestamp_seconds(timestamp), value) for (resource_id, timestamp, value) in boundary_values}
+
+
+# compute the mean value of each sequence in each grid interval using the database
+def _aligned_means(values, in_range, origin, resolution):
+    dialect_name = db.engine.dialect.name
+    seconds = epoch_seconds(ResourceRevision.timestamp)
+    if dialect_name in ('postgresql', 'sqlite'):
+        index = _floor(dialect_name, (seconds - origin) / resolution).label('bucket_index')
+        rows = (
+            db.session.query(ResourceRevision.resource_id, index, func.avg(ResourceRevision.value))
+            .filter(*in_range)
+            .group_by(ResourceRevision.resource_id, index)
+        )
+        for (resource_id, index, mean) in rows:
+            if 0 <= index < len(values[resource_id]):
+                values[resource_id][int(index)] = mean
+    else:
+        sums = {}
+        rows = db.session.query(ResourceRevision.resource_id, ResourceRevision.timestamp, ResourceRevision.value).filter(*in_range)
+        for (resource_id, timestamp, value) in rows:
+            key = (resource_id, int((timestamp_seconds(timestamp) - origin) // resolution))
+            (total, count) = sums.get(key, (0.0, 0))
+            sums[key] = (total + value, count + 1)
+        for ((resource_id, index), (total, count)) in sums.items():
+            if 0 <= index < len(values[resource_id]):
+                values[resource_id][index] = total / count
+
+
+# align the (timestamp, value) samples of a single sequence (in ascending order, timestamps in seconds) to a time grid using one of
+# the ALIGN_METHODS; the samples may extend beyond the grid (the last sample before the grid and, for interpolation, the first
+# sample after it are used); this is used for sequences whose values can't all be read with a single query
+def align_samples(grid, resolution, method, samples):
+    aligned = [None] * len(grid)
+    if method == 'mean':
+        sums = {}
+        for (seconds, value) in samples:
+            index = int((seconds - grid[0]) // resolution)
+            if 0 <= index < len(grid):
+                (total, count) = sums.get(index, (0.0, 0))
+                sums[index] = (total + value, count + 1)
+        for (index, (total, count)) in sums.items():
+            aligned[index] = total / count
+        return aligned
+    previous = None
+    in_range = []
+    for sample in samples:
+        if sample[0] < grid[0]:
+            previous = sample
+        elif sample[0] <= grid[-1]:
+            in_range.append(sample)
+        else:
+            if method == 'interpolate':
+                in_range.append(sample)
+            break
+    _align_samples(aligned, grid, resolution, method, previous, in_range)
+    return aligned
+
+
+# fill in the aligned values of a single sequence from its (timestamp, value) samples (in ascending order) using the last or nearest
+# method; previous is the last (timestamp, value) sample before the grid starts (or None)
+def _align_samples(aligned, grid, resolution, method, previous, samples):
+    index = 0
+    for sample in samples:
+        while index < len(grid) and grid[index] < sample[0]:
+            aligned[index] = _aligned_value(grid[index], resolution, method, previous, sample)
+            index += 1
+        previous = sample
+    while index < len(grid):
+        aligned[index] = _aligned_value(grid[index], resolution, method, previous, None)
+        index += 1
+
+
+# choose the value for a grid time given the samples before/at (previous) and after (following) it; either may be None
+def _aligned_value(grid_time, resolution, method, previous, following):
+    if method == 'last':
+        return previous[1] if previous else None
+    if method == 'interpolate':
+        if previous and following and following[0] > previous[0]:
+            return previous[1] + (following[1] - previous[1]) * (grid_time - previous[0]) / (following[0] - previous[0])
+        return previous[1] if previous else None
+    candidates = [sample for sample in (previous, following) if sample and abs(sample[0] - grid_time) <= resolution]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda sample: abs(sample[0] - grid_time))[1]
+
+
+# ======== sequence rollups ========
+
+
+# add a value to the rollups of a numeric sequence; this doesn't commit the session
+def update_sequence_rollups(resource_id, timestamp, value):
+    update_sequence_rollups_bulk([(resource_id, timestamp, value)])
+
+
+# add a list of (resource ID, timestamp, value) tuples to the rollups of numeric sequences; on postgres and sqlite this is a single
+# (multi-row) insert-or-update statement; this doesn't commit the session
+def update_sequence_rollups_bulk(values):
+    rows = []
+    for (resource_id, timestamp, value) in values:
+        seconds = timestamp_seconds(timestamp)
+        for resolution in SequenceRollup.RESOLUTIONS.values():
+            bucket_start = seconds_timestamp(math.floor(seconds / resolution) * resolution)
+            rows.append({
+                'resource_id': resource_id, 'resolution': resolution, 'timestamp': bucket_start, 'count': 1,
+                'min_value': value, 'max_value': value, 'sum_value': value, 'last_value': value, 'last_timestamp': timestamp,
+            })
+    if not rows:
+        return
+    dialect_name = db.engine.dialect.name
+    if dialect_name in ('postgresql', 'sqlite'):
+        _upsert_rollups(dialect_name, rows)
+    else:
+        for row in rows:
+            _update_rollup(row['resource_id'], row['resolution'], row['timestamp'], row['last_timestamp'], row['last_value'])
+
+
+# add values to rollup records using an insert-or-update statement (so that concurrent updates can't conflict);
+# rows is a list of dictionaries of column values for single-value rollups
+def _upsert_rollups(dialect_name, rows):
+    rollups = SequenceRollup.__table__
+    insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+    statement = insert(rollups)
+    new = statement.excluded
+    is_last = new.last_timestamp >= rollups.c.last_timestamp
+    statement = statement.on_conflict_do_update(index_elements=['resource_id', 'resolution', 'timestamp'], set_={
+        'count': rollups.c.count + 1,
+        'min_value': case((new.min_value < rollups.c.min_value, new.min_value), else_=rollups.c.min_value),
+        'max_value': case((new.max_value > rollups.c.max_value, new.max_value), else_=rollups.c.max_value),
+        'sum_value': rollups.c.sum_value + new.sum_value,
+        'last_value': case((is_last, new.last_value), else_=rollups.c.last_value),
+        'last_timestamp': case((is_last, new.last_timestamp), else_=rollups.c.last_timestamp),
+    })
+    db.session.execute(statement, rows)
+
+
+# add a value to a rollup record using the ORM (for databases without insert-or-update support)
+def _update_rollup(resource_id, resolution, bucket_start, timestamp, value):
+    rollup = SequenceRollup.query.filter(
+        SequenceRollup.resource_id == resource_id, SequenceRollup.resolution == resolution, SequenceRollup.timestamp == bucket_start).first()
+    if rollup:
+        rollup.count += 1
+        rollup.min_value = min(rollup.min_value, value)
+        rollup.max_value = max(rollup.max_value, value)
+        rollup.sum_value += value
+        if timestamp >= rollup.last_timestamp:
+            rollup.last_value = value
+            rollup.last_timestamp = timestamp
+    else:
+        db.session.add(SequenceRollup(
+            resource_id=resource_id, resolution=resolution, timestamp=bucket_start, count=1,
+            min_value=value, max_value=value, sum_value=value, last_value=value, last_timestamp=timestamp))
+
+
+# get the rollup buckets of a sequence for the given resolution (in seconds) and time range (inclusive; either end may be None);
+# returns a list of buckets in the same form as bucket_values
+def sequence_rollups(resource_id, resolution, start_timestamp=None, end_timestamp=None):
+    rollups = (
+        SequenceRollup.query
+        .with_entities(
+            SequenceRollup.timestamp, SequenceRollup.count, SequenceRollup.min_value, SequenceRollup.max_value,
+            SequenceRollup.sum_value, SequenceRollup.last_value, SequenceRollup.last_timestamp)
+        .filter(SequenceRollup.resource_id == resource_id, SequenceRollup.resolution == resolution)
+    )
+    if start_timestamp:
+        start_seconds = math.floor(timestamp_seconds(start_timestamp) / resolution) * resolution  # include the bucket containing the start
+        rollups = rollups.filter(SequenceRollup.timestamp >= seconds_timestamp(start_seconds))
+    if end_timestamp:
+        rollups = rollups.filter(SequenceRollup.timestamp <= end_timestamp)
+    return [
+        [timestamp_seconds(timestamp), count, min_value, max_value, sum_value, last_value, timestamp_seconds(last_timestamp)]
+        for (timestamp, count, min_value, max_value, sum_value, last_value, last_timestamp) in rollups.order_by(SequenceRollup.timestamp)
+    ]
+
+
+# replace the rollups of a numeric sequence in a time range (or all of its rollups if no range is given) with rollups computed from
+# the given values (timestamps in seconds since the epoch, in ascending order; values outside the range are ignored); the range
+# should be aligned to days (the longest rollup resolution); returns the number of rollup records created; this doesn't commit the session
+def replace_sequence_rollups(resource_id, timestamps, values, start_timestamp=None, end_timestamp=None):
+    rollups = SequenceRollup.query.filter(SequenceRollup.resource_id == resource_id)
+    if start_timestamp:
+        rollups = rollups.filter(SequenceRollup.timestamp >= start_timestamp)
+    if end_timestamp:
+        rollups = rollups.filter(SequenceRollup.timestamp < end_timestamp)
+    rollups.delete(synchronize_session=False)
+    if start_timestamp or end_timestamp:
+        start = timestamp_seconds(start_timestamp) if start_timestamp else -math.inf
+        end = timestamp_seconds(end_timestamp) if end_timestamp else math.inf
+        in_range = [(timestamp, value) for (timestamp, value) in zip(timestamps, values) if start <= timestamp < end]
+        (timestamps, values) = ([timestamp for (timestamp, _) in in_range], [value for (_, value) in in_range])
+    rollup_count = 0
+    for resolution in SequenceRollup.RESOLUTIONS.values():
+        buckets = bucket_values(timestamps, values, resolution)
+        db.session.bulk_insert_mappings(SequenceRollup, [{
+            'resource_id': resource_id,
+            'resolution': resolution,
+            'timestamp': seconds_timestamp(start),
+            'count': count,
+            'min_value': min_value,
+            'max_value': max_value,
+            'sum_value': sum_value,
+            'last_value': last_value,
+            'last_timestamp': seconds_timestamp(last_timestamp),
+        } for (start, count, min_value, max_value, sum_value, last_value, last_timestamp) in buckets])
+        rollup_count += len(buckets)
+    return rollup_count
+
+
+# replace rollup buckets of a numeric sequence after some of its stored values changed; minute_buckets maps the start (in seconds)
+# of each affected minute bucket to its new bucket (as returned by bucket_values) or None if the bucket is now empty; the hour and
+# day buckets containing them are then recomputed from the finer rollups (rather than from stored values), so only the affected
+# records are read and written; returns the number of rollup records written; this doesn't commit the session
+def replace_rollup_buckets(resource_id, minute_buckets):
+    write_count = 0
+    (buckets, child_resolution) = (minute_buckets, None)
+    for resolution in sorted(SequenceRollup.RESOLUTIONS.values()):
+        if child_resolution:
+            starts = sorted({math.floor(start / resolution) * resolution for start in buckets})
+            buckets = {}
+            for start in starts:
+                children = sequence_rollups(
+                    resource_id, child_resolution, seconds_timestamp(start), seconds_timestamp(start + resolution - child_resolution))
+                merged = merge_buckets(children, resolution)
+                buckets[start] = merged[0] if merged else None
+        for (start, bucket) in buckets.items():
+            SequenceRollup.query.filter(
+                SequenceRollup.resource_id == resource_id, SequenceRollup.resolution == resolution,
+                SequenceRollup.timestamp == seconds_timestamp(start)).delete(synchronize_session=False)
+            if bucket:
+                (_, count, min_value, max_value, sum_value, last_value, last_timestamp) = bucket
+                db.session.add(SequenceRollup(
+                    resource_id=resource_id, resolution=resolution, timestamp=seconds_timestamp(start), count=count, min_value=min_value,
+                    max_value=max_value, sum_value=sum_value, last_value=last_value, last_timestamp=seconds_timestamp(last_timestamp)))
+            write_count += 1
+        db.session.flush()  # so that the coarser buckets can be computed from these
+        child_resolution = resolution
+    return write_count
+
+
+# ======== tiered retention ========
+# a numeric sequence can keep its raw values for a limited time and its minute/hour/day rollups for longer; the retention
+# system attribute maps tier names to a number of days (tiers that aren't listed are kept indefinitely), e.g. {"raw": 30,
+# "minute": 365} keeps raw values for 30 days, minute rollups for a year, and hour and day rollups indefinitely; old values
+# are removed by the sequence retention worker and reads of older time ranges use the finest tier still available
+
+
+RETENTION_TIERS = ('raw', 'minute', 'hour', 'day')
+
+
+# get the retention tiers of a sequence from its system attributes; returns None if the sequence keeps all of its history
+def retention_settings(system_attributes):
+    retention = system_attributes.get('retention')
+    return retention if isinstance(retention, dict) and retention else None
+
+
+# get the time before which each tier of a sequence's history is removed (None for tiers kept indefinitely);
+# the times are aligned to days so that each day's values are either all raw or all rolled up
+def retention_cutoffs(retention, now=None):
+    now = now or datetime.datetime.utcnow()
+    today = datetime.datetime(now.year, now.month, now.day)
+    return {tier: today - datetime.timedelta(days=retention[tier]) if retention.get(tier) is not None else None for tier in RETENTION_TIERS}
+
+
+# get the rollups of a sequence in a time range using the finest retained rollup tier (no finer than the given resolution) for each
+# part of the range; returns a list of buckets (as returned by sequence_rollups) in ascending order; buckets from different tiers
+# have different lengths, so callers will typically combine them using merge_buckets
+def tiered_rollups(resource_id, retention, resolution, start_timestamp=None, end_timestamp=None, now=None):
+    cutoffs = retention_cutoffs(retention, now)
+    buckets = []
+    for tier in RETENTION_TIERS[1:]:
+        tier_resolution = SequenceRollup.RESOLUTIONS[tier]
+        if tier_resolution < resolution:
+            continue
+        cutoff = cutoffs[tier]
+        segment_start = start_timestamp if cutoff is None or (start_timestamp and start_timestamp > cutoff) else cutoff
+        if not end_timestamp or not segment_start or segment_start <= end_timestamp:
+            buckets = sequence_rollups(resource_id, tier_resolution, segment_start, end_timestamp) + buckets
+        if cutoff is None or (start_timestamp and start_timestamp >= cutoff):
+            break
+        end_timestamp = cutoff - datetime.timedelta(microseconds=1)  # the next (coarser) tier covers the time before this one
+    return buckets
+
+
+# ======== sequence compression ========
+
+
+COMPRESSION_TYPES = ('deadband', 'swinging_door')
+
+
+# get the compression settings of a numeric sequence from its system attributes; returns a (type, deviation, percent) tuple
+# or None if the sequence isn't compressed; if percent is True, the deviation is a percentage of the segment's starting value
+def compression_settings(system_attributes):
+    compression = system_attributes.get('compression')
+    if compression not in COMPRESSION_TYPES:
+        return None
+    return (compression, float(system_attributes.get('compression_deviation', 0)), bool(system_attributes.get('compression_percent', False)))
+
+
+# decide whether to store a new value of a compressed sequence; we always store the newest value, but while values fit within the
+# current segment, each new value replaces the previous one (the segment's provisional end point) rather than adding a record:
+#   deadband: a segment continues while values stay within the deviation of its starting value (reconstruct by holding each value)
+#   swinging_door: a segment continues while a line from its start to the new value passes within the deviation of all values
+#       in between (reconstruct by linear interpolation)
+# state is the compression state after the previous value (or None if unknown, e.g. after a restart, in which case a
+# new segment is started); returns a (replace, new state) tuple where replace is True if the new value should replace the previous one
+def compress_value(settings, state, seconds, value):
+    (compression, deviation, percent) = settings
+    if state and seconds > state['start'][0]:
+        (start_seconds, start_value) = state['start']
+        if percent:
+            deviation = abs(start_value) * settings[1] / 100.0
+        if compression == 'deadband':
+            if abs(value - start_value) <= deviation:
+                return (state['end'] is not None, dict(state, end=[seconds, value]))
+            return (False, {'start': [seconds, value], 'end': None})
+        slope = (value - start_value) / (seconds - start_seconds)
+        if state['lower'] <= slope <= state['upper']:
+            return (state['end'] is not None, {
+                'start': state['start'],
+                'end': [seconds, value],
+                'lower': max(state['lower'], (value - deviation - start_value) / (seconds - start_seconds)),
+                'upper': min(state['upper'], (value + deviation - start_value) / (seconds - start_seconds)),
+            })
+        if state['end'] is not None and seconds > state['end'][0]:  # start a new segment at the end of the previous one
+            (start_seconds, start_value) = state['end']
+            if percent:
+                deviation = abs(start_value) * settings[1] / 100.0
+            return (False, {
+                'start': [start_seconds, start_value],
+                'end': [seconds, value],
+                'lower': (value - deviation - start_value) / (seconds - start_seconds),
+                'upper': (value + deviation - start_value) / (seconds - start_seconds),
+            })
+    if compression == 'deadband':
+        return (False, {'start': [seconds, value], 'end': None})
+    return (False, {'start': [seconds, value], 'end': None, 'lower': -math.inf, 'upper': math.inf})
@@ -10,8 +10,9 @@ from io import StringIO
 from flask import render_template, request, abort, Response, send_from_directory, current_app
 from flask_login import current_user
 from jinja2.exceptions import TemplateNotFound
-from sqlalchemy import func, not_
-from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
+from sqlalchemy import func, not_, or_, and_
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.exc import NoResultFound
 
 
 # internal imports
@@ -19,7 +20,9 @@ from main.app import app, db, extensions
 from main.util import ssl_required
 from main.resources.models import Resource, ResourceRevision, ResourceView
 from main.resources.models import Thumbnail
-from main.resources.resource_util import read_resource, find_resource, mime_type_from_ext
+from main.resources.sequence_util import timestamp_seconds, downsample, downsample_query
+from main.resources.sequence_chunks import may_have_chunks, latest_sequence_values
+from main.resources.resource_util import read_resource, find_resource, find_resource_chain, mime_type_from_ext, cached_sequence_value
 from main.users.permissions import access_level, ACCESS_LEVEL_READ, ACCESS_LEVEL_WRITE
 from main.resources.file_conversion import process_doc_page, compute_thumbnail
 
@@ -66,27 +69,18 @@ def view_item(item_path):
         print('warning: make sure running with websockets enabled')
         abort(403)
 
-    # traverse path parts left-to-right
+    # look up all resources along the path (in a single query) and then traverse path parts left-to-right
     # fix(clean): this whole process can probably be simplified
+    chain = find_resource_chain(full_path)
+    if chain is None:
+        print('multiple results for %s' % item_path)
+        abort(404)
     parent_folder = None
     path_parts = item_path.split('/')
     for (index, path_part) in enumerate(path_parts):
 
         # check to see if the item is a folder
-        folder = None
-        if parent_folder:
-            try:
-                folder = Resource.query.filter(Resource.parent == parent_folder, Resource.name == path_part, not_(Resource.deleted)).one()
-            except NoResultFound:
-                pass
-            except MultipleResultsFound:
-                print('multiple results for %s at level %s' % (item_path, path_part))
-                abort(404)
-        else:
-            try:
-                folder = Resource.query.filter(Resource.parent_id.is_(None), Resource.name == path_part, not_(Resource.deleted)).one()
-            except NoResultFound:
-                pass
+        folder = chain[index] if index < len(chain) else None
 
         # if it is a folder
         if folder and folder.type < 20 and folder.type != Resource.REMOTE_FOLDER:
@@ -112,11 +106,10 @@ def view_item(item_path):
                 print('not a folder and no parent (%s)' % full_path)
                 abort(403)
 
-            # look up resource record
-            # fix(faster): we just looked this up above
-            try:
-                resource = Resource.query.filter(Resource.parent_id == parent_folder.id, Resource.name == path_part, not_(Resource.deleted)).one()
-            except NoResultFound:
+            # use the resource record we found above (if any)
+            if folder:
+                resource = folder
+            else:
                 path_part = path_part.replace('_', ' ')  # fix(soon): how else should we handle spaces in resource names?
                 try:
                     resource = (
@@ -179,18 +172,29 @@ def folder_viewer(folder, full_path, user_access_level):
     # resources
     resources = Resource.query.filter(Resource.parent == folder, not_(Resource.deleted)).order_by('name')
     resource_dicts = []
+    last_value_dicts = {}  # last revision ID -> resource dictionary
     for r in resources:
         rd = r.as_dict(extended=True)
-        if r.type == Resource.SEQUENCE and r.last_revision_id:  # if sequence type, get last value (if any)
+        if r.type == Resource.SEQUENCE:  # if sequence type, get last value (if any)
             data_type = rd['system_attributes']['data_type']
             if data_type == Resource.NUMERIC_SEQUENCE or data_type == Resource.TEXT_SEQUENCE:
-                try:
-                    rr = ResourceRevision.query.filter(ResourceRevision.id == r.last_revision_id).one()
-                    rd['last_value'] = rr.data.decode()
-                except NoResultFound:
-                    pass
+                value = cached_sequence_value(r)
+                if value is not None:
+                    rd['last_value'] = value
+                elif r.last_revision_id:
+                    last_value_dicts[r.last_revision_id] = rd
         resource_dicts.append(rd)
 
+    # get the last values of all the sequences with a single query
+    if last_value_dicts:
+        revisions = (
+            ResourceRevision.query
+            .with_entities(ResourceRevision.id, ResourceRevision.data)
+            .filter(ResourceRevision.id.in_(list(last_value_dicts)))
+        )
+        for (revision_id, data) in revisions:
+            last_value_dicts[revision_id]['last_value'] = data.decode()
+
     # get view preferences if any
     if current_user.is_authenticated:
         try:
@@ -214,33 +218,43 @@ def folder_viewer(folder, full_path, user_access_level):
     )
 
 
-# recursively gather information about a folder for a tree view
-def folder_tree_info(prefix, folder):
-    infos = []
-    name = prefix + '/' + folder.name if prefix else folder.name
-    file_count = (
+# gather information about a folder and its sub-folders for a tree view; returns a list of folder paths (relative to the
+# parent of the given folder) and file counts, with each folder listed after its sub-folders
+def folder_tree_info(folder):
+
+    # get the folders in the sub-tree along with the number of (non-basic-folder) resources in each, using a single query
+    child = aliased(Resource)
+    folders = (
         db.session
-        .query(func.count(Resource.id))
-        .filter(Resource.parent_id == folder.id, not_(Resource.deleted), Resource.type != Resource.BASIC_FOLDER)
-        .scalar()
+        .query(Resource.id, Resource.parent_id, Resource.name, func.count(child.id))
+        .outerjoin(child, and_(child.parent_id == Resource.id, not_(child.deleted), child.type != Resource.BASIC_FOLDER))
+        .filter(or_(Resource.id == folder.id, and_(folder.descendent_condition(), Resource.type == Resource.BASIC_FOLDER)))
+        .filter(not_(Resource.deleted))
+        .group_by(Resource.id, Resource.parent_id, Resource.name)
+        .order_by(Resource.name)
     )
-    child_folders = (
-        Resource.query
-        .filter(Resource.parent_id == folder.id, not_(Resource.deleted), Resource.type == Resource.BASIC_FOLDER)
-        .order_by('name')
-    )
-    for child in child_folders:
-        infos += folder_tree_info(name, child)
-    infos.append({'name': name, 'fileCount': file_count})
+    child_folders = {}
+    file_counts = {}
+    for (folder_id, parent_id, name, file_count) in folders:
+        child_folders.setdefault(parent_id, []).append((folder_id, name))
+        file_counts[folder_id] = file_count
+
+    # assemble the tree (skipping folders inside deleted folders)
+    infos = []
+    pending = [(folder.id, folder.name, False)]
+    while pending:
+        (folder_id, name, children_added) = pending.pop()
+        if children_added:
+            infos.append({'name': name, 'fileCount': file_counts.get(folder_id, 0)})
+        else:
+            pending.append((folder_id, name, True))
+            pending += [(child_id, name + '/' + child_name, False) for (child_id, child_name) in reversed(child_folders.get(folder_id, []))]
     return infos
 
 
 # view a sub-folders in a tree form
 def folder_tree_viewer(folder):
-    print('folder tree')
-    start_time = time.time()
-    infos = folder_tree_info('', folder)
-    print('time: %.2f' % (time.time() - start_time))
+    infos = folder_tree_info(folder)
     return render_template(
         'resources/folder-tree.html',
         folder_tree=json.dumps(infos),
@@ -259,26 +273,53 @@ def system_app_viewer(resource):
 # a viewer for sequences (time series)
 def sequence_viewer(resource):
 
-    # decide how many data points to show
+    # decide how many data points to show (the page's history table shows up to 200 values; numeric sequences are also plotted
+    # using a chart-sized set of buckets summarizing their last 5000 values)
     system_attributes = json.loads(resource.system_attributes)
     data_type = system_attributes['data_type']
-    if data_type == Resource.NUMERIC_SEQUENCE:
-        history_count = 5000
-    elif data_type == Resource.TEXT_SEQUENCE:
+    if data_type == Resource.TEXT_SEQUENCE:
         history_count = 500
-    elif data_type == Resource.IMAGE_SEQUENCE:
+    else:
         history_count = 200
+    chart_count = 5000
+    chart_points = 1000
+
+    # get recent values (with descending timestamps); values of sequences with chunked storage are read from both chunks and
+    # revision records
+    if may_have_chunks(system_attributes):
+        resource_revisions = []
+        recent_values = latest_sequence_values(resource.id, history_count)
+        recent_values.reverse()
+        timestamps = [timestamp_seconds(timestamp) for (timestamp, _, _) in recent_values]
+        values = [value_text for (_, _, value_text) in recent_values]
+    else:
+        resource_revisions = list(
+            ResourceRevision.query
+            .filter(ResourceRevision.resource_id == resource.id)
+            .order_by(ResourceRevision.timestamp.desc())[:history_count]
+        )
+        epoch = datetime.datetime.utcfromtimestamp(0)
+        # fix(clean): use some sort of unzip function
+        timestamps = [(rr.timestamp.replace(tzinfo=None) - epoch).total_seconds() for rr in resource_revisions]
+        values = [rr.data.decode() for rr in resource_revisions]
+    # get bucket averages of recent values for the plot (the database computes the buckets unless the sequence has chunked storage)
+    chart_buckets = []
+    if data_type == Resource.NUMERIC_SEQUENCE:
+        if may_have_chunks(system_attributes):
+            chart_values = latest_sequence_values(resource.id, chart_count, numeric_only=True)
+            chart_buckets = downsample(
+                [timestamp_seconds(timestamp) for (timestamp, _, _) in chart_values], [value for (_, value, _) in chart_values],
+                max_points=chart_points)
+        else:
+            chart_revisions = (
+                ResourceRevision.query
+                .with_entities(ResourceRevision.timestamp, ResourceRevision.value)
+                .filter(ResourceRevision.resource_id == resource.id, ResourceRevision.value.isnot(None))
+                .order_by(ResourceRevision.timestamp.desc(), ResourceRevision.id.desc())
+                .limit(chart_count)
+            )
+            chart_buckets = downsample_query(chart_revisions, max_points=chart_points)
 
-    # get recent resource revisions (with ascending timestamps)
-    resource_revisions = list(
-        ResourceRevision.query
-        .filter(ResourceRevision.resource_id == resource.id)
-        .order_by(ResourceRevision.timestamp.desc())[:history_count]
-    )
-    epoch = datetime.datetime.utcfromtimestamp(0)
-    # fix(clean): use some sort of unzip function
-    timestamps = [(rr.timestamp.replace(tzinfo=None) - epoch).total_seconds() for rr in resource_revisions]
-    values = [rr.data.decode() for rr in resource_revisions]
     thumbnail_revs = []
     full_image_revs = []
     resource_path = resource.path()
@@ -307,6 +348,8 @@ def sequence_viewer(resource):
         thumbnail_resource_path=thumbnail_resource_path,
         timestamps=json.dumps(timestamps),
         values=json.dumps(values),
+        chart_timestamps=json.dumps([bucket[0] for bucket in chart_buckets]),
+        chart_values=json.dumps([bucket[4] for bucket in chart_buckets]),
         thumbnail_revs=json.dumps(thumbnail_revs),
         full_image_revs=json.dumps(full_image_revs),
     )
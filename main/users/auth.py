@@ -1,10 +1,12 @@
 # standard python imports
+import hmac
 import time  # fix(clean): remove
 import random
 import string
 import base64
 import hashlib
 import datetime
+import threading
 
 
 # external imports
@@ -15,7 +17,7 @@ from sqlalchemy.orm.exc import NoResultFound
 
 
 # internal imports
-from main.app import db
+from main.app import db, key_cache
 from main.app import login_manager
 from main.users.models import User, Key, OrganizationUser
 from main.util import load_server_config  # fix(clean): remove?
@@ -126,8 +128,64 @@ def create_key(creation_user_id, organization_id, access_as_user_id, access_as_c
     return (key, key_text)
 
 
-# find a key record from the database given the raw key string
+# find a key record from the database given the raw key string;
+# verified keys are cached (by a keyed hash of the key text) so that we don't need to hash and check the key on every request
 def find_key(key_text):
+    digest = key_cache_digest(key_text)
+    key = _cached_key(digest)
+    if key:
+        return key
+
+    # make concurrent first-time lookups of the same key wait for a single verification (bcrypt checks are slow)
+    with _key_locks_lock:
+        (lock, user_count) = _key_locks.get(digest, (threading.Lock(), 0))
+        _key_locks[digest] = (lock, user_count + 1)
+    try:
+        with lock:
+            key = _cached_key(digest)  # another thread may have verified the key while we were waiting
+            if not key:
+                key = verify_key(key_text)
+                if key:
+                    key_cache.set(digest, key.id, [key.id])
+    finally:
+        with _key_locks_lock:
+            (lock, user_count) = _key_locks[digest]
+            if user_count > 1:
+                _key_locks[digest] = (lock, user_count - 1)
+            else:
+                del _key_locks[digest]
+    return key
+
+
+# locks used to coalesce concurrent verifications of the same key: digest -> (lock, number of threads using the lock)
+_key_locks = {}
+_key_locks_lock = threading.Lock()
+
+
+# get a key record using a cached key ID; returns None if the key isn't cached or has since been revoked/deleted
+def _cached_key(digest):
+    key_id = key_cache.get(digest)
+    if key_id is None:
+        return None
+    key = Key.query.get(key_id)  # a primary key lookup; this also lets us check that the key hasn't been revoked by another process
+    if not key or key.revocation_timestamp:
+        key_cache.remove(digest)
+        key = None
+    return key
+
+
+# compute the cache key for a raw key string; this is keyed with the server's secret key so that the cache doesn't hold
+# anything that could be used to check a guessed key
+def key_cache_digest(key_text):
+    try:
+        secret = current_app.config['SECRET_KEY']
+    except RuntimeError:  # handle case that we're running outside app
+        secret = load_server_config()['SECRET_KEY']
+    return hmac.new(secret.encode(), key_text.encode(), hashlib.sha256).hexdigest()
+
+
+# find a key record by checking the raw key string against the stored hashes
+def verify_key(key_text):
     key_part = key_text[:3] + key_text[-3:]
     iph = inner_password_hash(key_text)
     for key in Key.query.filter(Key.key_part == key_part, Key.revocation_timestamp.is_(None)):
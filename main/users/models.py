@@ -1,4 +1,5 @@
-from main.app import db
+from sqlalchemy import event
+from main.app import db, organization_name_cache
 from flask_login import UserMixin
 
 
@@ -112,3 +113,11 @@ class OrganizationUser(db.Model):
             'user_id': self.user_id,
             'is_admin': self.is_admin,
         }
+
+
+# clear the cached organization names of a user when the user's memberships change
+@event.listens_for(OrganizationUser, 'after_insert')
+@event.listens_for(OrganizationUser, 'after_update')
+@event.listens_for(OrganizationUser, 'after_delete')
+def organization_user_changed(mapper, connection, org_user):  # pylint: disable=unused-argument
+    organization_name_cache.remove(org_user.user_id)
@@ -1,4 +1,5 @@
-from flask import request
+import time
+from flask import request, g
 from flask_login import current_user
 from sqlalchemy import not_
 from sqlalchemy.orm.exc import NoResultFound
@@ -21,23 +22,61 @@ ACCESS_TYPE_USER = 130
 ACCESS_TYPE_CONTROLLER = 140
 
 
-# provides the maximum access level of the current (or given) user to an object with the given permission string;
-# returns one of [ACCESS_LEVEL_NONE, ACCESS_LEVEL_READ, ACCESS_LEVEL_WRITE]
-# (currently admin access is handled by separate org user records)
-def access_level(permissions, controller_id=None):
+# how long (in seconds) a request's principal is reused; this matters for long-lived (websocket) requests
+PRINCIPAL_MAX_AGE = 60
+
+
+# The Principal class holds the identity of an API/web client (user and/or controller) along with the organizations
+# the client belongs to, so that permission records can be checked without additional database queries.
+class Principal(object):
+
+    # look up the organization memberships of the given user and/or controller
+    def __init__(self, user_id=None, controller_id=None, key=None, is_system_admin=False):
+        self.user_id = user_id
+        self.controller_id = controller_id
+        self.key = key
+        self.is_system_admin = is_system_admin
+        self.creation_time = time.time()
+
+        # get the organizations the user belongs to
+        self.organization_ids = set()
+        if user_id:
+            org_users = OrganizationUser.query.with_entities(OrganizationUser.organization_id).filter(OrganizationUser.user_id == user_id)
+            self.organization_ids = {organization_id for (organization_id,) in org_users}
+
+        # get the organization the controller belongs to
+        self.controller_found = False
+        self.controller_organization_id = None
+        if controller_id:
+            try:
+                controller = Resource.query.filter(Resource.id == controller_id, not_(Resource.deleted)).one()
+                self.controller_found = True
+                # fix(soon): remove this after all resources have org ids
+                self.controller_organization_id = controller.organization_id if controller.organization_id else controller.root().id
+            except NoResultFound:
+                pass
+
+
+# get the principal (user/controller identity) for the current request; this is computed once per request (using the current
+# user and/or the API key provided as the HTTP basic auth password) and reused by subsequent access checks;
+# if controller_id is specified, the principal is that controller (along with the current user, if any)
+def request_principal(controller_id=None):
+    principals = g.setdefault('principals', {})
+    principal_key = controller_id
+    principal = principals.get(principal_key)
+
+    # websocket connections keep the same request context for a long time, so we periodically refresh the principal
+    if principal and time.time() - principal.creation_time < PRINCIPAL_MAX_AGE:
+        return principal
 
     # determine current user (if any)
     # fix(soon): handle API auth with key as user if not handled elsewhere
     user_id = current_user.id if current_user.is_authenticated else None
-
-    # handle system admin
-    # fix(soon): require that system admins explicitly add themselves to orgs
-    if user_id and current_user.role == current_user.SYSTEM_ADMIN:
-        return ACCESS_LEVEL_WRITE
+    is_system_admin = bool(user_id and current_user.role == current_user.SYSTEM_ADMIN)
 
     # determine current API client (if any)
+    key = None
     if not controller_id:
-        key = None
         if request.authorization:
             key = find_key(request.authorization.password)  # key is provided as HTTP basic auth password
         if key:
@@ -45,6 +84,23 @@ def access_level(permissions, controller_id=None):
                 controller_id = key.access_as_controller_id
             elif key.access_as_user_id:
                 user_id = key.access_as_user_id
+    principal = Principal(user_id, controller_id, key, is_system_admin)
+    principals[principal_key] = principal
+    return principal
+
+
+# provides the maximum access level of the current (or given) user to an object with the given permission string;
+# returns one of [ACCESS_LEVEL_NONE, ACCESS_LEVEL_READ, ACCESS_LEVEL_WRITE]
+# (currently admin access is handled by separate org user records)
+def access_level(permissions, controller_id=None):
+    principal = request_principal(controller_id)
+
+    # handle system admin
+    # fix(soon): require that system admins explicitly add themselves to orgs
+    if principal.is_system_admin:
+        return ACCESS_LEVEL_WRITE
+    user_id = principal.user_id
+    controller_id = principal.controller_id
 
     # start with no access
     client_access_level = ACCESS_LEVEL_NONE
@@ -59,26 +115,16 @@ def access_level(permissions, controller_id=None):
 
         # applies if current user is contained within the organization given by the permission ID
         elif permission_type == ACCESS_TYPE_ORG_USERS:
-            if user_id:
-                try:
-                    OrganizationUser.query.filter(OrganizationUser.user_id == user_id, OrganizationUser.organization_id == principal_id).one()
-                    client_access_level = max(client_access_level, level)
-                    break
-                except NoResultFound:
-                    pass
+            if user_id and principal_id in principal.organization_ids:
+                client_access_level = max(client_access_level, level)
+                break
 
         # applies if current controller is contained within the organization given by the permission ID
         elif permission_type == ACCESS_TYPE_ORG_CONTROLLERS:
-            if controller_id:
-                try:
-                    controller = Resource.query.filter(Resource.id == controller_id, not_(Resource.deleted)).one()
-                    # fix(soon): remove this after all resources have org ids
-                    controller_org_id = controller.organization_id if controller.organization_id else controller.root().id
-                    if controller_org_id == principal_id:
-                        client_access_level = max(client_access_level, level)
-                    break
-                except NoResultFound:
-                    pass
+            if controller_id and principal.controller_found:
+                if principal.controller_organization_id == principal_id:
+                    client_access_level = max(client_access_level, level)
+                break
 
         # applies if permission ID is the same as current user ID
         elif permission_type == ACCESS_TYPE_USER:
@@ -11,7 +11,7 @@ from flask_login import login_required, login_user, logout_user, current_user
 
 
 # internal imports
-from main.app import app, db
+from main.app import app, db, organization_name_cache
 from main.users.models import User, AccountRequest, OrganizationUser
 from main.resources.models import Resource
 from main.users.auth import login_validate, create_user, change_user_password, make_code
@@ -32,13 +32,30 @@ def before_request():
         g.user = current_user
         g.organization_names = []
         if hasattr(g.user, 'id'):
-            org_users = OrganizationUser.query.filter(OrganizationUser.user_id == g.user.id)
-            for org_user in org_users:
-                org_resource = org_user.organization
-                g.organization_names.append({
-                    'full_name': json.loads(org_resource.system_attributes)['full_name'] if org_resource.system_attributes else org_resource.name,
-                    'folder_name': org_resource.name,
-                })
+            g.organization_names = organization_names(g.user.id)
+
+
+# get names of the organizations to which the given user belongs (for the navigation menu); the result is cached
+# and should not be modified
+def organization_names(user_id):
+    names = organization_name_cache.get(user_id)
+    if names is None:
+        names = []
+        org_ids = []
+        orgs = (
+            db.session.query(Resource.id, Resource.name, Resource.system_attributes)
+            .join(OrganizationUser, OrganizationUser.organization_id == Resource.id)
+            .filter(OrganizationUser.user_id == user_id)
+            .order_by(OrganizationUser.id)
+        )
+        for (org_id, name, system_attributes) in orgs:
+            names.append({
+                'full_name': json.loads(system_attributes)['full_name'] if system_attributes else name,
+                'folder_name': name,
+            })
+            org_ids.append(org_id)
+        organization_name_cache.set(user_id, names, org_ids)
+    return names
 
 
 # display a sign-in form or handle the form being posted
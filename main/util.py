@@ -41,6 +41,26 @@ def parse_json_datetime(json_timestamp):
     return datetime.datetime.strptime(json_timestamp, format_str)
 
 
+# get a tzinfo object for a time zone name (e.g. 'US/Pacific'); returns None if the time zone isn't known;
+# uses zoneinfo (python 3.9+) or pytz (if installed) for older versions of python
+def find_time_zone(name):
+    try:
+        from zoneinfo import ZoneInfo
+    except ImportError:
+        try:
+            import pytz
+        except ImportError:
+            return None
+        try:
+            return pytz.timezone(name)
+        except pytz.UnknownTimeZoneError:
+            return None
+    try:
+        return ZoneInfo(name)
+    except (KeyError, ValueError):  # ZoneInfoNotFoundError is a KeyError
+        return None
+
+
 # get the current server configuration module (for use when current_app isn't available)
 # fix(soon): try to remove this; can probably use current_app.config in most places
 def load_server_config():
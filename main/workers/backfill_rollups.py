@@ -0,0 +1,45 @@
+import json
+import heapq
+from main.app import db
+from main.resources.models import Resource, ResourceRevision, SequenceChunk
+from main.resources.sequence_util import numeric_values, numeric_sequence_ids, replace_sequence_rollups, seconds_timestamp
+from main.resources.sequence_util import retention_settings, retention_cutoffs
+from main.resources.sequence_chunks import chunk_values
+
+
+# (re)build the rollups of all numeric sequences from their stored values (run migrate_db first so that revision values are filled in);
+# values stored while this is running for a given sequence may be counted twice, so this is best run when ingest is quiet
+def backfill_rollups():
+    sequence_ids = numeric_sequence_ids()
+    for (index, resource_id) in enumerate(sequence_ids):
+        rollup_count = backfill_sequence_rollups(resource_id)
+        print('sequence %d of %d (id: %d): %d rollups' % (index + 1, len(sequence_ids), resource_id, rollup_count))
+
+
+# rebuild the rollups of a single numeric sequence; returns the number of rollup records created
+def backfill_sequence_rollups(resource_id):
+    revisions = (
+        ResourceRevision.query
+        .with_entities(ResourceRevision.timestamp, ResourceRevision.value)
+        .filter(ResourceRevision.resource_id == resource_id, ResourceRevision.value.isnot(None))
+        .order_by(ResourceRevision.timestamp, ResourceRevision.id)
+        .yield_per(10000)
+    )
+    if SequenceChunk.query.filter(SequenceChunk.resource_id == resource_id).count():
+        revisions = heapq.merge(((timestamp, value) for (timestamp, value, _) in chunk_values(resource_id)), revisions, key=lambda item: item[0])
+    (timestamps, values) = numeric_values(revisions)
+
+    # if the sequence's older raw values have been removed (see tiered retention), keep the rollups for that time
+    start_timestamp = None
+    retention = retention_settings(json.loads(Resource.query.filter(Resource.id == resource_id).one().system_attributes))
+    if retention:
+        start_timestamp = retention_cutoffs(retention)['raw']
+        if timestamps and start_timestamp:
+            start_timestamp = max(start_timestamp, seconds_timestamp(timestamps[0] // 86400 * 86400))
+    rollup_count = replace_sequence_rollups(resource_id, timestamps, values, start_timestamp)
+    db.session.commit()
+    return rollup_count
+
+
+if __name__ == '__main__':
+    backfill_rollups()
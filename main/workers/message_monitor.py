@@ -1,5 +1,6 @@
 # standard library imports
 import json
+import time
 import datetime
 
 
@@ -8,13 +9,13 @@ import paho.mqtt.client as mqtt
 
 
 # internal imports
-from main.app import db
+from main.app import db, path_cache
 from main.workers.util import worker_log
 from main.util import load_server_config, parse_json_datetime
 from main.users.auth import message_auth_token
 from main.messages.outgoing_messages import handle_send_email, handle_send_text_message
 from main.resources.models import Resource, ControllerStatus
-from main.resources.resource_util import find_resource, update_sequence_value
+from main.resources.resource_util import find_resource, update_sequence_value, update_sequence_values
 
 
 # this worker monitors MQTT messages for ones that need to be acted upon by the server
@@ -38,10 +39,17 @@ def message_monitor():
         client.subscribe('#')  # subscribe to all messages
 
     # run this on message
+    last_log_time = [time.time()]  # single-element list to allow modification inside on_message
+
     def on_message(client, userdata, msg):
         # pylint: disable=unused-argument
         payload = msg.payload.decode()
 
+        # once an hour, log path cache statistics (most of our path lookups are for incoming sequence values)
+        if time.time() - last_log_time[0] > 60 * 60:
+            worker_log('message_monitor', 'path cache: %s' % json.dumps(path_cache.stats()))
+            last_log_time[0] = time.time()
+
         # handle full (JSON) messages
         if payload.startswith('{'):
             message_struct = json.loads(payload)
@@ -56,14 +64,16 @@ def message_monitor():
                             timestamp = parse_json_datetime(timestamp)  # fix(soon): handle conversion errors
                         else:
                             timestamp = datetime.datetime.utcnow()
+                        updates = []
                         for name, value in parameters.items():
                             if name != '$t':
                                 seq_name = '/' + msg.topic + '/' + name
                                 resource = find_resource(seq_name)
                                 if resource:
-                                    # don't emit new message since UI will receive this message
-                                    update_sequence_value(resource, seq_name, timestamp, value, emit_message=False)
-                                    db.session.commit()
+                                    updates.append((resource, seq_name, str(value)))
+                        # don't emit new message since UI will receive this message
+                        update_sequence_values(updates, timestamp, emit_message=False)
+                        db.session.commit()
 
                 # update controller watchdog status
                 elif message_type == 'watchdog':
@@ -1,15 +1,100 @@
-from sqlalchemy import func
+import sqlalchemy
+from sqlalchemy import func, text, bindparam
 from main.app import db
-from main.resources.models import Resource
+from main.resources.models import Resource, ResourceRevision
+from main.resources.sequence_util import numeric_sequence_ids, numeric_value
+from main.resources.revision_partitions import partitioning_enabled, partition_revisions
 from main.workers.util import worker_log
 
 
+# bring an existing database up to date with the current models and fill in derived data (and, if configured, partition the
+# revisions table); this is safe to run more than once
+def migrate_db():
+    db.create_all()  # creates any missing tables (but doesn't modify existing tables)
+    add_missing_columns()
+    if partitioning_enabled():
+        partition_revisions()
+    backfill_ancestry()
+    backfill_revision_values()
+
+
+# add columns and indexes that have been added to the models since the database was created
+def add_missing_columns():
+    with db.engine.begin() as connection:
+        inspector = sqlalchemy.inspect(connection)
+        for table in db.metadata.sorted_tables:
+            column_names = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in column_names:
+                    print('adding column %s.%s' % (table.name, column.name))
+                    column_type = column.type.compile(dialect=connection.dialect)
+                    connection.execute(text('ALTER TABLE %s ADD COLUMN %s %s' % (table.name, column.name, column_type)))
+            index_names = {index['name'] for index in inspector.get_indexes(table.name)}
+            if connection.dialect.name == 'postgresql':  # the inspector doesn't list the indexes of partitioned tables
+                index_names |= set(connection.execute(text('SELECT indexname FROM pg_indexes WHERE tablename = :table_name'),
+                                                      {'table_name': table.name}).scalars())
+            for index in table.indexes:
+                if index.name not in index_names:
+                    print('creating index %s' % index.name)
+                    index.create(bind=connection)
+
+
+# compute the materialized ancestry of resources that don't have it yet (or of all resources if recompute is True);
+# this runs one update per level of the resource hierarchy
+def backfill_ancestry(recompute=False):
+    with db.engine.begin() as connection:
+        if recompute:
+            connection.execute(Resource.__table__.update().values(ancestry=None))
+        result = connection.execute(text(
+            "UPDATE resources SET ancestry = '/' || CAST(id AS VARCHAR) || '/' WHERE parent_id IS NULL AND ancestry IS NULL"
+        ))
+        update_count = result.rowcount
+        while result.rowcount:
+            result = connection.execute(text(
+                "UPDATE resources SET ancestry = "
+                "(SELECT parent.ancestry FROM resources AS parent WHERE parent.id = resources.parent_id) || CAST(id AS VARCHAR) || '/' "
+                "WHERE ancestry IS NULL AND parent_id IN (SELECT id FROM resources WHERE ancestry IS NOT NULL)"
+            ))
+            update_count += result.rowcount
+    print('computed ancestry for %d resources' % update_count)
+
+
+# fill in the numeric values of numeric sequence revisions stored before the value column was added
+# (values that aren't numbers are left empty)
+def backfill_revision_values(batch_size=10000):
+    revisions = ResourceRevision.__table__
+    update = revisions.update().where(revisions.c.id == bindparam('revision_id')).values(value=bindparam('new_value'))
+    update_count = 0
+    for resource_id in numeric_sequence_ids():
+        last_id = 0
+        while True:
+            batch = (
+                db.session.query(ResourceRevision.id, ResourceRevision.data)
+                .filter(ResourceRevision.resource_id == resource_id, ResourceRevision.value.is_(None), ResourceRevision.id > last_id)
+                .order_by(ResourceRevision.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            values = [{'revision_id': revision_id, 'new_value': numeric_value(data)} for (revision_id, data) in batch]
+            values = [v for v in values if v['new_value'] is not None]
+            if values:
+                db.session.execute(update, values)
+                db.session.commit()
+                update_count += len(values)
+    print('computed numeric values for %d revisions' % update_count)
+
+
 def check_resource_migration():
     worker_log('migrate_db', 'resources without org id: %d' %
                db.session.query(func.count(Resource.id)).filter(Resource.organization_id.is_(None)).scalar())
     worker_log('migrate_db', 'file resources without last rev: %d' %
                db.session.query(func.count(Resource.id)).filter(Resource.type == Resource.FILE, Resource.last_revision_id.is_(None)).scalar())
+    worker_log('migrate_db', 'resources without ancestry: %d' %
+               db.session.query(func.count(Resource.id)).filter(Resource.ancestry.is_(None)).scalar())
 
 
 if __name__ == '__main__':
-    pass
+    migrate_db()
@@ -0,0 +1,35 @@
+import time
+from main.app import app, db
+from main.resources.revision_partitions import partitioning_enabled, is_partitioned, create_revision_partitions, drop_revision_partitions
+from main.workers.util import worker_log
+
+
+# this worker thread will create future partitions of the resource_revisions table and drop old ones (if partitioning is enabled)
+def revision_partitioner():
+    if not partitioning_enabled():
+        return
+    worker_log('revision_partitioner', 'starting')
+    while True:
+        start_time = time.time()
+        with db.engine.connect() as connection:
+            partitioned = is_partitioned(connection)
+        if partitioned:
+            created = create_revision_partitions()
+            retention_days = app.config['REVISION_RETENTION_DAYS']
+            dropped = drop_revision_partitions(retention_days) if retention_days else []
+
+            # display diagnostic
+            if created or dropped:
+                message = 'created partitions: %s; dropped partitions: %s (%.3f seconds)' % (
+                    ', '.join(created) or 'none', ', '.join(dropped) or 'none', time.time() - start_time)
+                worker_log('revision_partitioner', message)
+        else:
+            worker_log('revision_partitioner', 'resource_revisions table is not partitioned; run migrate_db')
+
+        # sleep for 6 hours
+        time.sleep(6 * 60 * 60)
+
+
+# if run as top-level script
+if __name__ == '__main__':
+    revision_partitioner()
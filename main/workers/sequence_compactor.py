@@ -0,0 +1,40 @@
+import json
+import time
+from main.app import app, db
+from main.resources.models import Resource
+from main.resources.sequence_chunks import is_chunked, compact_sequence
+from main.workers.util import worker_log
+
+
+# this worker thread will pack the values of numeric sequences with chunked storage into chunks (one per closed time window)
+def sequence_compactor():
+    worker_log('sequence_compactor', 'starting')
+    chunk_length = app.config['SEQUENCE_CHUNK_LENGTH']
+    while True:
+        start_time = time.time()
+        sequence_count = 0
+        value_count = 0
+
+        # loop over all chunked sequences
+        sequences = Resource.query.filter(Resource.type == Resource.SEQUENCE, Resource.system_attributes.like('%"storage": "chunked"%'))
+        for resource in sequences.all():
+            if is_chunked(json.loads(resource.system_attributes)):
+                moved_count = compact_sequence(resource, chunk_length)
+                if moved_count:
+                    sequence_count += 1
+                    value_count += moved_count
+        db.session.expunge_all()
+        db.session.close()
+
+        # display diagnostic
+        if value_count:
+            message = 'packed %d values from %d sequences into chunks in %.3f seconds' % (value_count, sequence_count, time.time() - start_time)
+            worker_log('sequence_compactor', message)
+
+        # sleep until the next window has closed
+        time.sleep(chunk_length)
+
+
+# if run as top-level script
+if __name__ == '__main__':
+    sequence_compactor()
@@ -0,0 +1,102 @@
+import json
+import time
+from sqlalchemy import not_
+from main.app import db
+from main.resources.models import Resource, SequenceRollup
+from main.resources.resource_util import delete_revisions
+from main.resources.sequence_util import retention_settings, retention_cutoffs, replace_sequence_rollups, timestamp_seconds, \
+    seconds_timestamp, sequence_rollups
+from main.resources.sequence_chunks import may_have_chunks, stored_numeric_values, delete_chunks
+from main.workers.util import worker_log
+
+
+# this worker thread will remove the old history of numeric sequences with tiered retention (see retention_settings),
+# making sure that the rollups cover the raw values before they are removed
+def sequence_retention():
+    worker_log('sequence_retention', 'starting')
+    while True:
+        stats = apply_retention()
+
+        # display diagnostic
+        if stats['sequence_count']:
+            message = 'retention pass: %d sequences, rebuilt %d days of rollups, deleted %d values and %d rollups in %.3f seconds' % (
+                stats['sequence_count'], stats['rebuilt_days'], stats['value_count'], stats['rollup_count'], stats['seconds'])
+            worker_log('sequence_retention', message)
+
+        # sleep for an hour
+        time.sleep(60 * 60)
+
+
+# apply the retention tiers of all (non-deleted) numeric sequences that have them; returns a dictionary of statistics for the pass
+def apply_retention(now=None):
+    start_time = time.time()
+    stats = {'sequence_count': 0, 'rebuilt_days': 0, 'value_count': 0, 'rollup_count': 0}
+    sequences = (
+        Resource.query
+        .with_entities(Resource.id, Resource.system_attributes, Resource.last_revision_id)
+        .filter(Resource.type == Resource.SEQUENCE, not_(Resource.deleted), Resource.system_attributes.like('%"retention"%'))
+        .order_by(Resource.id)
+        .all()
+    )
+    for (resource_id, system_attributes, last_revision_id) in sequences:
+        system_attributes = json.loads(system_attributes)
+        retention = retention_settings(system_attributes)
+        if not retention or system_attributes.get('data_type') != Resource.NUMERIC_SEQUENCE:
+            continue
+        stats['sequence_count'] += 1
+        cutoffs = retention_cutoffs(retention, now)
+
+        # remove raw values (keeping the last revision, which is used for the current value)
+        raw_cutoff = cutoffs['raw']
+        if raw_cutoff:
+            chunked = may_have_chunks(system_attributes)
+            stats['rebuilt_days'] += check_rollups(resource_id, raw_cutoff, chunked)
+            if chunked:
+                stats['value_count'] += delete_chunks(resource_id, raw_cutoff)
+            stats['value_count'] += delete_revisions(resource_id, raw_cutoff, keep_revision_id=last_revision_id)
+
+        # remove rollups
+        for (tier, resolution) in SequenceRollup.RESOLUTIONS.items():
+            if cutoffs[tier]:
+                rollups = SequenceRollup.query.filter(
+                    SequenceRollup.resource_id == resource_id, SequenceRollup.resolution == resolution, SequenceRollup.timestamp < cutoffs[tier])
+                stats['rollup_count'] += rollups.delete(synchronize_session=False)
+        db.session.commit()
+    stats['seconds'] = time.time() - start_time
+    return stats
+
+
+# make sure that the rollups of a sequence include all of its raw values before the given time (e.g. in case they were stored before
+# rollups were added); rollups summarize the stored values (see SequenceRollup), so a day whose rollups count fewer values than
+# are stored is missing some and is rebuilt from the stored values (giving the same aggregates as if the rollups had been kept up to
+# date at ingest); days with at least as many values in their rollups (e.g. after max_history truncation) are left alone; returns
+# the number of days rebuilt; this is incremental: once the raw values have been removed, only the days since the previous pass are read
+def check_rollups(resource_id, cutoff, chunked):
+    values = stored_numeric_values(resource_id, chunked, end_timestamp=cutoff)
+    rollup_counts = {bucket[0]: bucket[1] for bucket in sequence_rollups(resource_id, 86400, end_timestamp=cutoff)}
+    rebuilt_days = 0
+    day = None
+    (timestamps, day_values) = ([], [])
+    for (timestamp, value) in values:
+        seconds = timestamp_seconds(timestamp)
+        if seconds // 86400 * 86400 != day:
+            rebuilt_days += _check_day_rollups(resource_id, day, timestamps, day_values, rollup_counts)
+            (day, timestamps, day_values) = (seconds // 86400 * 86400, [], [])
+        timestamps.append(seconds)
+        day_values.append(value)
+    rebuilt_days += _check_day_rollups(resource_id, day, timestamps, day_values, rollup_counts)
+    db.session.commit()
+    return rebuilt_days
+
+
+# rebuild the rollups of a day from its raw values if they are missing any of the values; returns 1 if rebuilt (otherwise 0)
+def _check_day_rollups(resource_id, day, timestamps, values, rollup_counts):
+    if not timestamps or rollup_counts.get(day, 0) >= len(timestamps):
+        return 0
+    replace_sequence_rollups(resource_id, timestamps, values, seconds_timestamp(day), seconds_timestamp(day + 86400))
+    return 1
+
+
+# if run as top-level script
+if __name__ == '__main__':
+    sequence_retention()
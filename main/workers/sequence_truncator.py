@@ -1,65 +1,102 @@
 import json
 import time
-from sqlalchemy import func
+from sqlalchemy import not_
 from main.app import db
 from main.resources.models import Resource, ResourceRevision
+from main.resources.resource_util import delete_revisions
+from main.resources.sequence_chunks import may_have_chunks, chunk_value_count, sequence_values, delete_chunks
 from main.workers.util import worker_log
 
 
+HISTORY_BUFFER = 1000  # number of revisions allowed beyond max_history before a sequence is truncated
+DELETE_BATCH_SIZE = 1000  # number of revisions deleted per transaction
+
+
 # this worker thread will delete old entries for each sequence resource (keeping at least max_history entries)
 def sequence_truncator():
-    verbose = True
     worker_log('sequence_truncator', 'starting')
     while True:
-        truncate_count = 0
+        stats = truncate_sequences()
 
-        # loop over all sequences
-        resources = Resource.query.filter(Resource.type == Resource.SEQUENCE)
-        for resource in resources:
+        # display diagnostic
+        message = 'truncation pass: checked %d sequences, truncated %d, deleted %d revisions in %.3f seconds' % (
+            stats['sequence_count'], stats['truncate_count'], stats['delete_count'], stats['seconds'])
+        worker_log('sequence_truncator', message)
 
-            # get number of revisions for this sequence
-            rev_count = db.session.query(func.count(ResourceRevision.id)).filter(ResourceRevision.resource_id == resource.id).scalar()
+        # sleep for an hour
+        time.sleep(60 * 60)
 
-            # get max history
-            system_attributes = json.loads(resource.system_attributes) if resource.system_attributes else {}
-            max_history = system_attributes.get('max_history', 1)
 
-            # if too many revisions (with 1000 item buffer), delete old ones
-            # fix(later): revisit buffer for image sequences and others with large objects
-            if rev_count > max_history + 1000:
+# delete old entries for each (non-deleted) sequence resource that has more than max_history entries (plus a buffer); sequences are
+# selected using their maintained value counts (see Resource.value_count), so sequences within their limits aren't read at all;
+# returns a dictionary of statistics for the pass
+def truncate_sequences(batch_size=DELETE_BATCH_SIZE):
+    start_time = time.time()
+    stats = {'sequence_count': 0, 'truncate_count': 0, 'delete_count': 0}
+    sequences = (
+        Resource.query
+        .with_entities(Resource.id, Resource.system_attributes, Resource.value_count)
+        .filter(Resource.type == Resource.SEQUENCE, not_(Resource.deleted))
+        .order_by(Resource.id)
+        .all()
+    )
+    db.session.commit()  # end the read transaction
+    for (resource_id, system_attributes, value_count) in sequences:
+        system_attributes = json.loads(system_attributes) if system_attributes else {}
+        max_history = max(system_attributes.get('max_history', 1), 1)
+        chunked = may_have_chunks(system_attributes)
+        stats['sequence_count'] += 1
+        if value_count is None:  # e.g. sequences created before value counts were added
+            value_count = count_sequence_values(resource_id, chunked)
+        if value_count <= max_history + HISTORY_BUFFER:
+            continue
+        delete_count = truncate_sequence(resource_id, max_history, chunked, batch_size)
+        if delete_count:
+            stats['truncate_count'] += 1
+            stats['delete_count'] += delete_count
+    stats['seconds'] = time.time() - start_time
+    return stats
 
-                # determine timestamp of revision max_history records ago;
-                # this could be made faster if we assumed that revisions are created sequentially
-                revisions = (
-                    ResourceRevision.query
-                    .with_entities(ResourceRevision.timestamp)
-                    .filter(ResourceRevision.resource_id == resource.id)
-                    .order_by('timestamp')
-                )
-                boundary_timestamp = revisions[-max_history].timestamp
 
-                # diagnostics
-                if verbose:
-                    message = 'id: %s, path: %s, max hist: %d, revs: %d, first: %s, thresh: %s, last: %s' % (
-                        resource.id, resource.path(), max_history, rev_count,
-                        revisions[0].timestamp.strftime('%Y-%m-%d'),
-                        boundary_timestamp.strftime('%Y-%m-%d'),
-                        revisions[-1].timestamp.strftime('%Y-%m-%d')
-                    )
-                    worker_log('sequence_truncator', message)
+# count the stored values of a sequence (in revision records and chunks) and store the count in its resource record;
+# returns the count
+def count_sequence_values(resource_id, chunked):
+    value_count = db.session.query(ResourceRevision.id).filter(ResourceRevision.resource_id == resource_id).count()
+    if chunked:
+        value_count += chunk_value_count(resource_id)
+    Resource.query.filter(Resource.id == resource_id).update({'value_count': value_count}, synchronize_session=False)
+    db.session.commit()
+    return value_count
 
-                # delete the old records
-                # it is critical that we filter by resource ID and timestamp
-                ResourceRevision.query.filter(ResourceRevision.resource_id == resource.id, ResourceRevision.timestamp < boundary_timestamp).delete()
-                db.session.commit()
-                truncate_count += 1
 
-        # display diagnostic
-        if truncate_count:
-            worker_log('sequence_truncator', 'done with truncation pass; truncated %d sequences' % truncate_count)
+# delete the values of a sequence older than its newest max_history values; the cutoff is found using the resource ID/timestamp index
+# (or, for sequences with chunked storage, by reading the newest values); the values are deleted in batches (each in its own
+# transaction) so that we don't hold locks for long; returns the number of values deleted
+def truncate_sequence(resource_id, max_history, chunked=False, batch_size=DELETE_BATCH_SIZE):
+    if chunked:
+        boundary_timestamp = None
+        for (index, (timestamp, _, _)) in enumerate(sequence_values(resource_id, newest_first=True)):
+            if index + 1 == max_history:
+                boundary_timestamp = timestamp
+                break
+    else:
+        boundary = (
+            db.session.query(ResourceRevision.timestamp)
+            .filter(ResourceRevision.resource_id == resource_id)
+            .order_by(ResourceRevision.timestamp.desc())
+            .offset(max_history - 1)
+            .first()
+        )
+        boundary_timestamp = boundary.timestamp if boundary else None
+    db.session.commit()  # end the read transaction
+    if boundary_timestamp is None:  # the value count was too high (e.g. revisions removed outside the application)
+        count_sequence_values(resource_id, chunked)
+        return 0
 
-        # sleep for an hour
-        time.sleep(60 * 60)
+    # delete the old records; it is critical that we filter by resource ID and timestamp; values in a chunk are only deleted if
+    # the whole chunk is before the cutoff
+    delete_count = delete_chunks(resource_id, boundary_timestamp, batch_size) if chunked else 0
+    return delete_count + delete_revisions(resource_id, boundary_timestamp, batch_size=batch_size)
 
 
 # if run as top-level script
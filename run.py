@@ -7,6 +7,8 @@ from main.app import app, db
 from main.balena import balena_setup
 from main.users.admin import create_admin_user
 from main.resources.resource_util import create_system_resources
+from main.workers.migrate_db import migrate_db
+from main.workers.backfill_rollups import backfill_rollups
 
 # import all views
 from main.users import views
@@ -30,6 +32,7 @@ if __name__ == '__main__':
     parser.add_option('-d', '--init-db', dest='init_db', action='store_true', default=False)
     parser.add_option('-a', '--create-admin', dest='create_admin', default='')
     parser.add_option('-m', '--migrate-db', dest='migrate_db', action='store_true', default=False)
+    parser.add_option('-r', '--backfill-rollups', dest='backfill_rollups', action='store_true', default=False)
     parser.add_option('-p', '--port', dest='port', type=int, default=5000)
     parser.add_option('-l', '--listen-address', dest='listen_address', default='127.0.0.1')
     parser.add_option('-b', '--balena', action='store_true', default=False)
@@ -47,7 +50,11 @@ if __name__ == '__main__':
         create_admin_user(email_address, password)
         print('created system admin: %s' % email_address)
     elif options.migrate_db:
-        pass
+        print('migrating database')
+        migrate_db()
+    elif options.backfill_rollups:
+        print('building sequence rollups')
+        backfill_rollups()
 
     # start the debug server
     else:
@@ -9,6 +9,9 @@ from main.app import message_queue
 from main.workers.util import worker_log
 from main.workers.controller_watchdog import controller_watchdog
 from main.workers.sequence_truncator import sequence_truncator
+from main.workers.sequence_compactor import sequence_compactor
+from main.workers.sequence_retention import sequence_retention
+from main.workers.revision_partitioner import revision_partitioner
 from main.workers.message_deleter import message_deleter
 from main.workers.message_monitor import message_monitor
 
@@ -28,6 +31,9 @@ def worker(blocking=True, debug=False):
     # start various worker threads
     Thread(target=controller_watchdog, daemon=True).start()
     Thread(target=sequence_truncator, daemon=True).start()
+    Thread(target=sequence_compactor, daemon=True).start()
+    Thread(target=sequence_retention, daemon=True).start()
+    Thread(target=revision_partitioner, daemon=True).start()
     Thread(target=message_deleter, daemon=True).start()
     Thread(target=message_monitor, daemon=True).start()
 
@@ -57,6 +57,48 @@
 # OUTGOING_EMAIL_SERVER = ''
 # OUTGOING_EMAIL_PORT = 587
 
+# number of resource paths to cache and how long (in seconds) a cached path is used before it is looked up again
+# PATH_CACHE_SIZE = 10000
+# PATH_CACHE_MAX_AGE = 300
+
+# number of resources whose effective permissions are cached and how long (in seconds) they are cached
+# PERMISSION_CACHE_SIZE = 10000
+# PERMISSION_CACHE_MAX_AGE = 60
+
+# number of verified API keys to cache and how long (in seconds) a key is cached before it is verified again
+# KEY_CACHE_SIZE = 10000
+# KEY_CACHE_MAX_AGE = 600
+
+# number of users whose organization names (shown in the navigation menu) are cached and how long (in seconds) they are cached
+# ORGANIZATION_NAME_CACHE_SIZE = 1000
+# ORGANIZATION_NAME_CACHE_MAX_AGE = 60
+
+# number of compressed numeric sequences whose current segment (see compress_value) is kept in memory
+# COMPRESSION_CACHE_SIZE = 10000
+
+# number of sequences whose compiled ingest settings are cached and how long (in seconds) they are cached
+# INGEST_DESCRIPTOR_CACHE_SIZE = 10000
+# INGEST_DESCRIPTOR_CACHE_MAX_AGE = 300
+
+# backend for the cache of the most recent value of each sequence: 'memory' keeps values in each process, so it only
+# avoids database reads for values received by the same process (e.g. REST updates to a web server, but not MQTT values
+# received by the worker); '' disables the cache; any other value is the module path and name of a LatestValueCache subclass
+# (e.g. a backend shared between processes), which is constructed with the app config
+# LATEST_VALUE_CACHE = 'memory'
+
+# number of sequences whose most recent values are kept by the memory backend
+# LATEST_VALUE_CACHE_SIZE = 10000
+
+# length (in seconds) of the time windows packed into chunks for numeric sequences with chunked storage
+# SEQUENCE_CHUNK_LENGTH = 3600
+
+# on PostgreSQL, partition resource revisions by time ('day', 'week', or 'month'; run migrate_db after setting this);
+# the number of future partitions to create ahead of time; age (in days) after which old sequence revisions are dropped (None to keep them)
+# (a sequence still keeps its newest max_history values and any raw values within its own retention settings)
+# REVISION_PARTITION_INTERVAL = None
+# REVISION_PARTITIONS_AHEAD = 2
+# REVISION_RETENTION_DAYS = None
+
 # EXTRA_NAV_ITEMS = ''
 # DOC_FILE_PREFIX = ''
 
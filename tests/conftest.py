@@ -11,6 +11,7 @@ os.environ['RHIZO_SERVER_DISABLE_ENVIRONMENT'] = 'True'
 # pylint: disable=wrong-import-position
 from main.api.messages import MessageList  # noqa E402
 from main.api.resources import ResourceList, ResourceRecord  # noqa E402
+from main.api.sequences import AlignedSequenceList  # noqa E402
 import main.app  # noqa E402
 import main.messages.models  # noqa E402
 from main.resources.models import ControllerStatus, Resource  # noqa E402
@@ -73,10 +74,27 @@ def api(app):
     api.add_resource(MessageList, '/api/v1/messages')
     api.add_resource(ResourceList, '/api/v1/resources')
     api.add_resource(ResourceRecord, '/api/v1/resources/<path:resource_path>')
+    api.add_resource(AlignedSequenceList, '/api/v1/sequences/aligned')
 
     return api
 
 
+@pytest.fixture(scope='function', autouse=True)
+def _clear_caches():
+    """Clear the in-process caches before each test.
+
+    Each test's database changes are rolled back afterwards, so cached values could otherwise refer to
+    records from a previous test.
+    """
+    main.app.path_cache.clear()
+    main.app.permission_cache.clear()
+    main.app.key_cache.clear()
+    main.app.organization_name_cache.clear()
+    main.app.compression_cache.clear()
+    main.app.ingest_descriptor_cache.clear()
+    main.app.latest_value_cache.clear()
+
+
 @pytest.fixture(scope='function')
 def folder_resource(db_session):
     """A basic folder Resource called '/folder'."""
@@ -0,0 +1,23 @@
+import datetime
+
+import pytest
+
+import main.users.auth
+from main.users.auth import find_key
+
+
+@pytest.mark.usefixtures('db_session')
+class TestFindKey:
+    def test_verified_key_is_cached(self, controller_key_resource, mocker):
+        verify_key = mocker.spy(main.users.auth, 'verify_key')
+        assert find_key(controller_key_resource.text).id == controller_key_resource.id
+        assert find_key(controller_key_resource.text).id == controller_key_resource.id
+        assert verify_key.call_count == 1
+
+    def test_revoked_key_not_found(self, controller_key_resource):
+        assert find_key(controller_key_resource.text)
+        controller_key_resource.revocation_timestamp = datetime.datetime.utcnow()
+        assert find_key(controller_key_resource.text) is None
+
+    def test_invalid_key_not_found(self, controller_key_resource):
+        assert find_key(controller_key_resource.text[:-1] + 'x') is None
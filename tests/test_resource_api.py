@@ -1,12 +1,20 @@
 import base64
+import datetime
+import json
 import random
+from array import array
 from io import BytesIO
 from typing import Union
 
 from PIL import Image
 import pytest
 
-from main.resources.models import Resource
+import main.users.permissions
+from main.messages.models import Message
+from main.resources.models import Resource, ResourceRevision, SequenceChunk
+from main.resources.resource_util import find_resource, create_sequence
+from main.resources.sequence_chunks import compact_sequence
+from main.resources.views import sequence_viewer
 
 
 @pytest.mark.usefixtures('api', 'folder_resource')
@@ -68,6 +76,24 @@ class TestResourceOperations:
 
         assert self.client.get(folder_resource_url).status_code == 200
 
+    def test_recursive_list(self):
+        resources_url = '/api/v1/resources'
+        for (path, name) in [('/folder', 'b'), ('/folder', 'a'), ('/folder/b', 'c'), ('/folder/b', 'deleted'), ('/folder/b/deleted', 'd')]:
+            assert self.client.post(resources_url, data={'path': path, 'name': name, 'type': 10}).status_code == 200
+        for path in ['/folder/a', '/folder/b/c', '/folder/b/deleted/d']:
+            file_info = {'path': path, 'file': 'x.txt', 'data': base64.b64encode(b'x')}
+            assert self.client.post(f'{resources_url}{path}/x.txt', data=file_info).status_code == 200
+        assert self.client.delete(f'{resources_url}/folder/b/deleted').status_code == 200
+
+        result = self.client.get(f'{resources_url}/folder?recursive=1')
+        assert result.status_code == 200
+        assert [item['path'] for item in result.json] == [
+            '/folder/a', '/folder/b', '/folder/a/x.txt', '/folder/b/c', '/folder/b/c/x.txt',
+        ]
+
+        result = self.client.get(f'{resources_url}/folder?recursive=1&filter=x*')
+        assert [item['path'] for item in result.json] == ['/folder/a/x.txt', '/folder/b/c/x.txt']
+
     # Sequences
 
     def _create_sequence(self, sequence_type: int) -> str:
@@ -101,6 +127,159 @@ class TestResourceOperations:
         for item in items:
             assert self._write_then_read_sequence(sequence_url, item) == item
 
+    def test_sequence_history(self):
+        resources_url = '/api/v1/resources'
+        post_params = {'path': '/folder', 'name': 'history', 'type': Resource.SEQUENCE, 'data_type': Resource.NUMERIC_SEQUENCE,
+                       'min_storage_interval': 0}
+        assert self.client.post(resources_url, data=post_params).status_code == 200
+        for value in range(5):
+            assert self.client.put(resources_url, data={'values': f'{{"/folder/history": {value}}}'}).status_code == 200
+
+        result = self.client.get(f'{resources_url}/folder/history?count=3')
+        assert result.status_code == 200
+        assert result.json['values'] == ['2', '3', '4']
+        assert result.json['timestamps'] == sorted(result.json['timestamps'])
+
+        result = self.client.get(f'{resources_url}/folder/history?count=10')
+        assert result.json['values'] == ['0', '1', '2', '3', '4']
+
+        result = self.client.get(f'{resources_url}/folder/history?count=10&max_points=1')
+        assert result.status_code == 200
+        assert (result.json['values'], result.json['min_values'], result.json['max_values'], result.json['counts']) == ([2.0], [0.0], [4.0], [5])
+
+        result = self.client.get(f'{resources_url}/folder/history?count=3&format=binary')
+        assert result.status_code == 200
+        data = array('d', result.data)
+        assert len(data) == 6
+        assert list(data[3:]) == [2.0, 3.0, 4.0]
+        assert list(data[:3]) == sorted(data[:3])
+        assert self.client.get(f'{resources_url}/folder/history?count=3', headers={'Accept': 'application/octet-stream'}).data == result.data
+
+        result = self.client.get(f'{resources_url}/folder/history?rollup=day')
+        assert result.status_code == 200
+        assert sum(result.json['counts']) == 5
+
+        result = self.client.get(f'{resources_url}/folder/history?count=3&download=1')
+        assert result.status_code == 200
+        lines = result.data.decode().splitlines()
+        assert lines[0] == 'utc_timestamp,value'
+        assert [line.split(',')[1] for line in lines[1:]] == ['2', '3', '4']
+        assert self.client.get(f'{resources_url}/folder/history?count=3&download=1&local_time=1').status_code == 400
+
+    def test_bulk_update(self):
+        resources_url = '/api/v1/resources'
+        names = ['x', 'y', 'z']
+        for name in names:
+            post_params = {'path': '/folder', 'name': name, 'type': Resource.SEQUENCE, 'data_type': Resource.NUMERIC_SEQUENCE,
+                           'min_storage_interval': 0}
+            assert self.client.post(resources_url, data=post_params).status_code == 200
+        message_count = Message.query.filter(Message.type == 'sequence_updates').count()
+        values = {f'/folder/{name}': index for (index, name) in enumerate(names)}
+        values['/folder/missing'] = 5
+        assert self.client.put(resources_url, data={'values': json.dumps(values)}).status_code == 200
+        for (index, name) in enumerate(names):
+            assert self.client.get(f'{resources_url}/folder/{name}').data.decode() == str(index)
+        assert Message.query.filter(Message.type == 'sequence_updates').count() == message_count + 1
+
+    def test_sequence_compression_settings(self):
+        resources_url = '/api/v1/resources'
+        post_params = {'path': '/folder', 'name': 'compressed', 'type': Resource.SEQUENCE, 'data_type': Resource.NUMERIC_SEQUENCE,
+                       'compression': 'swinging_door', 'compression_deviation': '0.5'}
+        assert self.client.post(resources_url, data=post_params).status_code == 200
+        result = self.client.get(f'{resources_url}/folder/compressed?meta=1')
+        system_attributes = result.json['system_attributes']
+        assert (system_attributes['compression'], system_attributes['compression_deviation']) == ('swinging_door', 0.5)
+        assert self.client.put(f'{resources_url}/folder/compressed', data={'compression': 'other'}).status_code == 400
+        assert self.client.put(f'{resources_url}/folder/compressed', data={'compression': 'none'}).status_code == 200
+        assert 'compression' not in self.client.get(f'{resources_url}/folder/compressed?meta=1').json['system_attributes']
+
+    def test_chunked_sequence(self, mocker):
+        resources_url = '/api/v1/resources'
+        post_params = {'path': '/folder', 'name': 'chunked', 'type': Resource.SEQUENCE, 'data_type': Resource.NUMERIC_SEQUENCE,
+                       'min_storage_interval': 0, 'storage': 'chunked'}
+        assert self.client.post(resources_url, data=post_params).status_code == 200
+        for index in range(10):
+            put_params = {'values': '{"/folder/chunked": %d.5}' % index, 'timestamp': f'2020-01-01T{index // 6:02d}:{index % 6 * 10:02d}:00Z'}
+            assert self.client.put(resources_url, data=put_params).status_code == 200
+        sequence = find_resource('/folder/chunked')
+        assert compact_sequence(sequence, 3600) == 9
+        assert SequenceChunk.query.filter(SequenceChunk.resource_id == sequence.id).count() == 2
+
+        result = self.client.get(f'{resources_url}/folder/chunked?count=4')
+        assert result.json['values'] == ['6.5', '7.5', '8.5', '9.5']
+        result = self.client.get(f'{resources_url}/folder/chunked?count=10&start_timestamp=2020-01-01T00:15:00Z&end_timestamp=2020-01-01T01:05:00Z')
+        assert result.json['values'] == ['2.5', '3.5', '4.5', '5.5', '6.5']
+        result = self.client.get(f'{resources_url}/folder/chunked?count=3&download=1')
+        assert [line.split(',')[1] for line in result.data.decode().splitlines()[1:]] == ['7.5', '8.5', '9.5']
+        assert self.client.get(f'{resources_url}/folder/chunked').data.decode() == '9.5'
+        # the sequence page shows the values in both chunks and revisions
+        with self.client.application.test_request_context('/folder/chunked'):
+            render_template = mocker.patch('main.resources.views.render_template', return_value='')
+            sequence_viewer(sequence)
+        assert json.loads(render_template.call_args.kwargs['values']) == ['%d.5' % index for index in range(9, -1, -1)]
+        assert json.loads(render_template.call_args.kwargs['chart_values']) == [index + 0.5 for index in range(10)]
+        params = {'paths': '/folder/chunked', 'start_timestamp': '2020-01-01T00:00:00Z', 'end_timestamp': '2020-01-01T01:00:00Z',
+                  'resolution': 1800}
+        result = self.client.get('/api/v1/sequences/aligned', query_string=params)
+        assert result.json['sequences'][0]['values'] == [0.5, 3.5, 6.5]
+
+    def test_sequence_page(self, db_session, folder_resource, mocker):
+        sequence = create_sequence(folder_resource, 'page', Resource.NUMERIC_SEQUENCE)
+        for index in range(300):
+            timestamp = datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=index)
+            db_session.add(ResourceRevision(resource_id=sequence.id, timestamp=timestamp, data=str(index % 2).encode(), value=index % 2))
+        db_session.commit()
+
+        # the table shows the most recent raw values; the plot shows bucket averages
+        with self.client.application.test_request_context('/folder/page'):
+            render_template = mocker.patch('main.resources.views.render_template', return_value='')
+            sequence_viewer(sequence)
+        params = render_template.call_args.kwargs
+        assert len(json.loads(params['values'])) == 200
+        assert json.loads(params['timestamps'])[0] == 1577836800 + 299 * 60
+        chart_timestamps = json.loads(params['chart_timestamps'])
+        assert (len(chart_timestamps), chart_timestamps[0]) == (300, 1577836800)
+        assert json.loads(params['chart_values'])[:4] == [0, 1, 0, 1]
+
+    def test_sequence_retention(self):
+        resources_url = '/api/v1/resources'
+        post_params = {'path': '/folder', 'name': 'tiered', 'type': Resource.SEQUENCE, 'data_type': Resource.NUMERIC_SEQUENCE,
+                       'min_storage_interval': 0, 'retention': '{"raw": 30, "minute": 365}'}
+        assert self.client.post(resources_url, data=post_params).status_code == 200
+        assert self.client.put(f'{resources_url}/folder/tiered', data={'retention': '{"raw": 30, "minute": 10}'}).status_code == 400
+        assert self.client.put(f'{resources_url}/folder/tiered', data={'retention': '{"second": 1}'}).status_code == 400
+        for (time, value) in (('00:00:00', 1), ('00:20:00', 2), ('05:00:00', 3)):
+            put_params = {'values': '{"/folder/tiered": %d}' % value, 'timestamp': f'2020-01-01T{time}Z'}
+            assert self.client.put(resources_url, data=put_params).status_code == 200
+
+        query = 'start_timestamp=2020-01-01T00:00:00Z&end_timestamp=2020-01-02T00:00:00Z&max_points=8'
+        result = self.client.get(f'{resources_url}/folder/tiered?{query}')
+        assert result.status_code == 200
+        assert (result.json['counts'], result.json['values']) == ([2, 1], [1.5, 3])
+
+    def test_aligned_sequences(self):
+        resources_url = '/api/v1/resources'
+        for name in ('a', 'b'):
+            post_params = {'path': '/folder', 'name': name, 'type': Resource.SEQUENCE, 'data_type': Resource.NUMERIC_SEQUENCE,
+                           'min_storage_interval': 0}
+            assert self.client.post(resources_url, data=post_params).status_code == 200
+        for (second, values) in ((0, '{"/folder/a": 1, "/folder/b": 10}'), (5, '{"/folder/a": 3}'), (12, '{"/folder/b": 20}')):
+            put_params = {'values': values, 'timestamp': f'2020-01-01T00:00:{second:02d}Z'}
+            assert self.client.put(resources_url, data=put_params).status_code == 200
+
+        params = {'paths': '/folder/a,/folder/b', 'start_timestamp': '2020-01-01T00:00:00Z', 'end_timestamp': '2020-01-01T00:00:20Z',
+                  'resolution': 10}
+        result = self.client.get('/api/v1/sequences/aligned', query_string=params)
+        assert result.status_code == 200
+        assert len(result.json['timestamps']) == 3
+        assert [s['values'] for s in result.json['sequences']] == [[1, 3, 3], [10, 10, 20]]
+        result = self.client.get('/api/v1/sequences/aligned', query_string=dict(params, method='mean'))
+        assert [s['values'] for s in result.json['sequences']] == [[2, None, None], [10, 20, None]]
+        result = self.client.get('/api/v1/sequences/aligned', query_string=dict(params, method='nearest'))
+        assert [s['values'] for s in result.json['sequences']] == [[1, 3, None], [10, 20, 20]]
+        result = self.client.get('/api/v1/sequences/aligned', query_string=dict(params, method='interpolate'))
+        assert [s['values'] for s in result.json['sequences']] == [[1, 3, 3], [10, pytest.approx(10 + 10 * 10 / 12), 20]]
+
     def test_update_int_sequence(self):
         sequence_url = self._create_sequence(Resource.NUMERIC_SEQUENCE)
         value = random.randint(1, 100)
@@ -162,3 +341,12 @@ class TestSendMessage:
 
     def test_unauthorized_folder(self):
         assert self._send_message('/system').status_code == 403
+
+
+@pytest.mark.usefixtures('api')
+def test_principal_resolved_once_per_request(client, user_resource, controller_key_resource, mocker):
+    auth = base64.b64encode(f'{user_resource.user_name}:{controller_key_resource.text}'.encode()).decode()
+    find_key = mocker.spy(main.users.permissions, 'find_key')
+    message_info = {'folder_path': '/folder', 'type': 'testMessage', 'parameters': '{}'}
+    assert client.post('/api/v1/messages', data=message_info, headers={'Authorization': f'Basic {auth}'}).status_code == 200
+    assert find_key.call_count == 1
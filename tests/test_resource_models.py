@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from main.app import permission_cache
+from main.resources.models import Resource
+from main.users.permissions import ACCESS_TYPE_PUBLIC, ACCESS_TYPE_USER, ACCESS_LEVEL_READ, ACCESS_LEVEL_WRITE
+
+
+@pytest.mark.usefixtures('app')
+class TestResourceAncestry:
+    @pytest.fixture(autouse=True)
+    def setup(self, db_session, folder_resource):
+        # pylint: disable=attribute-defined-outside-init
+        self.db_session = db_session
+        self.folder = folder_resource
+        self.child = self._add('child', folder_resource, Resource.BASIC_FOLDER)
+        self.grandchild = self._add('grandchild', self.child, Resource.BASIC_FOLDER)
+        self.sequence = self._add('sequence', self.grandchild, Resource.SEQUENCE)
+
+    def _add(self, name, parent, resource_type):
+        resource = Resource(name=name, type=resource_type, parent_id=parent.id)
+        self.db_session.add(resource)
+        self.db_session.flush()
+        return resource
+
+    def test_ancestry(self):
+        assert self.sequence.ancestry == '/%d/%d/%d/%d/' % (self.folder.id, self.child.id, self.grandchild.id, self.sequence.id)
+        assert self.sequence.ancestors() == [self.folder, self.child, self.grandchild]
+        assert self.sequence.path() == '/folder/child/grandchild/sequence'
+        assert self.sequence.root() is self.folder
+        assert self.sequence.is_descendent_of(self.child.id)
+        assert not self.child.is_descendent_of(self.sequence.id)
+
+    def test_move_updates_descendants(self):
+        other = self._add('other', self.folder, Resource.BASIC_FOLDER)
+        self.grandchild.parent_id = other.id
+        self.db_session.flush()
+        assert self.grandchild.ancestry == '/%d/%d/%d/' % (self.folder.id, other.id, self.grandchild.id)
+        assert self.sequence.path() == '/folder/other/grandchild/sequence'
+        self.db_session.expire(self.sequence)
+        assert self.sequence.path() == '/folder/other/grandchild/sequence'
+        assert not self.sequence.is_descendent_of(self.child.id)
+
+    def test_descendent_folder_ids(self):
+        deleted = self._add('deleted', self.folder, Resource.BASIC_FOLDER)
+        self._add('inside_deleted', deleted, Resource.BASIC_FOLDER)
+        deleted.deleted = True
+        self.db_session.flush()
+        assert sorted(self.folder.descendent_folder_ids()) == sorted([self.child.id, self.grandchild.id])
+
+    def test_query_permissions(self):
+        self.child.permissions = json.dumps([[ACCESS_TYPE_USER, 1, ACCESS_LEVEL_READ], [ACCESS_TYPE_PUBLIC, self.folder.id, ACCESS_LEVEL_READ]])
+        self.db_session.flush()
+        permissions = sorted(tuple(p) for p in self.sequence.query_permissions())
+        assert permissions == sorted([(ACCESS_TYPE_USER, 1, ACCESS_LEVEL_READ), (ACCESS_TYPE_PUBLIC, self.folder.id, ACCESS_LEVEL_READ)])
+        assert self.folder.query_permissions() == [[ACCESS_TYPE_PUBLIC, self.folder.id, ACCESS_LEVEL_WRITE]]
+
+    def test_permission_cache_invalidation(self):
+        assert self.sequence.query_permissions() == [[ACCESS_TYPE_PUBLIC, self.folder.id, ACCESS_LEVEL_WRITE]]
+        assert permission_cache.get(self.sequence.id) is not None
+
+        # changing an ancestor's permissions invalidates the cached permissions of its descendants
+        self.folder.permissions = json.dumps([[ACCESS_TYPE_PUBLIC, self.folder.id, ACCESS_LEVEL_READ]])
+        self.db_session.flush()
+        assert permission_cache.get(self.sequence.id) is None
+        assert self.sequence.query_permissions() == [[ACCESS_TYPE_PUBLIC, self.folder.id, ACCESS_LEVEL_READ]]
+
+        # moving a resource invalidates the cached permissions of it and its descendants
+        other_folder = Resource(name='other', type=Resource.BASIC_FOLDER)
+        self.db_session.add(other_folder)
+        self.db_session.flush()
+        self.grandchild.parent_id = other_folder.id
+        self.db_session.flush()
+        assert self.sequence.query_permissions() is None
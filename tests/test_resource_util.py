@@ -0,0 +1,93 @@
+import pytest
+
+from main.app import path_cache
+
+from main.resources.models import Resource
+from main.resources.resource_util import find_resource, find_resource_chain
+
+
+@pytest.mark.usefixtures('app')
+class TestFindResource:
+    @pytest.fixture(autouse=True)
+    def setup(self, db_session, folder_resource):
+        # pylint: disable=attribute-defined-outside-init
+        self.db_session = db_session
+        self.folder = folder_resource
+        self.child = self._add('child', folder_resource, Resource.BASIC_FOLDER)
+        self.sequence = self._add('sequence', self.child, Resource.SEQUENCE)
+
+    def _add(self, name, parent, resource_type, deleted=False):
+        resource = Resource(name=name, type=resource_type, parent_id=parent.id, deleted=deleted)
+        self.db_session.add(resource)
+        self.db_session.flush()
+        return resource
+
+    def test_find_resource(self):
+        assert find_resource('/folder') is self.folder
+        assert find_resource('/folder/child/sequence') is self.sequence
+
+    def test_find_missing_resource(self):
+        assert find_resource('/folder/child/missing') is None
+        assert find_resource('/folder/missing/sequence') is None
+
+    def test_find_resource_chain(self):
+        assert find_resource_chain('/folder/child/sequence') == [self.folder, self.child, self.sequence]
+        assert find_resource_chain('/folder/child/missing/other') == [self.folder, self.child]
+        assert find_resource_chain('/missing') == []
+
+    def test_deleted_resources_ignored(self):
+        self.sequence.deleted = True
+        self._add('sequence', self.child, Resource.SEQUENCE, deleted=True)
+        self.db_session.flush()
+        assert find_resource('/folder/child/sequence') is None
+
+    def test_duplicate_resources(self):
+        self._add('child', self.folder, Resource.BASIC_FOLDER)
+        assert find_resource_chain('/folder/child/sequence') is None
+        assert find_resource('/folder/child/sequence') is None
+
+
+@pytest.mark.usefixtures('app', 'api')
+class TestPathCache:
+    @pytest.fixture(autouse=True)
+    def setup(self, db_session, client, folder_resource):
+        # pylint: disable=attribute-defined-outside-init
+        self.db_session = db_session
+        self.client = client
+        self.folder = folder_resource
+        self.sequence = Resource(name='sequence', type=Resource.SEQUENCE, parent_id=folder_resource.id)
+        db_session.add(self.sequence)
+        db_session.flush()
+
+    def test_cache_hit(self):
+        path_cache.hit_count = 0
+        assert find_resource('/folder/sequence') is self.sequence
+        assert find_resource('/folder/sequence') is self.sequence
+        assert path_cache.hit_count == 1
+
+    def test_rename_invalidates_cache(self):
+        assert find_resource('/folder/sequence') is self.sequence
+        assert self.client.put('/api/v1/resources/folder/sequence', data={'name': 'renamed'}).status_code == 200
+        assert path_cache.get('/folder/sequence') is None
+        assert find_resource('/folder/sequence') is None
+        assert find_resource('/folder/renamed') is self.sequence
+
+    def test_move_invalidates_cache(self):
+        other_folder = Resource(name='other', type=Resource.BASIC_FOLDER, parent_id=self.folder.id)
+        self.db_session.add(other_folder)
+        self.db_session.flush()
+        assert find_resource('/folder/sequence') is self.sequence
+        assert self.client.put('/api/v1/resources/folder/sequence', data={'parent': '/folder/other'}).status_code == 200
+        assert find_resource('/folder/sequence') is None
+        assert find_resource('/folder/other/sequence') is self.sequence
+
+    def test_delete_invalidates_cache(self):
+        assert find_resource('/folder/sequence') is self.sequence
+        assert self.client.delete('/api/v1/resources/folder/sequence').status_code == 200
+        assert find_resource('/folder/sequence') is None
+
+    def test_parent_rename_invalidates_cache(self):
+        assert find_resource('/folder/sequence') is self.sequence
+        self.folder.name = 'renamed'
+        self.db_session.flush()
+        assert path_cache.get('/folder/sequence') is None
@@ -0,0 +1,72 @@
+import datetime
+import json
+
+import pytest
+
+from main.app import latest_value_cache
+from main.resources.models import Resource
+from main.resources.resource_util import create_sequence, update_sequence_value
+from main.resources.views import folder_viewer, folder_tree_info
+from main.users.permissions import ACCESS_LEVEL_WRITE
+
+
+@pytest.mark.usefixtures('db_session')
+class TestFolderViewer:
+    @pytest.fixture(autouse=True)
+    def setup(self, app, mocker):
+        # pylint: disable=attribute-defined-outside-init
+        self.app = app
+        self.render_template = mocker.patch('main.resources.views.render_template', return_value='')
+
+    def _folder_resources(self, folder):
+        with self.app.test_request_context('/folder'):
+            folder_viewer(folder, '/folder', ACCESS_LEVEL_WRITE)
+        return {rd['name']: rd for rd in json.loads(self.render_template.call_args.kwargs['resources_json'])}
+
+    def test_last_values(self, db_session, folder_resource):
+        numeric = create_sequence(folder_resource, 'numeric', Resource.NUMERIC_SEQUENCE)
+        text = create_sequence(folder_resource, 'text', Resource.TEXT_SEQUENCE)
+        create_sequence(folder_resource, 'empty', Resource.NUMERIC_SEQUENCE)
+        timestamp = numeric.modification_timestamp + datetime.timedelta(minutes=1)
+        update_sequence_value(numeric, '/folder/numeric', timestamp, '1.5', emit_message=False)
+        update_sequence_value(numeric, '/folder/numeric', timestamp + datetime.timedelta(seconds=10), '2.5', emit_message=False)  # not stored
+        update_sequence_value(text, '/folder/text', timestamp, 'hello', emit_message=False)
+        db_session.commit()
+
+        # the values received by this process (including the one not stored) come from the latest value cache
+        resources = self._folder_resources(folder_resource)
+        assert (resources['numeric']['last_value'], resources['text']['last_value']) == ('2.5', 'hello')
+        assert 'last_value' not in resources['empty']
+
+        # otherwise the last stored values are read from the database
+        latest_value_cache.clear()
+        resources = self._folder_resources(folder_resource)
+        assert (resources['numeric']['last_value'], resources['text']['last_value']) == ('1.5', 'hello')
+        assert 'last_value' not in resources['empty']
+
+
+def test_folder_tree_info(db_session, folder_resource):
+    def add(name, resource_type, parent, deleted=False):
+        resource = Resource(name=name, type=resource_type, parent_id=parent.id, deleted=deleted)
+        db_session.add(resource)
+        db_session.flush()
+        return resource
+
+    first = add('first', Resource.BASIC_FOLDER, folder_resource)
+    add('a.txt', Resource.FILE, first)
+    add('b.txt', Resource.FILE, first, deleted=True)
+    add('deep', Resource.BASIC_FOLDER, first)
+    second = add('second', Resource.BASIC_FOLDER, folder_resource)
+    add('controller', Resource.CONTROLLER_FOLDER, second)
+    deleted = add('deleted', Resource.BASIC_FOLDER, folder_resource, deleted=True)
+    inside_deleted = add('inside', Resource.BASIC_FOLDER, deleted)
+    add('c.txt', Resource.FILE, inside_deleted)
+    add('d.txt', Resource.FILE, folder_resource)
+
+    # each folder is listed after its sub-folders; deleted resources and the contents of deleted folders aren't included
+    assert folder_tree_info(folder_resource) == [
+        {'name': 'folder/first/deep', 'fileCount': 0},
+        {'name': 'folder/first', 'fileCount': 1},
+        {'name': 'folder/second', 'fileCount': 1},
+        {'name': 'folder', 'fileCount': 1},
+    ]
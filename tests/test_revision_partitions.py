@@ -0,0 +1,125 @@
+import datetime
+import json
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from main.resources.models import Resource, ResourceRevision, revision_storage_path
+from main.resources.revision_partitions import partition_start, next_partition_start, partition_name, partitioning_enabled, \
+    partition_revisions, create_revision_partitions, drop_revision_partitions, revision_partitions, kept_revision_starts, \
+    kept_revisions_condition, LEGACY_TABLE_NAME
+
+# partitioning is only supported on PostgreSQL; these tests convert the revisions table and commit their changes (the partition
+# functions use their own connections), so they don't use the db_session fixture
+postgres_only = pytest.mark.skipif(os.environ.get('TEST_DATABASE', 'sqlite') != 'postgres', reason='requires PostgreSQL')
+
+
+def test_partition_ranges():
+    timestamp = datetime.datetime(2020, 12, 31, 15, 30)
+    assert partition_start(timestamp, 'day') == datetime.datetime(2020, 12, 31)
+    assert partition_start(timestamp, 'week') == datetime.datetime(2020, 12, 28)
+    assert partition_start(timestamp, 'month') == datetime.datetime(2020, 12, 1)
+    assert next_partition_start(datetime.datetime(2020, 12, 31), 'day') == datetime.datetime(2021, 1, 1)
+    assert next_partition_start(datetime.datetime(2020, 12, 28), 'week') == datetime.datetime(2021, 1, 4)
+    assert next_partition_start(datetime.datetime(2020, 12, 1), 'month') == datetime.datetime(2021, 1, 1)
+    assert partition_name(datetime.datetime(2021, 1, 4)) == 'resource_revisions_p20210104'
+
+
+def test_partitioning_requires_postgres(app, db_session):
+    app.config['REVISION_PARTITION_INTERVAL'] = 'month'
+    try:
+        assert partitioning_enabled() == (db_session.bind.dialect.name == 'postgresql')
+    finally:
+        app.config['REVISION_PARTITION_INTERVAL'] = None
+
+
+
+def test_kept_revisions(db_session, folder_resource):
+    start = datetime.datetime(2020, 1, 1)  # the range of a monthly partition being dropped
+    end = datetime.datetime(2020, 2, 1)
+    resources = {}
+    for (name, resource_type, system_attributes, days) in (
+        ('file', Resource.FILE, {}, (0, 1)),
+        ('history', Resource.SEQUENCE, {'max_history': 3}, (0, 4, 9, 39)),  # keeps its newest three values
+        ('sparse', Resource.SEQUENCE, {}, (0, 1, 2)),  # keeps only its last value
+        ('raw', Resource.SEQUENCE, {'retention': {'raw': 30}}, (9, 24, 44)),  # keeps raw values after January 21
+        ('unlimited', Resource.SEQUENCE, {'retention': {'minute': 10}}, (0, 1, 49)),  # keeps all raw values
+    ):
+        resource = Resource(name=name, type=resource_type, parent_id=folder_resource.id, system_attributes=json.dumps(system_attributes))
+        db_session.add(resource)
+        db_session.flush()
+        revisions = [ResourceRevision(resource_id=resource.id, timestamp=start + datetime.timedelta(days=day), data=b'1') for day in days]
+        db_session.add_all(revisions)
+        db_session.flush()
+        resource.last_revision_id = revisions[-1].id
+        resources[resource.id] = name
+    db_session.flush()
+
+    keep_from = kept_revision_starts(start, end, now=datetime.datetime(2020, 2, 20))
+    kept = ResourceRevision.query.filter(
+        kept_revisions_condition(ResourceRevision.__table__, keep_from), ResourceRevision.resource_id.in_(resources),
+        ResourceRevision.timestamp >= start, ResourceRevision.timestamp < end)
+    assert sorted((resources[revision.resource_id], (revision.timestamp - start).days) for revision in kept) == [
+        ('file', 0), ('file', 1), ('history', 4), ('history', 9), ('raw', 24), ('sparse', 2), ('unlimited', 0), ('unlimited', 1)]
+
+
+@postgres_only
+def test_revision_partition_lifecycle(app, _db, mocker):
+    storage_manager = mocker.patch('main.resources.revision_partitions.storage_manager')
+    app.config['REVISION_PARTITION_INTERVAL'] = 'day'
+    session = Session(bind=_db.engine, expire_on_commit=False)  # so that reading IDs doesn't hold locks on the revisions table
+    resource_ids = []
+    try:
+        # convert the table; the existing table holds everything before tomorrow, followed by two future partitions
+        today = partition_start(datetime.datetime.utcnow(), 'day')
+        day = datetime.timedelta(days=1)
+        assert partition_revisions()
+        assert not partition_revisions()
+        with _db.engine.connect() as connection:
+            assert revision_partitions(connection) == [
+                (LEGACY_TABLE_NAME, today + day), (partition_name(today + day), today + 2 * day), (partition_name(today + 2 * day), today + 3 * day)]
+
+        # add a numeric sequence, an image sequence (with values in bulk storage), and a file, each with revisions in tomorrow's
+        # partition; the numeric sequence's last revision is beyond the existing partitions (so it is stored in the default partition)
+        folder = Resource(name='partitioned', type=Resource.BASIC_FOLDER)
+        session.add(folder)
+        session.flush()
+        sequence = Resource(name='sequence', type=Resource.SEQUENCE, parent_id=folder.id, organization_id=folder.id, value_count=3)
+        image = Resource(name='image', type=Resource.SEQUENCE, parent_id=folder.id, organization_id=folder.id, value_count=2)
+        file = Resource(name='file', type=Resource.FILE, parent_id=folder.id, organization_id=folder.id)
+        session.add_all([sequence, image, file])
+        session.flush()
+        resource_ids = [folder.id, sequence.id, image.id, file.id]
+        revisions = {}
+        for (resource, names, data) in ((sequence, ('s1', 's2'), b'1'), (image, ('i1', 'i2'), None), (file, ('f1', 'f2'), b'x')):
+            for (hour, name) in enumerate(names):
+                revisions[name] = ResourceRevision(resource_id=resource.id, timestamp=today + day + datetime.timedelta(hours=hour), data=data)
+        revisions['s3'] = ResourceRevision(resource_id=sequence.id, timestamp=today + 10 * day, data=b'3')
+        session.add_all(revisions.values())
+        session.flush()
+        (sequence.last_revision_id, image.last_revision_id, file.last_revision_id) = (revisions['s3'].id, revisions['i2'].id, revisions['f2'].id)
+        session.commit()
+
+        # creating partitions moves revisions from the default partition into them
+        assert partition_name(today + 10 * day) in create_revision_partitions(now=today + 10 * day)
+        with _db.engine.connect() as connection:
+            partition = connection.execute(
+                text('SELECT tableoid::regclass::text FROM resource_revisions WHERE id = :id'), {'id': revisions['s3'].id}).scalar()
+        assert partition == partition_name(today + 10 * day)
+
+        # dropping the old partitions only removes the sequence revisions that aren't the last of their sequences
+        assert drop_revision_partitions(1, now=today + 3 * day) == [LEGACY_TABLE_NAME, partition_name(today + day)]
+        session.expire_all()
+        remaining_ids = {revision_id for (revision_id,) in session.query(ResourceRevision.id).filter(ResourceRevision.resource_id.in_(resource_ids))}
+        assert remaining_ids == {revisions[name].id for name in ('s3', 'i2', 'f1', 'f2')}
+        assert (session.get(Resource, sequence.id).value_count, session.get(Resource, image.id).value_count) == (1, 1)
+        storage_manager.delete.assert_called_once_with(revision_storage_path(folder.id, image.id, revisions['i1'].id))
+    finally:
+        app.config['REVISION_PARTITION_INTERVAL'] = None
+        session.rollback()
+        session.query(ResourceRevision).filter(ResourceRevision.resource_id.in_(resource_ids)).delete(synchronize_session=False)
+        session.query(Resource).filter(Resource.id.in_(resource_ids)).delete(synchronize_session=False)
+        session.commit()
+        session.close()
@@ -0,0 +1,241 @@
+import datetime
+import json
+
+import pytest
+
+from main.resources import resource_util
+from main.resources.models import Resource, ResourceRevision, SequenceRollup
+from main.resources.resource_util import create_sequence, update_sequence_value, ingest_descriptor, read_resource, cached_sequence_value
+from main.resources.sequence_util import downsample, downsample_query, merge_buckets, sequence_rollups, timestamp_seconds, compress_value, \
+    tiered_rollups
+from main.resources.sequence_chunks import encode_chunk, decode_chunk, compact_sequence, sequence_values
+from main.workers.backfill_rollups import backfill_sequence_rollups
+from main.workers.sequence_truncator import truncate_sequences, truncate_sequence, HISTORY_BUFFER
+from main.workers.sequence_retention import apply_retention, check_rollups
+
+
+def test_downsample_max_points():
+    timestamps = [float(t) for t in range(10)]
+    values = [float(v) for v in range(10)]
+    buckets = downsample(timestamps, values, max_points=3)
+    assert [bucket[0] for bucket in buckets] == [0.0, 3.0, 6.0]
+    assert [bucket[1] for bucket in buckets] == [3, 3, 4]
+    assert buckets[2][2:] == (6.0, 9.0, 7.5)
+
+
+def test_downsample_resolution():
+    buckets = downsample([59.0, 61.0, 119.0, 250.0], [1.0, 5.0, 3.0, 2.0], resolution=60)
+    assert buckets == [(0, 1, 1.0, 1.0, 1.0), (60, 2, 3.0, 5.0, 4.0), (240, 1, 2.0, 2.0, 2.0)]
+
+
+def test_downsample_single_point():
+    assert downsample([5.0], [2.0], max_points=10) == [(5.0, 1, 2.0, 2.0, 2.0)]
+    assert downsample([], [], max_points=10) == []
+
+
+def test_rollups_match_backfill(db_session, folder_resource):
+    sequence = create_sequence(folder_resource, 'rollups', Resource.NUMERIC_SEQUENCE)
+    sequence.system_attributes = json.dumps({'data_type': Resource.NUMERIC_SEQUENCE, 'min_storage_interval': 0})
+    start = datetime.datetime(2020, 1, 1, 23, 58, 30)
+    for (index, value) in enumerate([3, 1, 4, 1, 5, 9, 2, 6]):
+        update_sequence_value(sequence, '/folder/rollups', start + datetime.timedelta(seconds=index * 25), str(value), emit_message=False)
+    db_session.flush()
+
+    minute_rollups = sequence_rollups(sequence.id, 60)
+    assert [rollup[1] for rollup in minute_rollups] == [2, 2, 2, 2]
+    assert minute_rollups[1][2:6] == [1.0, 4.0, 5.0, 1.0]
+    day_rollups = sequence_rollups(sequence.id, 86400)
+    assert [rollup[1] for rollup in day_rollups] == [4, 4]
+    assert merge_buckets(minute_rollups, 86400) == day_rollups
+
+    incremental = {resolution: sequence_rollups(sequence.id, resolution) for resolution in SequenceRollup.RESOLUTIONS.values()}
+    backfill_sequence_rollups(sequence.id)
+    assert {resolution: sequence_rollups(sequence.id, resolution) for resolution in SequenceRollup.RESOLUTIONS.values()} == incremental
+
+
+def test_downsample_query_matches_downsample(db_session, folder_resource):
+    sequence = create_sequence(folder_resource, 'downsample', Resource.NUMERIC_SEQUENCE)
+    start = datetime.datetime(2020, 1, 1)
+    timestamps = [start + datetime.timedelta(seconds=seconds) for seconds in [0, 7, 30, 61, 62, 95, 130, 300]]
+    values = [3.0, 1.0, 4.0, 1.0, 5.0, 9.0, 2.0, 6.0]
+    for (timestamp, value) in zip(timestamps, values):
+        db_session.add(ResourceRevision(resource_id=sequence.id, timestamp=timestamp, data=str(value).encode(), value=value))
+    db_session.flush()
+
+    revisions = (
+        ResourceRevision.query
+        .with_entities(ResourceRevision.timestamp, ResourceRevision.value)
+        .filter(ResourceRevision.resource_id == sequence.id)
+    )
+    seconds = [timestamp_seconds(timestamp) for timestamp in timestamps]
+    for (max_points, resolution) in [(3, None), (100, None), (None, 60), (None, 3600)]:
+        expected = downsample(seconds, values, max_points=max_points, resolution=resolution)
+        buckets = downsample_query(revisions, max_points=max_points, resolution=resolution)
+        assert [pytest.approx(bucket) for bucket in buckets] == expected
+
+
+def test_swinging_door_compression():
+    settings = ('swinging_door', 0.5, False)
+    stored = []
+    state = None
+    for (seconds, value) in enumerate([0.0, 1.0, 2.0, 3.0, 4.0, 10.0, 10.0, 10.0]):
+        (replace, state) = compress_value(settings, state, float(seconds), value)
+        if replace:
+            stored[-1] = (seconds, value)
+        else:
+            stored.append((seconds, value))
+    assert stored == [(0, 0.0), (4, 4.0), (5, 10.0), (7, 10.0)]
+
+
+def test_deadband_compression(db_session, folder_resource):
+    sequence = create_sequence(folder_resource, 'deadband', Resource.NUMERIC_SEQUENCE)
+    sequence.system_attributes = json.dumps({
+        'data_type': Resource.NUMERIC_SEQUENCE, 'min_storage_interval': 0, 'compression': 'deadband', 'compression_deviation': 0.5,
+    })
+    start = datetime.datetime(2020, 1, 1)
+    values = [1, 1.2, 0.9, 1.1, 3, 3.2]
+    for (index, value) in enumerate(values):
+        update_sequence_value(sequence, '/folder/deadband', start + datetime.timedelta(seconds=index), str(value), emit_message=False)
+    db_session.flush()
+
+    revisions = ResourceRevision.query.filter(ResourceRevision.resource_id == sequence.id).order_by(ResourceRevision.timestamp)
+    assert [(timestamp_seconds(r.timestamp) - timestamp_seconds(start), r.value) for r in revisions] == [(0, 1), (3, 1.1), (4, 3), (5, 3.2)]
+
+    # the rollups summarize the stored values (as they would if rebuilt from them)
+    rollups = {resolution: sequence_rollups(sequence.id, resolution) for resolution in (60, 86400)}
+    assert [rollup[:4] for rollup in rollups[86400]] == [[1577836800, 4, 1, 3.2]]
+    backfill_sequence_rollups(sequence.id)
+    assert {resolution: sequence_rollups(sequence.id, resolution) for resolution in (60, 86400)} == rollups
+    assert check_rollups(sequence.id, start + datetime.timedelta(days=1), chunked=False) == 0  # retention sees complete rollups
+
+
+def test_compressed_rollup_updates(db_session, folder_resource, mocker):
+    sequence = create_sequence(folder_resource, 'flat', Resource.NUMERIC_SEQUENCE)
+    sequence.system_attributes = json.dumps({
+        'data_type': Resource.NUMERIC_SEQUENCE, 'min_storage_interval': 0, 'compression': 'deadband', 'compression_deviation': 0.5,
+    })
+    start = datetime.datetime(2020, 1, 1)
+    db_session.add_all([  # an hour of earlier values
+        ResourceRevision(resource_id=sequence.id, timestamp=start + datetime.timedelta(seconds=index * 10), data=b'1', value=1)
+        for index in range(360)
+    ])
+    db_session.commit()
+    backfill_sequence_rollups(sequence.id)
+    minute_rollups = SequenceRollup.query.filter(SequenceRollup.resource_id == sequence.id, SequenceRollup.resolution == 60)
+    earlier_ids = {rollup.id for rollup in minute_rollups}
+
+    # after the first two values of a flat signal, each value replaces the previous one; only the minute buckets containing the
+    # replaced and new values and their hour and day buckets are rewritten
+    writes = []
+    update_replaced_rollups = resource_util.update_replaced_rollups
+    mocker.patch.object(resource_util, 'update_replaced_rollups', side_effect=lambda *args: writes.append(update_replaced_rollups(*args)))
+    for (seconds, value) in ((3600, 5), (3630, 5.1), (3670, 5.2), (3680, 5), (3690, 4.9)):
+        update_sequence_value(sequence, '/folder/flat', start + datetime.timedelta(seconds=seconds), str(value), emit_message=False)
+    db_session.flush()
+    assert writes == [4, 3, 3]
+    assert earlier_ids <= {rollup.id for rollup in minute_rollups}
+    rollups = {resolution: sequence_rollups(sequence.id, resolution) for resolution in (60, 3600, 86400)}
+    assert [rollup[:5] for rollup in rollups[3600]] == [[1577836800, 360, 1, 1, 360], [1577840400, 2, 4.9, 5, 9.9]]
+    backfill_sequence_rollups(sequence.id)
+    assert {resolution: sequence_rollups(sequence.id, resolution) for resolution in (60, 3600, 86400)} == rollups
+
+
+def test_chunk_encoding():
+    timestamps = [1577836800000000 + index * 10000000 + (index % 3) * 17 for index in range(100)] + [1577838000000000]
+    values = [20.5 + (index % 7) * 0.25 for index in range(100)] + [-1e300]
+    data = encode_chunk(timestamps, values)
+    assert decode_chunk(data, len(timestamps)) == (timestamps, values)
+    assert len(data) < len(timestamps) * 4
+
+
+def test_truncate_sequences(db_session, folder_resource):
+    sequence = create_sequence(folder_resource, 'truncated', Resource.NUMERIC_SEQUENCE, max_history=10)
+    deleted_sequence = create_sequence(folder_resource, 'deleted', Resource.NUMERIC_SEQUENCE, max_history=10)
+    deleted_sequence.deleted = True
+    start = datetime.datetime(2020, 1, 1)
+    for resource in (sequence, deleted_sequence):
+        db_session.add_all([
+            ResourceRevision(resource_id=resource.id, timestamp=start + datetime.timedelta(seconds=index), data=str(index).encode(), value=index)
+            for index in range(HISTORY_BUFFER + 20)
+        ])
+        resource.value_count = None  # values added directly; the truncator counts them
+    db_session.commit()
+
+    stats = truncate_sequences(batch_size=100)
+    assert stats['delete_count'] == HISTORY_BUFFER + 10
+    assert Resource.query.filter(Resource.id == sequence.id).one().value_count == 10
+    revisions = ResourceRevision.query.filter(ResourceRevision.resource_id == sequence.id).order_by(ResourceRevision.timestamp)
+    assert [revision.value for revision in revisions] == list(range(HISTORY_BUFFER + 10, HISTORY_BUFFER + 20))
+    assert ResourceRevision.query.filter(ResourceRevision.resource_id == deleted_sequence.id).count() == HISTORY_BUFFER + 20
+    assert truncate_sequences()['delete_count'] == 0
+
+
+def test_truncate_chunked_sequence(db_session, folder_resource):
+    sequence = create_sequence(folder_resource, 'truncated', Resource.NUMERIC_SEQUENCE, max_history=15)
+    sequence.system_attributes = json.dumps({'data_type': Resource.NUMERIC_SEQUENCE, 'max_history': 15, 'storage': 'chunked'})
+    start = datetime.datetime(2020, 1, 1)
+    db_session.add_all([
+        ResourceRevision(resource_id=sequence.id, timestamp=start + datetime.timedelta(minutes=index * 6), data=str(index).encode(), value=index)
+        for index in range(30)
+    ])
+    sequence.value_count = 30
+    db_session.commit()
+    assert compact_sequence(sequence, 3600) == 30  # one chunk per hour
+
+    # only whole chunks before the cutoff are deleted (one chunk per batch)
+    assert truncate_sequence(sequence.id, 15, chunked=True, batch_size=1) == 10
+    assert [value for (_, value, _) in sequence_values(sequence.id)] == list(range(10, 30))
+    assert Resource.query.filter(Resource.id == sequence.id).one().value_count == 20
+
+
+def test_tiered_retention(db_session, folder_resource):
+    sequence = create_sequence(folder_resource, 'tiered', Resource.NUMERIC_SEQUENCE)
+    retention = {'raw': 5, 'minute': 10}
+    sequence.system_attributes = json.dumps({'data_type': Resource.NUMERIC_SEQUENCE, 'min_storage_interval': 0, 'retention': retention})
+    for (day, hour, value) in ((1, 0, 1), (1, 0, 2), (1, 5, 3), (12, 0, 4), (12, 1, 5), (18, 0, 6)):
+        update_sequence_value(sequence, '/folder/tiered', datetime.datetime(2020, 1, day, hour, value), str(value), emit_message=False)
+    db_session.add(ResourceRevision(resource_id=sequence.id, timestamp=datetime.datetime(2020, 1, 2), data=b'7', value=7))  # no rollups
+    db_session.commit()
+
+    now = datetime.datetime(2020, 1, 20, 12)
+    stats = apply_retention(now=now)
+    assert (stats['rebuilt_days'], stats['value_count']) == (1, 6)
+    assert [revision.value for revision in ResourceRevision.query.filter(ResourceRevision.resource_id == sequence.id)] == [6]
+    assert sum(rollup[1] for rollup in sequence_rollups(sequence.id, 60)) == 3  # minute rollups are kept for 10 days
+    assert sum(rollup[1] for rollup in sequence_rollups(sequence.id, 3600)) == 7
+    buckets = tiered_rollups(sequence.id, retention, 60, now=now)
+    assert [bucket[1] for bucket in buckets] == [2, 1, 1, 1, 1, 1]
+    assert apply_retention(now=now)['rebuilt_days'] == 0
+
+
+def test_ingest_descriptor(db_session, folder_resource):
+    sequence = create_sequence(folder_resource, 'descriptor', Resource.NUMERIC_SEQUENCE, units='degrees C')
+    descriptor = ingest_descriptor(sequence)
+    assert (descriptor.units, descriptor.min_storage_interval.total_seconds(), descriptor.compression) == ('degrees C', 50, None)
+    assert ingest_descriptor(sequence) is descriptor
+
+    # changing the system attributes (even before they are saved) compiles a new descriptor
+    sequence.system_attributes = json.dumps({'data_type': Resource.NUMERIC_SEQUENCE, 'min_storage_interval': 0, 'compression': 'deadband'})
+    descriptor = ingest_descriptor(sequence)
+    assert (descriptor.min_storage_interval.total_seconds(), descriptor.compression) == (0, ('deadband', 0, False))
+    db_session.commit()  # saving the change also invalidates the cached descriptor
+    assert ingest_descriptor(sequence) is not descriptor
+
+
+def test_latest_value_cache(db_session, folder_resource):
+    sequence = create_sequence(folder_resource, 'latest', Resource.NUMERIC_SEQUENCE)
+    start = sequence.modification_timestamp + datetime.timedelta(minutes=1)
+    update_sequence_value(sequence, '/folder/latest', start, '1.5', emit_message=False)
+    db_session.commit()
+    assert cached_sequence_value(sequence) == '1.5'
+
+    # a value received before min_storage_interval has passed isn't stored, but is still the current value
+    update_sequence_value(sequence, '/folder/latest', start + datetime.timedelta(seconds=10), '2.5', emit_message=False)
+    db_session.commit()
+    assert read_resource(sequence) == b'1.5'
+    assert cached_sequence_value(sequence) == '2.5'
+
+    # a newer value stored by another process isn't in this process's cache, so the cached value isn't used
+    sequence.modification_timestamp = start + datetime.timedelta(minutes=1)
+    db_session.commit()
+    assert cached_sequence_value(sequence) is None
@@ -0,0 +1,23 @@
+import pytest
+
+from main.users.models import OrganizationUser
+from main.users.views import organization_names
+
+
+@pytest.mark.usefixtures('db_session')
+class TestOrganizationNames:
+    def test_cache_invalidated_on_changes(self, db_session, user_resource, organization_resource, folder_resource):
+        organization_resource.system_attributes = '{"full_name": "Organization"}'
+        folder_resource.system_attributes = '{"full_name": "Folder"}'
+        db_session.flush()
+        db_session.add(OrganizationUser(organization_id=organization_resource.id, user_id=user_resource.id))
+        db_session.flush()
+        assert [n['folder_name'] for n in organization_names(user_resource.id)] == ['organization']
+
+        organization_resource.name = 'renamed'
+        db_session.flush()
+        assert [n['folder_name'] for n in organization_names(user_resource.id)] == ['renamed']
+
+        db_session.add(OrganizationUser(organization_id=folder_resource.id, user_id=user_resource.id))
+        db_session.flush()
+        assert [n['folder_name'] for n in organization_names(user_resource.id)] == ['renamed', 'folder']